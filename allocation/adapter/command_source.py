@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from typing import IO, Any, Hashable, Mapping, Optional, Sequence
+
+from allocation import port
+from allocation.domain.messages.base import Command
+from allocation.port.command_source import Delivery
+from loguru import logger
+
+from .outbox import converter
+
+
+def encode(command: Command) -> str:
+    return json.dumps(
+        {"type": type(command).__name__, "payload": converter.unstructure(command)},
+        separators=(",", ":"),
+    )
+
+
+@dataclass
+class InMemoryCommandSource(port.command_source.CommandSource):
+
+    partitions: dict[Hashable, list[Delivery]] = field(default_factory=dict)
+    committed: dict[Hashable, int] = field(default_factory=dict)
+    parked: list[Delivery] = field(default_factory=list)
+    _positions: dict[Hashable, int] = field(default_factory=dict)
+    _arrived: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def put(self, command: Command, partition: Hashable = 0) -> None:
+        deliveries = self.partitions.setdefault(partition, [])
+        deliveries.append(
+            Delivery(
+                partition=partition,
+                offset=len(deliveries),
+                type=type(command).__name__,
+                payload=converter.dumps(command),  # type: ignore
+            )
+        )
+        self._arrived.set()
+
+    async def start(self) -> None:
+        self._positions = dict(self.committed)
+
+    async def fetch(self, max_records: int, timeout: float) -> Sequence[Delivery]:
+        if not (fetched := self._take(max_records)):
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            fetched = self._take(max_records)
+        return fetched
+
+    def _take(self, max_records: int) -> list[Delivery]:
+        fetched: list[Delivery] = []
+        for partition, deliveries in self.partitions.items():
+            position = self._positions.get(partition, 0)
+            taken = deliveries[position : position + max_records - len(fetched)]
+            self._positions[partition] = position + len(taken)
+            fetched.extend(taken)
+        return fetched
+
+    async def commit(self, offsets: Mapping[Hashable, int]) -> None:
+        self.committed.update(offsets)
+
+    async def park(self, delivery: Delivery, _error: BaseException) -> None:
+        self.parked.append(delivery)
+
+    async def stop(self) -> None:
+        ...
+
+
+class FileCommandSource(port.command_source.CommandSource):
+    # Reads commands from a file of JSON lines as it is appended to, in the
+    # format written by encode(). The file is a single partition whose offsets
+    # are line numbers, committed to a file next to it. Parked commands are
+    # appended to another, in the same format with the error.
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        offset_path: Optional[str | os.PathLike[str]] = None,
+        parked_path: Optional[str | os.PathLike[str]] = None,
+    ):
+        self.path = path
+        self.offset_path = offset_path or f"{path}.offset"
+        self.parked_path = parked_path or f"{path}.parked"
+        self._file: Optional[IO[str]] = None
+        self._offset = 0
+
+    async def start(self) -> None:
+        self._file = open(self.path, encoding="utf-8")
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path, encoding="utf-8") as file:
+                committed = int(file.read() or 0)
+            while self._offset < committed and self._file.readline():
+                self._offset += 1
+
+    async def fetch(self, max_records: int, timeout: float) -> Sequence[Delivery]:
+        if fetched := await asyncio.to_thread(self._read, max_records):
+            return fetched
+        await asyncio.sleep(timeout)
+        return await asyncio.to_thread(self._read, max_records)
+
+    def _read(self, max_records: int) -> list[Delivery]:
+        assert self._file is not None
+        fetched: list[Delivery] = []
+        while len(fetched) < max_records:
+            position = self._file.tell()
+            line = self._file.readline()
+            if not line.endswith("\n"):
+                # Nothing more, or a line still being written.
+                self._file.seek(position)
+                break
+            if line.strip():
+                try:
+                    raw = json.loads(line)
+                except ValueError:
+                    raw = {"type": "", "payload": line}
+                fetched.append(
+                    Delivery(
+                        partition=self.path,
+                        offset=self._offset,
+                        type=raw["type"],
+                        payload=json.dumps(raw["payload"]),
+                    )
+                )
+            self._offset += 1
+        return fetched
+
+    async def commit(self, offsets: Mapping[Hashable, int]) -> None:
+        if (offset := offsets.get(self.path)) is None:
+            return
+        temporary = f"{self.offset_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(str(offset))
+        os.replace(temporary, self.offset_path)
+
+    async def park(self, delivery: Delivery, error: BaseException) -> None:
+        line = json.dumps(
+            {
+                "type": delivery.type,
+                "payload": json.loads(delivery.payload),
+                "error": repr(error),
+            },
+            separators=(",", ":"),
+        )
+        with open(self.parked_path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    async def stop(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+class KafkaCommandSource(port.command_source.CommandSource):
+    # Command records carry their type in the "type" header and the payload as
+    # their value, like the events the outbox connector publishes. Parked
+    # records are produced to the ".parked" topic with the error in a header.
+
+    def __init__(self, bootstrap_servers: str, topic: str, group_id: str):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.group_id = group_id
+        self._consumer: Any = None
+        self._producer: Any = None
+
+    async def start(self) -> None:
+        from aiokafka import AIOKafkaConsumer, AIOKafkaProducer  # type: ignore
+
+        self._consumer = AIOKafkaConsumer(
+            self.topic,
+            bootstrap_servers=self.bootstrap_servers,
+            group_id=self.group_id,
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+        )
+        self._producer = AIOKafkaProducer(
+            bootstrap_servers=self.bootstrap_servers, acks="all"
+        )
+        await self._consumer.start()
+        await self._producer.start()
+
+    async def fetch(self, max_records: int, timeout: float) -> Sequence[Delivery]:
+        batches = await self._consumer.getmany(
+            timeout_ms=int(timeout * 1000), max_records=max_records
+        )
+        return [
+            Delivery(
+                partition=partition,
+                offset=record.offset,
+                type=dict(record.headers or ()).get("type", b"").decode(),
+                payload=record.value,
+            )
+            for partition, records in batches.items()
+            for record in records
+        ]
+
+    async def commit(self, offsets: Mapping[Hashable, int]) -> None:
+        from aiokafka.errors import CommitFailedError  # type: ignore
+
+        # Partitions revoked by a rebalance since they were fetched from are
+        # consumed from their last commit by the consumer they were assigned to.
+        assigned = self._consumer.assignment()
+        offsets = {
+            partition: offset
+            for partition, offset in offsets.items()
+            if partition in assigned
+        }
+        if not offsets:
+            return
+        try:
+            await self._consumer.commit(offsets)
+        except CommitFailedError as e:
+            logger.warning(f"[Commit failed by a rebalance] {e}")
+
+    async def park(self, delivery: Delivery, error: BaseException) -> None:
+        payload = delivery.payload
+        await self._producer.send_and_wait(
+            f"{self.topic}.parked",
+            value=payload.encode() if isinstance(payload, str) else payload,
+            headers=[("type", delivery.type.encode()), ("error", repr(error).encode())],
+        )
+
+    async def stop(self) -> None:
+        if self._producer is not None:
+            await self._producer.stop()
+        if self._consumer is not None:
+            await self._consumer.stop()
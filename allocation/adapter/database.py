@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import math
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import QueuePool
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+    "cache_size": -64000,
+}
+
+
+def row_hash(value: Optional[str]) -> Optional[int]:
+    # 32 bits of md5, what Postgres computes for ROW_HASH_SQL.
+    if value is None:
+        return None
+    return int(hashlib.md5(value.encode()).hexdigest()[:8], 16)
+
+
+ROW_HASH_SQL = {
+    "postgresql": "('x' || substr(md5({}), 1, 8))::bit(32)::bigint",
+    "sqlite": "row_hash({})",
+}
+
+
+def is_stale_statement(exc: BaseException) -> bool:
+    # asyncpg fails statements prepared against a table that has since been
+    # replaced, as a view swapped in by a rebuild, and the transaction with
+    # them. SQLAlchemy drops its caches, a new transaction prepares them again.
+    if not isinstance(exc, DBAPIError):
+        return False
+    kind = type(exc.orig).__name__
+    return kind == "InvalidCachedStatementError" or (
+        kind == "InternalServerError" and "cache lookup failed" in str(exc.orig)
+    )
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+@dataclass(frozen=True)
+class EngineOptions:
+    isolation_level: Optional[str] = None
+    pool_size: Optional[int] = None
+    max_overflow: Optional[int] = None
+    pool_recycle: Optional[int] = None
+    pool_timeout: Optional[float] = None
+    pool_pre_ping: bool = False
+    # Compiled SQL per engine, SQLAlchemy's default is 500 statements.
+    query_cache_size: Optional[int] = None
+    # Prepared statements per asyncpg connection, kept by SQLAlchemy's adapter
+    # and by asyncpg itself. Both must be 0 behind pgbouncer in transaction mode.
+    prepared_statement_cache_size: Optional[int] = None
+    statement_cache_size: Optional[int] = None
+
+    def engine_kwargs(self, url: str) -> dict[str, Any]:
+        kwargs: dict[str, Any] = {
+            name: value
+            for name, value in (
+                ("pool_size", self.pool_size),
+                ("max_overflow", self.max_overflow),
+                ("pool_recycle", self.pool_recycle),
+                ("pool_timeout", self.pool_timeout),
+                ("query_cache_size", self.query_cache_size),
+            )
+            if value is not None
+        }
+        if self.pool_pre_ping:
+            kwargs["pool_pre_ping"] = True
+        if make_url(url).get_driver_name() == "asyncpg":
+            connect_args = {
+                name: value
+                for name, value in (
+                    (
+                        "prepared_statement_cache_size",
+                        self.prepared_statement_cache_size,
+                    ),
+                    ("statement_cache_size", self.statement_cache_size),
+                )
+                if value is not None
+            }
+            if connect_args:
+                kwargs["connect_args"] = connect_args
+        return kwargs
+
+
+def create_engine(
+    url: str,
+    options: EngineOptions = EngineOptions(),
+    *,
+    read_only: bool = False,
+    **kwargs: Any,
+) -> AsyncEngine:
+    kwargs = options.engine_kwargs(url) | kwargs
+    if not is_sqlite(url):
+        isolation_level = options.isolation_level or (
+            "READ COMMITTED" if read_only else "REPEATABLE READ"
+        )
+        return create_async_engine(
+            url, future=True, isolation_level=isolation_level, **kwargs
+        )
+    # SQLite transactions are serializable already. pysqlite's own transaction
+    # handling is turned off so that the write lock is taken when the session
+    # starts: a deferred transaction that read first cannot wait for the lock
+    # later and fails with "database is locked" whenever another one committed.
+    # Readers never need the lock, WAL gives them a snapshot.
+    engine = create_async_engine(url, future=True, **kwargs)
+    begin_statement = "BEGIN" if read_only else "BEGIN IMMEDIATE"
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection: Any, _connection_record: Any):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+        dbapi_connection.create_function("row_hash", 1, row_hash)
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def begin(connection: Any):
+        connection.exec_driver_sql(begin_statement)
+
+    return engine
+
+
+async def warm_up(engine: AsyncEngine, connections: int) -> None:
+    # Checks the connections out at once so that the pool keeps them all,
+    # instead of the first requests paying for connecting and authenticating.
+    # Nothing is executed, on SQLite that would begin a write transaction each.
+    # A queue pool closes overflow connections as they are returned, and waits
+    # for one once its overflow is used up, so no more are opened than it keeps.
+    if isinstance(pool := engine.sync_engine.pool, QueuePool):
+        connections = min(connections, pool.size())
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(
+            *(stack.enter_async_context(engine.connect()) for _ in range(connections))
+        )
+
+
+@asynccontextmanager
+async def listening(
+    engine: AsyncEngine, channel: str, callback: Callable[[], None]
+) -> AsyncIterator[None]:
+    # Calls back on every notification on the channel, over a connection kept
+    # out of the pool for as long as the context lasts. Postgres only.
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver_connection = raw.connection.driver_connection  # type: ignore
+
+        def listener(*_: Any) -> None:
+            callback()
+
+        await driver_connection.add_listener(channel, listener)
+        try:
+            yield
+        finally:
+            await driver_connection.remove_listener(channel, listener)
+
+
+async def postgres_replica_lag(engine: AsyncEngine) -> float:
+    # A replica that replayed everything it received is current however old
+    # its last transaction is. On a primary both sides are NULL, lag is 0.
+    async with engine.connect() as conn:
+        lag = await conn.scalar(
+            text(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()"
+                " THEN 0"
+                " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                " END"
+            )
+        )
+    return float(lag or 0.0)
+
+
+@dataclass
+class ReplicaRouter:
+    # Hands out read sessions on the replica, or on the primary while the
+    # replica lags more than max_lag behind. Lag is measured at most once per
+    # check_interval, a failed measurement counts as infinitely behind.
+
+    replica: AsyncEngine
+    primary: Optional[AsyncEngine] = None
+    max_lag: Optional[float] = None
+    check_interval: float = 1.0
+    measure_lag: Callable[[AsyncEngine], Awaitable[float]] = postgres_replica_lag
+    lag: float = field(default=0.0, init=False)
+    _checked_at: float = field(default=-math.inf, init=False)
+    _checking: Optional[asyncio.Task[None]] = field(default=None, init=False)
+
+    async def engine(self) -> AsyncEngine:
+        if self.primary is None or self.max_lag is None:
+            return self.replica
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            if self._checking is None:
+                self._checking = asyncio.create_task(self._check())
+            await asyncio.shield(self._checking)
+        return self.replica if self.lag <= self.max_lag else self.primary
+
+    async def _check(self) -> None:
+        try:
+            self.lag = await self.measure_lag(self.replica)
+        except Exception as e:
+            logger.warning(f"[Replica lag check failed] {e}")
+            self.lag = math.inf
+        finally:
+            self._checked_at = time.monotonic()
+            self._checking = None
+
+    async def session(self) -> AsyncSession:
+        return AsyncSession(bind=await self.engine())
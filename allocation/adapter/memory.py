@@ -0,0 +1,301 @@
+from dataclasses import dataclass, field
+from types import TracebackType
+from datetime import date
+from typing import Callable, ClassVar, Hashable, Iterable, Optional
+from uuid import UUID
+
+from allocation import port
+from allocation.domain.messages.events import Event
+from allocation.domain.models import Batch, Product
+from allocation.service.message_bus import get_issued_messages
+from typing_extensions import Self
+
+
+class VersionConflict(Exception):
+    ...
+
+
+@dataclass
+class StockEntry:
+
+    sku: str
+    eta: Optional[date] = None
+    purchased_quantity: int = 0
+    allocated_quantity: int = 0
+
+
+@dataclass
+class InMemoryStore:
+
+    products: dict[str, Product] = field(default_factory=dict)
+    revisions: dict[str, int] = field(default_factory=dict)
+    skus_by_batchref: dict[str, str] = field(default_factory=dict)
+    events: dict[UUID, Event] = field(default_factory=dict)
+    # Batch references by order, then by sku and quantity.
+    allocations_view: dict[str, dict[tuple[str, int], str]] = field(
+        default_factory=dict
+    )
+    # The same lines, as order id, sku and quantity, by batch reference.
+    allocations_by_batchref: dict[str, set[tuple[str, str, int]]] = field(
+        default_factory=dict
+    )
+    stock_view: dict[str, StockEntry] = field(default_factory=dict)
+    # Nothing relays the events put in memory, only the latest are kept.
+    max_events: int = 10_000
+
+    def drain_events(self) -> list[Event]:
+        # Taken out in the order they were put, as a relay publishes them.
+        drained = list(self.events.values())
+        self.events.clear()
+        return drained
+
+
+def clone(product: Product) -> Product:
+    # Order lines are immutable value objects, so batches only copy the set.
+    return Product(
+        sku=product.sku,
+        version_number=product.version_number,
+        batches=[
+            Batch(
+                reference=batch.reference,
+                sku=batch.sku,
+                eta=batch.eta,
+                purchased_quantity=batch.purchased_quantity,
+                _allocations=set(batch._allocations),
+            )
+            for batch in product.batches
+        ],
+    )
+
+
+def snapshot(product: Product) -> Hashable:
+    return (
+        product.version_number,
+        tuple(
+            (
+                batch.reference,
+                batch.eta,
+                batch.purchased_quantity,
+                frozenset(batch._allocations),
+            )
+            for batch in product.batches
+        ),
+    )
+
+
+@dataclass
+class InMemoryProductRepository(port.repository.ProductRepository):
+
+    _store: InMemoryStore
+    seen: dict[str, Product] = field(default_factory=dict)
+    loaded_revisions: dict[str, Optional[int]] = field(default_factory=dict)
+    loaded_snapshots: dict[str, Hashable] = field(default_factory=dict)
+    deleted: set[str] = field(default_factory=set)
+
+    async def add(self, product: Product) -> None:
+        self.seen[product.sku] = product
+        self.loaded_revisions.setdefault(product.sku, None)
+        self.loaded_snapshots.pop(product.sku, None)
+        self.deleted.discard(product.sku)
+
+    async def get(self, sku: str) -> Optional[Product]:
+        if sku in self.deleted:
+            return None
+        if (product := self.seen.get(sku)) is not None:
+            return product
+        if (stored := self._store.products.get(sku)) is None:
+            return None
+        product = clone(stored)
+        self.seen[sku] = product
+        self.loaded_revisions[sku] = self._store.revisions[sku]
+        self.loaded_snapshots[sku] = snapshot(product)
+        return product
+
+    async def get_by_batchref(self, batchref: str) -> Optional[Product]:
+        for product in self.seen.values():
+            if any(batch.reference == batchref for batch in product.batches):
+                return await self.get(product.sku)
+        if (sku := self._store.skus_by_batchref.get(batchref)) is None:
+            return None
+        return await self.get(sku)
+
+    async def get_many(self, skus: Iterable[str]) -> list[Product]:
+        products = [await self.get(sku) for sku in dict.fromkeys(skus)]
+        return [product for product in products if product is not None]
+
+    async def get_many_by_batchrefs(self, batchrefs: Iterable[str]) -> list[Product]:
+        products = [await self.get_by_batchref(ref) for ref in batchrefs]
+        return list(
+            {
+                product.sku: product for product in products if product is not None
+            }.values()
+        )
+
+    async def delete(self, product: Product) -> None:
+        self.deleted.add(product.sku)
+
+    def changed(self) -> list[str]:
+        # Products that were only read are neither written back nor checked,
+        # like rows a SQL unit of work never flushes.
+        return [
+            sku
+            for sku, product in self.seen.items()
+            if sku not in self.deleted
+            and self.loaded_snapshots.get(sku) != snapshot(product)
+        ]
+
+
+@dataclass
+class InMemoryOutbox(port.outbox.Outbox[Event]):
+
+    _store: InMemoryStore
+    staged: dict[UUID, Event] = field(default_factory=dict)
+    removed: set[UUID] = field(default_factory=set)
+
+    async def all(self) -> Iterable[Event]:
+        return [
+            event
+            for uid, event in {**self._store.events, **self.staged}.items()
+            if uid not in self.removed
+        ]
+
+    async def put(self, event: Event) -> None:
+        self.staged[event.uid] = event
+        self.removed.discard(event.uid)
+
+    async def delete(self, event: Event) -> None:
+        self.removed.add(event.uid)
+
+
+@dataclass
+class InMemoryAllocationsView(port.read_model.AllocationsView):
+
+    _store: InMemoryStore
+    added: list[tuple[str, str, int, str]] = field(default_factory=list)
+    removed: list[tuple[str, str, int]] = field(default_factory=list)
+
+    async def add(self, order_id: str, sku: str, qty: int, batchref: str) -> None:
+        self.added.append((order_id, sku, qty, batchref))
+
+    async def remove_many(self, lines: Iterable[tuple[str, str, int]]) -> None:
+        self.removed.extend(lines)
+
+
+@dataclass
+class InMemoryStockView(port.read_model.StockView):
+
+    _store: InMemoryStore
+    changes: list[Callable[[InMemoryStore], None]] = field(default_factory=list)
+
+    async def add_batch(
+        self, sku: str, batchref: str, eta: Optional[date], qty: int
+    ) -> None:
+        def change(store: InMemoryStore):
+            entry = store.stock_view.setdefault(batchref, StockEntry(sku))
+            entry.eta, entry.purchased_quantity = eta, qty
+
+        self.changes.append(change)
+
+    async def change_batch_quantity(self, sku: str, batchref: str, qty: int) -> None:
+        def change(store: InMemoryStore):
+            store.stock_view.setdefault(
+                batchref, StockEntry(sku)
+            ).purchased_quantity = qty
+
+        self.changes.append(change)
+
+    async def recount_allocated(self, sku: str, batchref: str) -> None:
+        def change(store: InMemoryStore):
+            lines = store.allocations_by_batchref.get(batchref, ())
+            store.stock_view.setdefault(
+                batchref, StockEntry(sku)
+            ).allocated_quantity = sum(qty for _, _, qty in lines)
+
+        self.changes.append(change)
+
+
+@dataclass
+class InMemoryUnitOfWork(port.unit_of_work.UnitOfWork):
+    # Work happens on private copies of the stored aggregates and is written
+    # back on commit, after checking that no other unit of work committed the
+    # same products in the meantime. Units of work of a class made by
+    # with_store() share its store, a bus is bootstrapped with a class each.
+
+    STORE: ClassVar[InMemoryStore]
+
+    products: InMemoryProductRepository = field(init=False)
+    allocations_view: InMemoryAllocationsView = field(init=False)
+    stock_view: InMemoryStockView = field(init=False)
+    _outbox: InMemoryOutbox = field(init=False)
+
+    @classmethod
+    def with_store(cls, store: Optional[InMemoryStore] = None) -> type[Self]:
+        return type(cls.__name__, (cls,), {"STORE": store or InMemoryStore()})
+
+    async def __aenter__(self) -> Self:
+        self.products = InMemoryProductRepository(self.STORE)
+        self.allocations_view = InMemoryAllocationsView(self.STORE)
+        self.stock_view = InMemoryStockView(self.STORE)
+        self._outbox = InMemoryOutbox(self.STORE)
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.rollback()
+
+    async def commit(self) -> None:
+        for msg in get_issued_messages():
+            if isinstance(msg, Event):
+                await self._outbox.put(msg)
+        store, repository = self.STORE, self.products
+        changed = repository.changed()
+        for sku in [*changed, *repository.deleted]:
+            if store.revisions.get(sku) != repository.loaded_revisions.get(sku):
+                raise VersionConflict(f"Product {sku} was changed concurrently")
+        for sku in repository.deleted:
+            if (product := store.products.pop(sku, None)) is not None:
+                for batch in product.batches:
+                    store.skus_by_batchref.pop(batch.reference, None)
+        for sku in changed:
+            product = repository.seen[sku]
+            store.products[sku] = clone(product)
+            store.revisions[sku] = store.revisions.get(sku, 0) + 1
+            for batch in product.batches:
+                store.skus_by_batchref[batch.reference] = sku
+        store.events.update(self._outbox.staged)
+        for uid in self._outbox.removed:
+            store.events.pop(uid, None)
+        while len(store.events) > store.max_events:
+            del store.events[next(iter(store.events))]
+        for order_id, sku, qty, batchref in self.allocations_view.added:
+            lines = store.allocations_view.setdefault(order_id, {})
+            if (previous := lines.get((sku, qty))) is not None:
+                store.allocations_by_batchref[previous].discard((order_id, sku, qty))
+            lines[sku, qty] = batchref
+            store.allocations_by_batchref.setdefault(batchref, set()).add(
+                (order_id, sku, qty)
+            )
+        for order_id, sku, qty in self.allocations_view.removed:
+            batchref = store.allocations_view.get(order_id, {}).pop((sku, qty), None)
+            if batchref is not None:
+                store.allocations_by_batchref[batchref].discard((order_id, sku, qty))
+        for change in self.stock_view.changes:
+            change(store)
+        await self.rollback()
+
+    async def rollback(self) -> None:
+        self._outbox.staged.clear()
+        self._outbox.removed.clear()
+        self.allocations_view.added.clear()
+        self.allocations_view.removed.clear()
+        self.stock_view.changes.clear()
+        self.products.deleted.clear()
+        # Products are loaded again from the store, as a SQL session expires
+        # its instances.
+        self.products.seen.clear()
+        self.products.loaded_revisions.clear()
+        self.products.loaded_snapshots.clear()
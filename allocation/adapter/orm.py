@@ -1,24 +1,68 @@
-from typing import Any
+import uuid
+from typing import Any, Optional
 from allocation.domain.models import Batch, OrderLine, Product
-from allocation.domain.models.bases import ValueObject
-from sqlalchemy import Column, Date, ForeignKey, Integer, String, Table
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import (
+    CHAR,
+    JSON,
+    BigInteger,
+    Column,
+    Date,
+    ForeignKey,
+    Identity,
+    Index,
+    Integer,
+    String,
+    Table,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Dialect
 from sqlalchemy.orm import registry, relationship
+from sqlalchemy.types import TypeDecorator, TypeEngine
 
-from dataclasses import FrozenInstanceError
 from .outbox import Envelope
 
+
+class UUID(TypeDecorator[uuid.UUID]):
+    # Native UUID on Postgres, 32 character hex string elsewhere.
+
+    impl = CHAR(32)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine[Any]:
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        return dialect.type_descriptor(CHAR(32))
+
+    def process_bind_param(
+        self, value: Optional[uuid.UUID], dialect: Dialect
+    ) -> Optional[uuid.UUID | str]:
+        if value is None or dialect.name == "postgresql":
+            return value
+        return value.hex
+
+    def process_result_value(
+        self, value: Optional[uuid.UUID | str], dialect: Dialect
+    ) -> Optional[uuid.UUID]:
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(value)
+
+
+JSONB = JSON().with_variant(postgresql.JSONB(), "postgresql")
+
 mapper_registry = registry()
 
 
 event_outbox_table = Table(
     "events",
     mapper_registry.metadata,
-    Column("id", UUID(as_uuid=True), primary_key=True),
+    Column("id", UUID(), primary_key=True),
     Column("type", String(255), nullable=False),
     Column("payload", JSONB, nullable=False),
     Column("aggregate_id", String(255), nullable=False),
     Column("aggregate_type", String(255), nullable=False),
+    # The order events were put in, which relays publish them in.
+    Column("position", BigInteger, Identity(), nullable=False, index=True),
 )
 
 
@@ -63,23 +107,25 @@ allocations_view = Table(
     Column("id", Integer, primary_key=True, autoincrement=True),
     Column("order_id", String(255)),
     Column("sku", String(255)),
-    Column("batchref", String(255)),
+    Column("qty", Integer),
+    # Stock is counted from the lines allocated from a batch.
+    Column("batchref", String(255), index=True),
+    # An order line is its order, sku and quantity, and is allocated once, so
+    # that projecting an allocation again, as after a rebuild, upserts the
+    # same row. The index also serves the pages of an order.
+    Index("ix_allocations_view_order_line", "order_id", "sku", "qty", unique=True),
 )
 
-
-def detour_value_object_frozen_setattr(value_object_type: type[ValueObject]):
-    origin_setattr = value_object_type.__setattr__
-
-    def new_setattr(self: Any, name: str, value: Any):
-        try:
-            origin_setattr(self, name, value)
-        except FrozenInstanceError as e:
-            if e.name == "_sa_instance_state":
-                object.__setattr__(self, name, value)
-            else:
-                raise e
-
-    value_object_type.__setattr__ = new_setattr
+stock_view = Table(
+    "stock_view",
+    mapper_registry.metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("sku", String(255), nullable=False, index=True),
+    Column("batchref", String(255), nullable=False, unique=True),
+    Column("eta", Date, nullable=True),
+    Column("purchased_quantity", Integer, nullable=False),
+    Column("allocated_quantity", Integer, nullable=False),
+)
 
 
 def start_mappers():
@@ -93,7 +139,6 @@ def start_mappers():
             )
         },
     )
-    detour_value_object_frozen_setattr(OrderLine)
     mapper_registry.map_imperatively(
         Product,
         products,
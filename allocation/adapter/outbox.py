@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import date
 from typing import ClassVar, Iterable
 from uuid import UUID
 
@@ -6,13 +7,25 @@ from allocation import port
 from allocation.domain.messages import events
 from allocation.domain.messages.events import Event
 from cattrs.preconf.json import make_converter  # type: ignore
-from sqlalchemy import select
+from sqlalchemy import column, func, select, table, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .database import ROW_HASH_SQL
+
 converter = make_converter()
 
 converter.register_unstructure_hook(UUID, lambda uuid: uuid.hex)  # type: ignore
 converter.register_structure_hook(UUID, lambda hex, _: UUID(hex))
+converter.register_unstructure_hook(date, lambda date_: date_.isoformat())
+converter.register_structure_hook(date, lambda iso, _: date.fromisoformat(iso))
+
+
+def specialize_converter(types: Iterable[type]) -> None:
+    # cattrs generates the functions (un)structuring a class on its first use.
+    # Dispatching ahead generates them and caches them for the converter.
+    for type_ in types:
+        converter._unstructure_func.dispatch(type_)  # type: ignore
+        converter._structure_func.dispatch(type_)  # type: ignore
 
 
 @dataclass
@@ -22,6 +35,16 @@ class Envelope:
     aggregate_id: str
     type: str
     payload: str
+    position: int = field(init=False)
+
+
+# Writers take turns on SQLite, which has no identity columns, so an envelope
+# put is positioned after the last one.
+_NEXT_POSITION = (
+    select(func.coalesce(func.max(column("position")), 0) + 1)
+    .select_from(table("events"))
+    .scalar_subquery()
+)
 
 
 @dataclass
@@ -30,6 +53,8 @@ class Outbox(port.outbox.Outbox[Event]):
     EVENT_MAP: ClassVar[dict[str, type[Event]]] = {
         event_type.__name__: event_type
         for event_type in (
+            events.BatchCreated,
+            events.BatchQuantityChanged,
             events.Allocated,
             events.Deallocated,
             events.OutOfStock,
@@ -39,7 +64,9 @@ class Outbox(port.outbox.Outbox[Event]):
     _session: AsyncSession
 
     async def all(self) -> Iterable[Event]:
-        envelope_scalars = await self._session.scalars(select(Envelope))
+        envelope_scalars = await self._session.scalars(
+            select(Envelope).order_by(Envelope.position)
+        )
         envelopes: list[Envelope] = envelope_scalars.all()
         events = (
             converter.loads(envelope.payload, self.EVENT_MAP[envelope.type])  # type: ignore
@@ -56,8 +83,36 @@ class Outbox(port.outbox.Outbox[Event]):
             type=type(event).__name__,
             payload=converter.dumps(event),  # type: ignore
         )
+        if self._session.bind.dialect.name == "sqlite":  # type: ignore
+            envelope.position = _NEXT_POSITION  # type: ignore
         self._session.add(envelope)
 
     async def delete(self, event: Event) -> None:
         envelope = await self._session.get(Envelope, event.uid)
         await self._session.delete(envelope)
+
+    async def claim(
+        self, limit: int, partition: int = 0, partitions: int = 1
+    ) -> list[Envelope]:
+        # The oldest envelopes of a partition of the aggregates. Envelopes
+        # locked by another relay's transaction are passed over, so two relays
+        # claiming one partition could publish an aggregate's events out of
+        # order. Relays are run one per partition.
+        query = select(Envelope).order_by(Envelope.position)
+        if partitions > 1:
+            dialect = self._session.bind.dialect.name  # type: ignore
+            key = ROW_HASH_SQL[dialect].format("aggregate_type || '/' || aggregate_id")
+            query = query.where(
+                text(f"{key} % :partitions = :partition").bindparams(
+                    partitions=partitions, partition=partition
+                )
+            )
+        envelopes = await self._session.scalars(
+            query.limit(limit).with_for_update(skip_locked=True)
+        )
+        return envelopes.all()
+
+    async def notify(self, channel: str) -> None:
+        # Delivered on commit, once per transaction however often it is sent.
+        if self._session.bind.dialect.name == "postgresql":  # type: ignore
+            await self._session.execute(select(func.pg_notify(channel, "")))
@@ -0,0 +1,413 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import date
+from typing import Awaitable, Callable, ClassVar, Iterable, Optional, Sequence
+
+from allocation import port
+from sqlalchemy import MetaData, Table, UniqueConstraint, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from .database import ROW_HASH_SQL
+from .orm import allocations_view, stock_view
+
+
+@dataclass
+class AllocationsView(port.read_model.AllocationsView):
+
+    _session: AsyncSession
+
+    async def add(self, order_id: str, sku: str, qty: int, batchref: str) -> None:
+        await self._session.execute(
+            text(
+                "INSERT INTO allocations_view (order_id, sku, qty, batchref)"
+                " VALUES (:order_id, :sku, :qty, :batchref)"
+                " ON CONFLICT (order_id, sku, qty)"
+                " DO UPDATE SET batchref = excluded.batchref"
+            ),
+            dict(order_id=order_id, sku=sku, qty=qty, batchref=batchref),
+        )
+
+    async def remove_many(self, lines: Iterable[tuple[str, str, int]]) -> None:
+        await self._session.execute(
+            text(
+                "DELETE FROM allocations_view"
+                " WHERE order_id = :order_id AND sku = :sku AND qty = :qty"
+            ),
+            [dict(order_id=order_id, sku=sku, qty=qty) for order_id, sku, qty in lines],
+        )
+
+
+@dataclass
+class StockView(port.read_model.StockView):
+    # Every change is an upsert keyed by batch, so that the events of a batch
+    # can be projected in any order.
+
+    _session: AsyncSession
+
+    async def add_batch(
+        self, sku: str, batchref: str, eta: Optional[date], qty: int
+    ) -> None:
+        await self._upsert(
+            sku,
+            batchref,
+            eta=eta,
+            purchased=qty,
+            allocated=0,
+            update="eta = excluded.eta, purchased_quantity = excluded.purchased_quantity",
+        )
+
+    async def change_batch_quantity(self, sku: str, batchref: str, qty: int) -> None:
+        await self._upsert(
+            sku,
+            batchref,
+            purchased=qty,
+            allocated=0,
+            update="purchased_quantity = excluded.purchased_quantity",
+        )
+
+    async def recount_allocated(self, sku: str, batchref: str) -> None:
+        # Summed from the lines rather than added to, so that an allocation
+        # projected twice is counted once.
+        await self._session.execute(
+            text(
+                "INSERT INTO stock_view"
+                " (sku, batchref, eta, purchased_quantity, allocated_quantity)"
+                " SELECT CAST(:sku AS VARCHAR), CAST(:batchref AS VARCHAR), NULL, 0,"
+                " coalesce(sum(qty), 0) FROM allocations_view"
+                " WHERE batchref = :batchref"
+                " ON CONFLICT (batchref)"
+                " DO UPDATE SET allocated_quantity = excluded.allocated_quantity"
+            ),
+            dict(sku=sku, batchref=batchref),
+        )
+
+    async def _upsert(
+        self,
+        sku: str,
+        batchref: str,
+        *,
+        purchased: int,
+        allocated: int,
+        update: str,
+        eta: Optional[date] = None,
+    ) -> None:
+        await self._session.execute(
+            text(
+                "INSERT INTO stock_view"
+                " (sku, batchref, eta, purchased_quantity, allocated_quantity)"
+                " VALUES (:sku, :batchref, :eta, :purchased, :allocated)"
+                f" ON CONFLICT (batchref) DO UPDATE SET {update}"
+            ),
+            dict(
+                sku=sku,
+                batchref=batchref,
+                eta=eta,
+                purchased=purchased,
+                allocated=allocated,
+            ),
+        )
+
+
+@dataclass(frozen=True)
+class SkuRange:
+    # Skus above low and up to high, unbounded where None.
+
+    low: Optional[str]
+    high: Optional[str]
+
+    def where(self, column: str) -> str:
+        conditions = ["1 = 1"]
+        if self.low is not None:
+            conditions.append(f"{column} > :low")
+        if self.high is not None:
+            conditions.append(f"{column} <= :high")
+        return " AND ".join(conditions)
+
+    @property
+    def params(self) -> dict[str, str]:
+        return {
+            name: value
+            for name, value in (("low", self.low), ("high", self.high))
+            if value is not None
+        }
+
+
+@dataclass(frozen=True)
+class Projection:
+    # The rows of a view, recomputed from the write model a range of skus of
+    # batches at a time. Expressions are selected in the order of the columns.
+
+    view: Table
+    columns: tuple[str, ...]
+    expressions: tuple[str, ...]
+    source: str
+    group_by: str = ""
+
+    def select(self, sku_range: SkuRange) -> str:
+        selected = ", ".join(
+            f"{expression} AS {column}"
+            for expression, column in zip(self.expressions, self.columns)
+        )
+        return (
+            f"SELECT {selected} {self.source}"
+            f" WHERE {sku_range.where('batches.sku')}{self.group_by}"
+        )
+
+    @property
+    def shadow(self) -> str:
+        return f"{self.view.name}_rebuild"
+
+    @property
+    def retired(self) -> str:
+        return f"{self.view.name}_retired"
+
+
+ALLOCATIONS = Projection(
+    allocations_view,
+    ("order_id", "sku", "qty", "batchref"),
+    ("order_lines.order_id", "batches.sku", "order_lines.qty", "batches.reference"),
+    "FROM allocations"
+    " JOIN order_lines ON allocations.orderline_id = order_lines.id"
+    " JOIN batches ON allocations.batch_id = batches.id",
+)
+
+STOCK = Projection(
+    stock_view,
+    ("sku", "batchref", "eta", "purchased_quantity", "allocated_quantity"),
+    (
+        "batches.sku",
+        "batches.reference",
+        "batches.eta",
+        "batches.purchased_quantity",
+        "coalesce(sum(order_lines.qty), 0)",
+    ),
+    "FROM batches"
+    " LEFT JOIN allocations ON allocations.batch_id = batches.id"
+    " LEFT JOIN order_lines ON allocations.orderline_id = order_lines.id",
+    " GROUP BY batches.id",
+)
+
+
+async def sku_ranges(conn: AsyncConnection, chunks: int) -> list[SkuRange]:
+    # Ranges holding about as many products each. The last is left open for
+    # products added meanwhile.
+    bounds = await conn.scalars(
+        text(
+            "SELECT max(sku) FROM"
+            " (SELECT sku, ntile(:chunks) OVER (ORDER BY sku) AS chunk FROM products)"
+            " AS chunked GROUP BY chunk ORDER BY 1"
+        ),
+        dict(chunks=chunks),
+    )
+    highs: list[Optional[str]] = list(bounds.all())[:-1]
+    lows: list[Optional[str]] = [None, *highs]
+    return [SkuRange(low, high) for low, high in zip(lows, [*highs, None])]
+
+
+@dataclass
+class ViewRebuilder:
+    # Recomputes a view from the write model with INSERT ... SELECT, a range
+    # of skus per transaction and several ranges at once. A rebuild fills a
+    # shadow table that is renamed into place, a verification compares
+    # checksums range by range and rewrites only the ranges that differ.
+
+    projection: ClassVar[Projection]
+
+    engine: AsyncEngine
+    chunks: int = 16
+    concurrency: int = 4
+
+    async def rebuild(self) -> None:
+        projection = self.projection
+        async with self.engine.begin() as conn:
+            ranges = await sku_ranges(conn, self.chunks)
+            await conn.execute(text(f"DROP TABLE IF EXISTS {projection.shadow}"))
+            await conn.run_sync(_shadow_table(projection).create)
+            # Taken before the copy, a range of the view that differs from them
+            # later received changes the copy may have missed.
+            seen = await self._view_checksums(conn, ranges)
+        await self._each(ranges, self._copy)
+
+        async def catch_up(sku_range: SkuRange) -> None:
+            async with self.engine.begin() as conn:
+                await self._rewrite(conn, sku_range, projection.shadow)
+
+        # Ranges changed during the copy are caught up first without the lock,
+        # then those changed meanwhile under it, so that projections only wait
+        # for a scan of the view and the few ranges changed last. The shadow
+        # then takes the view's place.
+        async with self.engine.connect() as conn:
+            changed = await self._changed(conn, ranges, seen)
+        await self._each(changed, catch_up)
+        async with self.engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(
+                    text(f"LOCK TABLE {projection.view.name} IN EXCLUSIVE MODE")
+                )
+            for sku_range in await self._changed(conn, ranges, seen):
+                await self._rewrite(conn, sku_range, projection.shadow)
+            await _swap(conn, projection)
+
+    async def verify(self, repair: bool = True) -> list[SkuRange]:
+        async with self.engine.connect() as conn:
+            ranges = await sku_ranges(conn, self.chunks)
+        drifted: list[SkuRange] = []
+        view = self.projection.view.name
+
+        async def check(sku_range: SkuRange) -> None:
+            async with self.engine.begin() as conn:
+                if await self._differs(conn, sku_range, view):
+                    drifted.append(sku_range)
+                    if repair:
+                        await self._rewrite(conn, sku_range, view)
+
+        await self._each(ranges, check)
+        return drifted
+
+    async def _each(
+        self, ranges: Iterable[SkuRange], work: Callable[[SkuRange], Awaitable[None]]
+    ) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(sku_range: SkuRange) -> None:
+            async with semaphore:
+                await work(sku_range)
+
+        await asyncio.gather(*(bounded(sku_range) for sku_range in ranges))
+
+    async def _changed(
+        self,
+        conn: AsyncConnection,
+        ranges: Sequence[SkuRange],
+        seen: dict[SkuRange, tuple[int, int]],
+    ) -> list[SkuRange]:
+        checksums = await self._view_checksums(conn, ranges)
+        changed = [r for r in ranges if checksums[r] != seen[r]]
+        seen.update(checksums)
+        return changed
+
+    async def _view_checksums(
+        self, conn: AsyncConnection, ranges: Sequence[SkuRange]
+    ) -> dict[SkuRange, tuple[int, int]]:
+        # Of every range in a single scan, numbered by the first range whose
+        # high bound the sku is under.
+        highs = [sku_range.high for sku_range in ranges[:-1]]
+        chunk = (
+            "CASE "
+            + " ".join(f"WHEN sku <= :high{i} THEN {i}" for i in range(len(highs)))
+            + f" ELSE {len(highs)} END"
+            if highs
+            else "0"
+        )
+        rows = await conn.execute(
+            text(
+                f"SELECT chunk, {_checksum(conn, self.projection.columns)} FROM"
+                f" (SELECT *, {chunk} AS chunk FROM {self.projection.view.name})"
+                " AS chunked GROUP BY chunk"
+            ),
+            {f"high{i}": high for i, high in enumerate(highs)},
+        )
+        checksums = {sku_range: (0, 0) for sku_range in ranges}
+        for index, count, total in rows:
+            checksums[ranges[index]] = (count, total)
+        return checksums
+
+    async def _copy(self, sku_range: SkuRange) -> None:
+        async with self.engine.begin() as conn:
+            await _insert(conn, self.projection, sku_range, self.projection.shadow)
+
+    async def _differs(
+        self, conn: AsyncConnection, sku_range: SkuRange, table: str
+    ) -> bool:
+        checksum = _checksum(conn, self.projection.columns)
+        source = await conn.execute(
+            text(
+                f"SELECT {checksum} FROM ({self.projection.select(sku_range)})"
+                " AS source"
+            ),
+            sku_range.params,
+        )
+        view = await conn.execute(
+            text(f"SELECT {checksum} FROM {table} WHERE {sku_range.where('sku')}"),
+            sku_range.params,
+        )
+        return tuple(source.one()) != tuple(view.one())
+
+    async def _rewrite(
+        self, conn: AsyncConnection, sku_range: SkuRange, table: str
+    ) -> None:
+        await conn.execute(
+            text(f"DELETE FROM {table} WHERE {sku_range.where('sku')}"),
+            sku_range.params,
+        )
+        await _insert(conn, self.projection, sku_range, table)
+
+
+class AllocationsViewRebuilder(ViewRebuilder):
+    projection = ALLOCATIONS
+
+
+class StockViewRebuilder(ViewRebuilder):
+    projection = STOCK
+
+
+def _checksum(conn: AsyncConnection, columns: Iterable[str]) -> str:
+    # Equal for the same rows in any order, a difference in any row shows.
+    row = " || '/' || ".join(
+        f"coalesce(CAST({column} AS VARCHAR), '')" for column in columns
+    )
+    row_hash = ROW_HASH_SQL[conn.dialect.name].format(row)
+    return f"count(*), coalesce(sum({row_hash}), 0)"
+
+
+def _shadow_table(projection: Projection) -> Table:
+    shadow = projection.view.to_metadata(MetaData(), name=projection.shadow)
+    # Indexes keep the name they are created with, they are built on the view
+    # once the shadow has taken its place.
+    shadow.indexes.clear()
+    return shadow
+
+
+async def _insert(
+    conn: AsyncConnection, projection: Projection, sku_range: SkuRange, table: str
+) -> None:
+    await conn.execute(
+        text(
+            f"INSERT INTO {table} ({', '.join(projection.columns)})"
+            f" {projection.select(sku_range)}"
+        ),
+        sku_range.params,
+    )
+
+
+async def _swap(conn: AsyncConnection, projection: Projection) -> None:
+    view = projection.view
+    await conn.execute(text(f"ALTER TABLE {view.name} RENAME TO {projection.retired}"))
+    await conn.execute(text(f"ALTER TABLE {projection.shadow} RENAME TO {view.name}"))
+    await conn.execute(text(f"DROP TABLE {projection.retired}"))
+    if conn.dialect.name == "postgresql":
+        # Named after the shadow, they would clash with the next one.
+        for suffix in ["pkey", *_unique_key_suffixes(view)]:
+            await conn.execute(
+                text(
+                    f"ALTER INDEX {projection.shadow}_{suffix}"
+                    f" RENAME TO {view.name}_{suffix}"
+                )
+            )
+        await conn.execute(
+            text(
+                f"ALTER SEQUENCE {projection.shadow}_id_seq"
+                f" RENAME TO {view.name}_id_seq"
+            )
+        )
+    for index in view.indexes:
+        await conn.run_sync(index.create)
+
+
+def _unique_key_suffixes(view: Table) -> list[str]:
+    # What Postgres names the index of an unnamed unique constraint after.
+    return [
+        "_".join(column.name for column in constraint.columns) + "_key"
+        for constraint in view.constraints
+        if isinstance(constraint, UniqueConstraint) and constraint.name is None
+    ]
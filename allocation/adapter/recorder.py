@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import IO, Iterator, Optional
+
+from allocation.domain.messages import commands, events
+from allocation.domain.messages.base import Message
+from allocation.service.tracing import Span, SpanExporter
+
+from .outbox import converter
+
+MESSAGE_MAP: dict[str, type[Message]] = {
+    message_type.__name__: message_type
+    for message_type in (
+        commands.Allocate,
+        commands.CreateBatch,
+        commands.ChangeBatchQuantity,
+        events.BatchCreated,
+        events.BatchQuantityChanged,
+        events.Allocated,
+        events.Deallocated,
+        events.OutOfStock,
+    )
+}
+
+
+@dataclass(slots=True, kw_only=True)
+class Record:
+    start: float
+    duration: float
+    handler: str
+    error: Optional[str]
+    message: Message
+
+
+class MessageRecorder(SpanExporter):
+    # One JSON line per handler execution, appended as it finishes.
+
+    def __init__(self, path: str | os.PathLike[str]):
+        self._lock = threading.Lock()
+        self._file: IO[str] = open(path, "a", buffering=1, encoding="utf-8")
+
+    def export(self, span: Span) -> None:
+        message = span.message
+        if message is None or type(message).__name__ not in MESSAGE_MAP:
+            return
+        line = json.dumps(
+            {
+                "start": span.start,
+                "duration": span.duration,
+                "handler": span.handler,
+                "error": span.error,
+                "type": type(message).__name__,
+                "payload": converter.unstructure(message),
+            },
+            separators=(",", ":"),
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_recording(path: str | os.PathLike[str]) -> Iterator[Record]:
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            raw = json.loads(line)
+            yield Record(
+                start=raw["start"],
+                duration=raw["duration"],
+                handler=raw["handler"],
+                error=raw["error"],
+                message=converter.structure(raw["payload"], MESSAGE_MAP[raw["type"]]),
+            )
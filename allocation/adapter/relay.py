@@ -0,0 +1,106 @@
+import asyncio
+import contextlib
+from dataclasses import dataclass
+from typing import Any, AsyncContextManager, Awaitable, Callable, Optional, Sequence
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .outbox import Envelope, Outbox
+
+Publish = Callable[[Sequence[Envelope]], Awaitable[None]]
+Listen = Callable[[Callable[[], None]], AsyncContextManager[None]]
+
+
+@dataclass
+class OutboxRelay:
+    # Publishes the envelopes in the outbox and deletes them in the transaction
+    # that claimed them. The relay drains whenever it is woken by a commit that
+    # put events, and every poll_interval in case a notification was missed.
+    # Notifications arriving during a drain wake it for a single drain more.
+    # Envelopes are published in the order they were put. With several relays,
+    # each is given its own partition of the aggregates to keep that order.
+
+    session_factory: Callable[[], AsyncSession]
+    publish: Publish
+    listen: Optional[Listen] = None
+    batch_size: int = 100
+    poll_interval: float = 5.0
+    partition: int = 0
+    partitions: int = 1
+
+    async def run(self, stop: asyncio.Event) -> None:
+        woken = asyncio.Event()
+        listening = self.listen(woken.set) if self.listen else contextlib.nullcontext()
+        async with listening:
+            while not stop.is_set():
+                woken.clear()
+                await self.drain()
+                await _first(woken, stop, timeout=self.poll_interval)
+
+    async def drain(self) -> int:
+        relayed = 0
+        while (batch := await self.relay_batch()) == self.batch_size:
+            relayed += batch
+        relayed += batch
+        if relayed:
+            logger.debug(f"[Relayed] {relayed} events")
+        return relayed
+
+    async def relay_batch(self) -> int:
+        async with self.session_factory() as session:
+            outbox = Outbox(session)
+            envelopes = await outbox.claim(
+                self.batch_size, self.partition, self.partitions
+            )
+            if envelopes:
+                await self.publish(envelopes)
+                for envelope in envelopes:
+                    await session.delete(envelope)
+            await session.commit()
+        return len(envelopes)
+
+
+async def _first(*events: asyncio.Event, timeout: float) -> None:
+    waiters = [asyncio.create_task(event.wait()) for event in events]
+    try:
+        await asyncio.wait(
+            waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+class KafkaPublisher:
+    # Routes envelopes like the outbox connector does: to a topic per aggregate
+    # type, keyed by aggregate id, with the event type in the "type" header.
+
+    def __init__(self, bootstrap_servers: str, topic_prefix: str = "outbox.allocation"):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic_prefix = topic_prefix
+        self._producer: Any = None
+
+    async def start(self) -> None:
+        from aiokafka import AIOKafkaProducer  # type: ignore
+
+        self._producer = AIOKafkaProducer(
+            bootstrap_servers=self.bootstrap_servers, acks="all"
+        )
+        await self._producer.start()
+
+    async def __call__(self, envelopes: Sequence[Envelope]) -> None:
+        sent = [
+            await self._producer.send(
+                f"{self.topic_prefix}.{envelope.aggregate_type}",
+                value=envelope.payload.encode(),
+                key=envelope.aggregate_id.encode(),
+                headers=[("type", envelope.type.encode())],
+            )
+            for envelope in envelopes
+        ]
+        await asyncio.gather(*sent)
+
+    async def stop(self) -> None:
+        if self._producer is not None:
+            await self._producer.stop()
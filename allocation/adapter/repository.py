@@ -1,8 +1,9 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Iterable, Optional
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from allocation import port
 from allocation.domain.models import Batch, Product
@@ -26,5 +27,25 @@ class ProductRepository(port.repository.ProductRepository):
         result = await self._session.execute(stmt)
         return result.scalars().first()
 
+    async def get_many(self, skus: Iterable[str]) -> list[Product]:
+        return await self._get_many(Product.sku.in_(list(skus)))  # type: ignore
+
+    async def get_many_by_batchrefs(self, batchrefs: Iterable[str]) -> list[Product]:
+        skus = select(Batch.sku).filter(Batch.reference.in_(list(batchrefs)))  # type: ignore
+        return await self._get_many(Product.sku.in_(skus))  # type: ignore
+
+    async def _get_many(self, criterion: Any) -> list[Product]:
+        # Batches and their allocations are loaded by a query each for all the
+        # products, where joining them would repeat every product per line.
+        stmt = (
+            select(Product)
+            .filter(criterion)
+            .options(
+                selectinload(Product.batches).selectinload(Batch._allocations)  # type: ignore
+            )
+        )
+        result = await self._session.execute(stmt)
+        return list(result.scalars().all())
+
     async def delete(self, product: Product) -> None:
         await self._session.delete(product)  # type: ignore
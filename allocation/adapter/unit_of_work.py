@@ -1,20 +1,57 @@
-from dataclasses import dataclass, field
+import uuid
+from dataclasses import dataclass, field, replace
 from types import TracebackType
 from typing import Callable, ClassVar, Optional
 
 from allocation import port
 from allocation.config import settings
+from allocation.domain.messages import events
 from allocation.domain.messages.events import Event
+from allocation.domain.models import Batch, OrderLine, Product
+from allocation.service.exceptions import SchemaChanged
 from allocation.service.message_bus import get_issued_messages
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from typing_extensions import Self
 
+from .database import EngineOptions, ReplicaRouter, create_engine, is_stale_statement
 from .outbox import Outbox
+from .read_model import AllocationsView, StockView
 from .repository import ProductRepository
 
-engine = create_async_engine(
-    settings.DATABASE_URL, future=True, isolation_level="REPEATABLE READ"
+write_engine_options = EngineOptions(
+    isolation_level=settings.DATABASE_ISOLATION_LEVEL,
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    pool_recycle=settings.DATABASE_POOL_RECYCLE,
+    pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+    pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+    query_cache_size=settings.DATABASE_QUERY_CACHE_SIZE,
+    prepared_statement_cache_size=settings.DATABASE_PREPARED_STATEMENT_CACHE_SIZE,
+    statement_cache_size=settings.DATABASE_STATEMENT_CACHE_SIZE,
+)
+# Reads get their own pool so that they never hold connections allocations
+# are waiting for, and fall back to the primary while the replica lags.
+read_engine_options = replace(
+    write_engine_options,
+    isolation_level=settings.READ_DATABASE_ISOLATION_LEVEL,
+    pool_size=settings.READ_DATABASE_POOL_SIZE,
+    max_overflow=settings.READ_DATABASE_MAX_OVERFLOW,
+)
+
+engine = create_engine(settings.DATABASE_URL, write_engine_options)
+read_router = ReplicaRouter(
+    replica=create_engine(
+        settings.READ_DATABASE_URL or settings.DATABASE_URL,
+        read_engine_options,
+        read_only=True,
+    ),
+    primary=(
+        create_engine(settings.DATABASE_URL, read_engine_options, read_only=True)
+        if settings.READ_DATABASE_URL and settings.READ_DATABASE_MAX_LAG is not None
+        else None
+    ),
+    max_lag=settings.READ_DATABASE_MAX_LAG,
 )
 
 
@@ -24,14 +61,20 @@ class UnitOfWork(port.unit_of_work.UnitOfWork):
     SESSION_FACTORY: ClassVar[Callable[[], AsyncSession]] = sessionmaker(  # type: ignore
         bind=engine, class_=AsyncSession  # type: ignore
     )
+    # Relays listening on the channel are woken by commits that put events.
+    NOTIFY_CHANNEL: ClassVar[Optional[str]] = settings.OUTBOX_CHANNEL
 
     products: ProductRepository = field(init=False)
+    allocations_view: AllocationsView = field(init=False)
+    stock_view: StockView = field(init=False)
     _session: AsyncSession = field(init=False)
     _outbox: Outbox = field(init=False)
 
     async def __aenter__(self) -> Self:
         self._session = await self.SESSION_FACTORY().__aenter__()
         self.products = ProductRepository(self._session)
+        self.allocations_view = AllocationsView(self._session)
+        self.stock_view = StockView(self._session)
         self._outbox = Outbox(self._session)
         return self
 
@@ -41,19 +84,68 @@ class UnitOfWork(port.unit_of_work.UnitOfWork):
         exc_value: Optional[BaseException],
         traceback: Optional[TracebackType],
     ) -> None:
-        await self._session.__aexit__(exc_type, exc_value, traceback)
+        try:
+            if exc_type is not None:
+                await self.rollback()
+        finally:
+            await self._session.__aexit__(exc_type, exc_value, traceback)
+        if exc_value is not None and is_stale_statement(exc_value):
+            raise SchemaChanged(str(exc_value)) from exc_value
 
     async def commit(self) -> None:
         issued_messages = get_issued_messages()
         issued_events = (
             message for message in issued_messages if isinstance(message, Event)
         )
+        put = False
         for msg in issued_events:
             await self._outbox.put(msg)
+            put = True
+        if put and self.NOTIFY_CHANNEL:
+            await self._outbox.notify(self.NOTIFY_CHANNEL)
         await self._session.commit()
         for msg in issued_events:
             await self._outbox.delete(msg)
         await self._session.commit()
 
     async def rollback(self) -> None:
-        ...
+        await self._session.rollback()
+
+    @classmethod
+    async def compile_statements(cls) -> None:
+        # Runs the statements of the write path once in a transaction that is rolled
+        # back, so that the first requests find them in the engine's compiled cache.
+        # On asyncpg they also stay prepared on the connection that was used.
+        sku = f"warm-up-{uuid.uuid4().hex}"
+        event = events.Allocated(
+            order_id=sku, sku=sku, qty=1, batchref=sku, aggregate_id=sku
+        )
+        async with cls.SESSION_FACTORY() as session:
+            try:
+                products = ProductRepository(session)
+                outbox = Outbox(session)
+                allocations_view = AllocationsView(session)
+                stock_view = StockView(session)
+                await products.get(sku)
+                await products.get_by_batchref(sku)
+                product = Product(
+                    sku=sku,
+                    batches=[
+                        Batch(reference=sku, sku=sku, eta=None, purchased_quantity=1)
+                    ],
+                )
+                await products.add(product)
+                await stock_view.add_batch(sku, sku, None, 1)
+                await session.flush()
+                product.allocate(OrderLine(order_id=sku, sku=sku, qty=1))
+                await outbox.put(event)
+                await allocations_view.add(order_id=sku, sku=sku, qty=1, batchref=sku)
+                await stock_view.recount_allocated(sku, sku)
+                await session.flush()
+                product.change_batch_quantity(sku, 0)
+                await outbox.delete(event)
+                await allocations_view.remove_many([(sku, sku, 1)])
+                await stock_view.change_batch_quantity(sku, sku, 0)
+                await session.flush()
+            finally:
+                await session.rollback()
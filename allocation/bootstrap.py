@@ -1,3 +1,4 @@
+from concurrent.futures import Executor
 from typing import Any, Awaitable, Callable, Optional, TypeVar
 
 from loguru import logger
@@ -8,6 +9,7 @@ from allocation.domain.messages import commands, events
 from allocation.domain.messages.base import Message
 from allocation.service import handlers
 from allocation.service.message_bus import Handler, MessageBus
+from allocation.service.tracing import SpanExporter
 
 
 M = TypeVar("M", bound=Message)
@@ -37,6 +39,11 @@ def bootstrap(
     exception_hook: Optional[
         Callable[[Message, Handler[Any], Exception], Awaitable[None]]
     ] = exception_hook,
+    executor: Optional[Executor] = None,
+    cpu_executor: Optional[Executor] = None,
+    handler_timeout: Optional[float] = None,
+    notification_timeout: Optional[float] = None,
+    span_exporter: Optional[SpanExporter] = None,
 ) -> MessageBus:
 
     if start_orm_mapping:
@@ -50,25 +57,50 @@ def bootstrap(
         pre_hook=pre_hook,
         post_hook=post_hook,
         exception_hook=exception_hook,
+        executor=executor,
+        cpu_executor=cpu_executor,
+        span_exporter=span_exporter,
     )
 
     # Commands
-    message_bus.register_handler(commands.Allocate, handlers.allocate)
     message_bus.register_handler(
-        commands.ChangeBatchQuantity, handlers.change_batch_quantity
+        commands.Allocate, handlers.allocate, timeout=handler_timeout
+    )
+    message_bus.register_handler(
+        commands.ChangeBatchQuantity,
+        handlers.change_batch_quantity,
+        timeout=handler_timeout,
+    )
+    message_bus.register_handler(
+        commands.CreateBatch, handlers.add_batch, timeout=handler_timeout
     )
-    message_bus.register_handler(commands.CreateBatch, handlers.add_batch)
 
     # Events
     message_bus.register_handlers(
-        events.Allocated, [handlers.add_allocation_to_read_model]
+        events.BatchCreated,
+        [handlers.add_batch_to_stock_view],
+        timeout=handler_timeout,
     )
     message_bus.register_handlers(
+        events.BatchQuantityChanged,
+        [handlers.change_batch_quantity_in_stock_view],
+        timeout=handler_timeout,
+    )
+    message_bus.register_handlers(
+        events.Allocated,
+        [handlers.add_allocation_to_read_model],
+        timeout=handler_timeout,
+    )
+    message_bus.register_batch_handlers(
         events.Deallocated,
         [handlers.remove_allocation_from_read_model, handlers.reallocate],
+        key=lambda evt: evt.sku,
+        timeout=handler_timeout,
     )
     message_bus.register_handlers(
-        events.OutOfStock, [handlers.send_out_of_stock_notification]
+        events.OutOfStock,
+        [handlers.send_out_of_stock_notification],
+        timeout=notification_timeout or handler_timeout,
     )
 
     return message_bus
@@ -1,4 +1,4 @@
-from typing import Literal
+from typing import Literal, Optional
 
 from pydantic import BaseSettings as _BaseSettings
 
@@ -10,6 +10,25 @@ class _Settings(_BaseSettings):
     API_VERSION: str
 
     DATABASE_URL: str
+    DATABASE_ISOLATION_LEVEL: str = "REPEATABLE READ"
+    DATABASE_POOL_SIZE: Optional[int] = None
+    DATABASE_MAX_OVERFLOW: Optional[int] = None
+    DATABASE_POOL_WARM_CONNECTIONS: int = 0
+    DATABASE_POOL_RECYCLE: Optional[int] = None
+    DATABASE_POOL_TIMEOUT: Optional[float] = None
+    DATABASE_POOL_PRE_PING: bool = False
+    DATABASE_QUERY_CACHE_SIZE: Optional[int] = None
+    DATABASE_PREPARED_STATEMENT_CACHE_SIZE: Optional[int] = None
+    DATABASE_STATEMENT_CACHE_SIZE: Optional[int] = None
+
+    READ_DATABASE_URL: Optional[str] = None
+    READ_DATABASE_ISOLATION_LEVEL: str = "READ COMMITTED"
+    READ_DATABASE_POOL_SIZE: Optional[int] = None
+    READ_DATABASE_MAX_OVERFLOW: Optional[int] = None
+    READ_DATABASE_POOL_WARM_CONNECTIONS: int = 0
+    READ_DATABASE_MAX_LAG: Optional[float] = None
+    ALLOCATIONS_PAGE_MAX_SIZE: int = 1000
+    ALLOCATIONS_STREAM_CHUNK_SIZE: int = 1000
 
     EMAIL_HOST: str
     EMAIL_PORT: int
@@ -18,6 +37,37 @@ class _Settings(_BaseSettings):
     KAFKA_CONNECT_HOST: str
     KAFKA_CONNECT_PORT: str
     KAFKA_CONNECTER_CONFIGURATION: str
+    KAFKA_BOOTSTRAP_SERVERS: Optional[str] = None
+
+    COMMAND_TOPIC: str = "allocation.commands"
+    COMMAND_CONSUMER_GROUP: str = "allocation"
+    CONSUMER_BATCH_SIZE: int = 100
+    CONSUMER_CONCURRENCY: int = 8
+    CONSUMER_ATTEMPTS: int = 3
+    CONSUMER_RETRY_DELAY: float = 0.5
+
+    OUTBOX_CHANNEL: Optional[str] = None
+    OUTBOX_RELAY_BATCH_SIZE: int = 100
+    OUTBOX_RELAY_POLL_INTERVAL: float = 5.0
+    OUTBOX_RELAY_PARTITIONS: int = 1
+    OUTBOX_RELAY_PARTITION: int = 0
+
+    HANDLER_THREAD_WORKERS: Optional[int] = None
+    HANDLER_PROCESS_WORKERS: int = 0
+    BUS_SHARDS: int = 0
+    LOOP_LAG_WARNING_THRESHOLD: Optional[float] = None
+
+    REQUEST_TIMEOUT: Optional[float] = None
+    HANDLER_TIMEOUT: Optional[float] = None
+    NOTIFICATION_TIMEOUT: Optional[float] = None
+
+    TRACE_FILE: Optional[str] = None
+    RECORDING_FILE: Optional[str] = None
+
+    PROFILE_DIR: Optional[str] = None
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_TOKEN: Optional[str] = None
+    PROFILE_INTERVAL: float = 0.005
 
 
 settings = _Settings()  # type: ignore
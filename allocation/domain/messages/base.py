@@ -1,7 +1,7 @@
 from abc import ABCMeta
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Any, ClassVar
+from typing import Any, ClassVar, Optional
 from uuid import UUID, uuid4
 
 from typing_extensions import Self, dataclass_transform
@@ -18,7 +18,17 @@ class MessageMeta(ABCMeta):
         cls: type[Self], name: str, bases: tuple[type, ...], namespace: dict[str, Any]
     ) -> Self:
         new_cls = super().__new__(cls, name, bases, namespace)
-        return dataclass(frozen=True, kw_only=True)(new_cls)  # type: ignore
+        if "__slots__" in namespace:
+            # The class dataclass recreates with its fields as slots.
+            return new_cls
+        new_cls = dataclass(frozen=True, kw_only=True, slots=True)(new_cls)  # type: ignore
+        # Equal messages share their uid, hashing it spares the payload.
+        new_cls.__hash__ = _hash_uid  # type: ignore
+        return new_cls
+
+
+def _hash_uid(message: Any) -> int:
+    return hash(message.uid)
 
 
 class _Message(metaclass=MessageMeta):
@@ -26,6 +36,12 @@ class _Message(metaclass=MessageMeta):
     create_time: float = field(
         default_factory=lambda: datetime.now(timezone.utc).timestamp()
     )
+    correlation_id: Optional[UUID] = None
+    causation_id: Optional[UUID] = None
+
+    @property
+    def trace_id(self) -> UUID:
+        return self.correlation_id or self.uid
 
 
 class Command(_Message):
@@ -37,4 +53,4 @@ class Event(_Message):
     aggregate_id: str
 
 
-Message = Command | Event
\ No newline at end of file
+Message = Command | Event
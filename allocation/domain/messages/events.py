@@ -1,6 +1,28 @@
+from datetime import date
+from typing import Optional
+
 from .base import Event
 
 
+class BatchCreated(Event):
+
+    AGGREGATE_TYPE = "Product"
+
+    sku: str
+    batchref: str
+    qty: int
+    eta: Optional[date] = None
+
+
+class BatchQuantityChanged(Event):
+
+    AGGREGATE_TYPE = "Product"
+
+    sku: str
+    batchref: str
+    qty: int
+
+
 class Allocated(Event):
 
     AGGREGATE_TYPE = "Product"
@@ -18,6 +40,8 @@ class Deallocated(Event):
     order_id: str
     sku: str
     qty: int
+    # Absent from events recorded before batches were tracked in stock_view.
+    batchref: Optional[str] = None
 
 
 class OutOfStock(Event):
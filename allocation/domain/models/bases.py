@@ -1,9 +1,31 @@
-from dataclasses import dataclass, field
+from dataclasses import FrozenInstanceError, dataclass, field, fields
 from typing import Any
 
 from typing_extensions import Self, dataclass_transform
 
 
+def _frozen_fields_setattr(cls: type) -> Any:
+    frozen = frozenset(f.name for f in fields(cls))
+
+    def __setattr__(self: Any, name: str, value: Any):
+        if name in frozen:
+            raise FrozenInstanceError(f"cannot assign to field {name!r}")
+        object.__setattr__(self, name, value)
+
+    return __setattr__
+
+
+def _frozen_fields_delattr(cls: type) -> Any:
+    frozen = frozenset(f.name for f in fields(cls))
+
+    def __delattr__(self: Any, name: str):
+        if name in frozen:
+            raise FrozenInstanceError(f"cannot delete field {name!r}")
+        object.__delattr__(self, name)
+
+    return __delattr__
+
+
 # Metaclasses
 @dataclass_transform(
     eq_default=True,
@@ -16,7 +38,12 @@ class _ValueObjectMeta(type):
         cls: type[Self], name: str, bases: tuple[type, ...], namespace: dict[str, Any]
     ) -> Self:
         new_cls = super().__new__(cls, name, bases, namespace)
-        return dataclass(frozen=True, kw_only=True)(new_cls)  # type: ignore
+        new_cls = dataclass(frozen=True, kw_only=True)(new_cls)  # type: ignore
+        # Mapped value objects keep their __dict__ and the ORM sets its state on
+        # them. Only the fields are frozen, unlike dataclass' own __setattr__.
+        new_cls.__setattr__ = _frozen_fields_setattr(new_cls)  # type: ignore
+        new_cls.__delattr__ = _frozen_fields_delattr(new_cls)  # type: ignore
+        return new_cls
 
 
 @dataclass_transform(
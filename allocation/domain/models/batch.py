@@ -1,5 +1,5 @@
 from datetime import date
-from typing import Any, Optional
+from typing import Any, Iterable, Optional
 
 from .bases import Entity, field
 from .order_line import OrderLine
@@ -36,6 +36,10 @@ class Batch(Entity):
         if self.can_allocate(line):
             self._allocations.add(line)
 
+    def allocate_unchecked(self, lines: Iterable[OrderLine]):
+        # For lines already known to fit, see Product.allocate_many.
+        self._allocations.update(lines)
+
     def deallocate_one(self) -> OrderLine:
         return self._allocations.pop()
 
@@ -1,8 +1,17 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+from ..solver import first_fit
 from .bases import Aggregate, field
 from .batch import Batch
 from .order_line import OrderLine
 
 
+# Below this many lines, allocating one by one beats setting up the arrays.
+MIN_BULK_LINES = 8
+
+
 class OutOfStockException(Exception):
     ...
 
@@ -24,6 +33,45 @@ class Product(Aggregate):
         except StopIteration:
             raise OutOfStockException()
 
+    def allocate_many(self, lines: Sequence[OrderLine]) -> list[Optional[str]]:
+        # Allocates as allocating the lines one by one would, None standing for
+        # out of stock. Lines repeating an allocation, of another sku or of a
+        # negative quantity are left to allocate, arrays only model the rest.
+        if len(lines) < MIN_BULK_LINES or not self._fits_arrays(lines):
+            return [self._allocate_or_none(line) for line in lines]
+        batches = sorted(self.batches)
+        quantities = np.fromiter(
+            (line.qty for line in lines), dtype=np.int64, count=len(lines)
+        )
+        assigned = first_fit([b.available_quantity for b in batches], quantities)
+        batchrefs: list[Optional[str]] = []
+        taken: list[list[OrderLine]] = [[] for _ in batches]
+        for line, index in zip(lines, assigned.tolist()):
+            if index < 0:
+                batchrefs.append(None)
+                continue
+            taken[index].append(line)
+            batchrefs.append(batches[index].reference)
+        for batch, batch_lines in zip(batches, taken):
+            batch.allocate_unchecked(batch_lines)
+        self.version_number += len(lines) - batchrefs.count(None)
+        return batchrefs
+
+    def _fits_arrays(self, lines: Sequence[OrderLine]) -> bool:
+        allocated = {line for batch in self.batches for line in batch._allocations}
+        return (
+            len(set(lines)) == len(lines)
+            and allocated.isdisjoint(lines)
+            and all(line.sku == self.sku and line.qty >= 0 for line in lines)
+            and all(batch.sku == self.sku for batch in self.batches)
+        )
+
+    def _allocate_or_none(self, line: OrderLine) -> Optional[str]:
+        try:
+            return self.allocate(line)
+        except OutOfStockException:
+            return None
+
     def change_batch_quantity(self, ref: str, qty: int):
         batch = next(batch for batch in self.batches if batch.reference == ref)
         batch.purchased_quantity = qty
@@ -0,0 +1,45 @@
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+Quantities = npt.NDArray[np.int64]
+
+
+def first_fit(
+    capacities: Sequence[int], quantities: Quantities
+) -> npt.NDArray[np.intp]:
+    # Index of the first batch each line fits in when the lines are allocated
+    # one after the other, -1 for lines that fit nowhere. A batch takes lines
+    # independently of the batches after it, so batches are filled one at a
+    # time from the lines the batches before left.
+    assigned = np.full(len(quantities), -1, dtype=np.intp)
+    pending = np.arange(len(quantities))
+    for batch, capacity in enumerate(capacities):
+        if not len(pending):
+            break
+        taken = _fill(capacity, quantities[pending])
+        assigned[pending[taken]] = batch
+        pending = pending[~taken]
+    return assigned
+
+
+def _fill(capacity: int, quantities: Quantities) -> npt.NDArray[np.bool_]:
+    # Runs of lines that fit are taken at once from the cumulative sums. The
+    # line ending a run is skipped for the next one that fits what is left,
+    # which can only happen as often as the smallest lines fit in that rest.
+    taken = np.zeros(len(quantities), dtype=np.bool_)
+    filled = np.cumsum(quantities)
+    start = 0
+    while start < len(quantities):
+        before = filled[start - 1] if start else 0
+        end = int(np.searchsorted(filled[start:], capacity + before, side="right"))
+        end += start
+        taken[start:end] = True
+        if end > start:
+            capacity -= int(filled[end - 1] - before)
+        fits = quantities[end + 1 :] <= capacity
+        if end >= len(quantities) or not fits.any():
+            break
+        start = end + 1 + int(fits.argmax())
+    return taken
@@ -0,0 +1,33 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from allocation.adapter.database import warm_up
+from allocation.adapter.email_sender import MailhogEmailSender
+from allocation.adapter.unit_of_work import UnitOfWork, engine
+from allocation.bootstrap import bootstrap
+from allocation.config import settings
+from allocation.service import views
+from allocation.service.message_bus import MessageBus
+
+
+@asynccontextmanager
+async def bus_worker() -> AsyncIterator[MessageBus]:
+    # Runs in a spawned process, the engine and its pool are this worker's own.
+    bus = bootstrap(
+        start_orm_mapping=True,
+        uow_class=UnitOfWork,
+        email_sender=MailhogEmailSender(),
+        handler_timeout=settings.HANDLER_TIMEOUT,
+        notification_timeout=settings.NOTIFICATION_TIMEOUT,
+    )
+    await warm_up(engine, settings.DATABASE_POOL_WARM_CONNECTIONS)
+    try:
+        yield bus
+    finally:
+        await engine.dispose()
+
+
+async def sku_of_batchref(batchref: str) -> Optional[str]:
+    # Read from the primary, the replica may not have a new batch yet.
+    async with UnitOfWork.SESSION_FACTORY() as session:
+        return await views.sku_of_batchref(batchref, session)
@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import signal
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional, Sequence
+
+from allocation import port
+from allocation.adapter.command_source import FileCommandSource, KafkaCommandSource
+from allocation.adapter.outbox import converter, specialize_converter
+from allocation.config import settings
+from allocation.domain.messages import commands
+from allocation.domain.messages.base import Command
+from allocation.port.command_source import Delivery
+from allocation.service import exceptions
+from allocation.service.message_bus import MessageBus
+from allocation.service.sharding import ShardedBus
+from loguru import logger
+
+COMMAND_MAP: dict[str, type[Command]] = {
+    command_type.__name__: command_type
+    for command_type in (
+        commands.Allocate,
+        commands.CreateBatch,
+        commands.ChangeBatchQuantity,
+    )
+}
+
+# Commands failing with these would fail again, they are skipped like an
+# HTTP client error. Other failures are retried, and once the attempts run out
+# the command is parked by the source and consumed past.
+REJECTED = (exceptions.InvalidSku, exceptions.ProductNotFound)
+
+
+def decode(delivery: Delivery) -> Command:
+    return converter.loads(delivery.payload, COMMAND_MAP[delivery.type])  # type: ignore
+
+
+@dataclass
+class CommandConsumer:
+    # Fetches commands in batches and dispatches them through the bus. Those of
+    # one partition are handled in order, partitions side by side, with at most
+    # concurrency commands in flight. A batch's offsets are committed once its
+    # commands and the messages they issued are handled.
+
+    source: port.command_source.CommandSource
+    bus: MessageBus | ShardedBus
+    batch_size: int = 100
+    concurrency: int = 8
+    poll_timeout: float = 1.0
+    timeout: Optional[float] = None
+    attempts: int = 3
+    retry_delay: float = 0.5
+
+    async def run(self, stop: asyncio.Event) -> None:
+        await self.source.start()
+        try:
+            while not stop.is_set():
+                await self.run_once()
+        finally:
+            await self.source.stop()
+
+    async def run_once(self) -> int:
+        deliveries = await self.source.fetch(self.batch_size, self.poll_timeout)
+        partitions: dict[Hashable, list[Delivery]] = {}
+        for delivery in deliveries:
+            partitions.setdefault(delivery.partition, []).append(delivery)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        hooked_tasks: list[asyncio.Future[Any]] = []
+        offsets: dict[Hashable, int] = {}
+        results = await asyncio.gather(
+            *(
+                self._consume_partition(
+                    partition, deliveries, semaphore, hooked_tasks, offsets
+                )
+                for partition, deliveries in partitions.items()
+            ),
+            return_exceptions=True,
+        )
+        await asyncio.gather(*hooked_tasks, return_exceptions=True)
+        await self.source.commit(offsets)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return len(deliveries)
+
+    async def _consume_partition(
+        self,
+        partition: Hashable,
+        deliveries: Sequence[Delivery],
+        semaphore: asyncio.Semaphore,
+        hooked_tasks: list[asyncio.Future[Any]],
+        offsets: dict[Hashable, int],
+    ) -> None:
+        for delivery in deliveries:
+            async with semaphore:
+                if (hooked_task := await self._dispatch(delivery)) is not None:
+                    hooked_tasks.append(hooked_task)
+            offsets[partition] = delivery.offset + 1
+
+    async def _dispatch(self, delivery: Delivery) -> Optional[asyncio.Future[Any]]:
+        try:
+            command = decode(delivery)
+        except Exception as e:
+            logger.error(f"[Undecodable command at {delivery.offset}] {e!r}")
+            return None
+        name = type(command).__name__
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return await self.bus.handle(
+                    command, return_hooked_task=True, timeout=self.timeout
+                )
+            except REJECTED as e:
+                logger.warning(f"[Rejected {name}] {e}")
+                return None
+            except Exception as e:
+                if attempt == self.attempts:
+                    logger.error(f"[Parked {name} at {delivery.offset}] {e!r}")
+                    await self.source.park(delivery, e)
+                    return None
+                logger.warning(f"[Retrying {name} at {delivery.offset}] {e!r}")
+                await asyncio.sleep(self.retry_delay * attempt)
+        return None
+
+
+def make_source(args: argparse.Namespace) -> port.command_source.CommandSource:
+    if args.source == "file":
+        return FileCommandSource(args.path)
+    if settings.KAFKA_BOOTSTRAP_SERVERS is None:
+        raise RuntimeError("KAFKA_BOOTSTRAP_SERVERS is not set.")
+    return KafkaCommandSource(
+        settings.KAFKA_BOOTSTRAP_SERVERS,
+        settings.COMMAND_TOPIC,
+        settings.COMMAND_CONSUMER_GROUP,
+    )
+
+
+async def consume(args: argparse.Namespace) -> None:
+    from allocation.adapter.email_sender import MailhogEmailSender
+    from allocation.adapter.unit_of_work import UnitOfWork, engine
+    from allocation.bootstrap import bootstrap
+    from allocation.entrypoint.bus_worker import bus_worker, sku_of_batchref
+
+    specialize_converter(COMMAND_MAP.values())
+    bus: MessageBus | ShardedBus
+    if settings.BUS_SHARDS:
+        bus = ShardedBus(
+            bus_worker, settings.BUS_SHARDS, sku_of_batchref=sku_of_batchref
+        )
+        bus.start()
+    else:
+        bus = bootstrap(
+            start_orm_mapping=True,
+            uow_class=UnitOfWork,
+            email_sender=MailhogEmailSender(),
+            handler_timeout=settings.HANDLER_TIMEOUT,
+            notification_timeout=settings.NOTIFICATION_TIMEOUT,
+        )
+    consumer = CommandConsumer(
+        make_source(args),
+        bus,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        timeout=settings.REQUEST_TIMEOUT,
+        attempts=settings.CONSUMER_ATTEMPTS,
+        retry_delay=settings.CONSUMER_RETRY_DELAY,
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    try:
+        await consumer.run(stop)
+    finally:
+        if isinstance(bus, ShardedBus):
+            await bus.stop()
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Handle commands from a queue.")
+    parser.add_argument("--source", choices=["kafka", "file"], default="kafka")
+    parser.add_argument("--path", help="JSON lines file read by the file source.")
+    parser.add_argument("--batch-size", type=int, default=settings.CONSUMER_BATCH_SIZE)
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.CONSUMER_CONCURRENCY
+    )
+    args = parser.parse_args()
+    if args.source == "file" and not args.path:
+        parser.error("--path is required by the file source")
+    asyncio.run(consume(args))
+
+
+if __name__ == "__main__":
+    main()
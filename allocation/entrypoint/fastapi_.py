@@ -1,25 +1,204 @@
+import asyncio
+import hmac
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager, closing, contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Awaitable
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
 
+import orjson
+from allocation.adapter.database import warm_up
 from allocation.adapter.email_sender import MailhogEmailSender
-from allocation.adapter.unit_of_work import UnitOfWork
+from allocation.adapter.orm import start_mappers
+from allocation.adapter.outbox import specialize_converter
+from allocation.adapter.recorder import MESSAGE_MAP, MessageRecorder
+from allocation.adapter.unit_of_work import UnitOfWork, engine, read_router
 from allocation.bootstrap import bootstrap
 from allocation.config import settings
 from allocation.domain.messages import commands
+from allocation.entrypoint.bus_worker import bus_worker, sku_of_batchref
 from allocation.service import exceptions, views
-from fastapi import FastAPI, status
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from allocation.service.loop_lag import LoopLagMonitor
+from allocation.service.message_bus import MessageBus
+from allocation.service.profiling import Sampler, write_profile
+from allocation.service.sharding import ShardedBus
+from allocation.service.tracing import (
+    ChromeTraceFileExporter,
+    MultiSpanExporter,
+    SpanExporter,
+)
+from fastapi import Depends, FastAPI, Header, Query, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from loguru import logger
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import configure_mappers
 from starlette.background import BackgroundTask
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 app = FastAPI(debug=False, version=settings.API_VERSION)
-bus_default_conf: dict[str, Any] = {
-    "start_orm_mapping": True,
-    "uow_class": UnitOfWork,
-    "email_sender": MailhogEmailSender(),
-}
-bus = bootstrap(**bus_default_conf)
+# Bootstrapped by the lifespan, which shuts down what it runs on.
+bus: MessageBus | ShardedBus
+
+
+def create_bus(stack: ExitStack) -> MessageBus | ShardedBus:
+    if settings.BUS_SHARDS:
+        # Messages are handled in worker processes, one per shard of the skus.
+        return ShardedBus(
+            bus_worker, settings.BUS_SHARDS, sku_of_batchref=sku_of_batchref
+        )
+    span_exporters: list[SpanExporter] = []
+    if settings.TRACE_FILE:
+        span_exporters.append(
+            stack.enter_context(closing(ChromeTraceFileExporter(settings.TRACE_FILE)))
+        )
+    if settings.RECORDING_FILE:
+        span_exporters.append(
+            stack.enter_context(closing(MessageRecorder(settings.RECORDING_FILE)))
+        )
+    return bootstrap(
+        # Mapped by the lifespan, where startup work is timed.
+        start_orm_mapping=False,
+        uow_class=UnitOfWork,
+        email_sender=MailhogEmailSender(),
+        executor=stack.enter_context(
+            ThreadPoolExecutor(max_workers=settings.HANDLER_THREAD_WORKERS)
+        ),
+        cpu_executor=(
+            stack.enter_context(
+                ProcessPoolExecutor(max_workers=settings.HANDLER_PROCESS_WORKERS)
+            )
+            if settings.HANDLER_PROCESS_WORKERS
+            else None
+        ),
+        handler_timeout=settings.HANDLER_TIMEOUT,
+        notification_timeout=settings.NOTIFICATION_TIMEOUT,
+        span_exporter=MultiSpanExporter(span_exporters) if span_exporters else None,
+    )
+
+
+loop_lag_monitor = LoopLagMonitor(warning_threshold=settings.LOOP_LAG_WARNING_THRESHOLD)
+
+
+class ProfilingMiddleware:
+    # Profiles a request, background tasks included, when it is picked by the
+    # sample rate or carries the profile token in the X-Profile header.
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sampler: Sampler,
+        directory: str,
+        sample_rate: float,
+        token: Optional[str],
+    ):
+        self.app = app
+        self.sampler = sampler
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token.encode() if token else None
+
+    def _sampled(self, scope: Scope) -> bool:
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and hmac.compare_digest(value, self.token):
+                    return True
+        return random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._sampled(scope):
+            await self.app(scope, receive, send)
+            return
+        with self.sampler.profiling(f"{scope['method']} {scope['path']}") as profile:
+            try:
+                await asyncio.create_task(self.app(scope, receive, send))  # type: ignore
+            finally:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, write_profile, profile, self.directory
+                )
+
+
+sampler: Optional[Sampler] = None
+if settings.PROFILE_DIR:
+    sampler = Sampler(interval=settings.PROFILE_INTERVAL)
+    app.add_middleware(
+        ProfilingMiddleware,
+        sampler=sampler,
+        directory=settings.PROFILE_DIR,
+        sample_rate=settings.PROFILE_SAMPLE_RATE,
+        token=settings.PROFILE_TOKEN,
+    )
+
+
+@dataclass
+class StartupTimings:
+
+    phases: dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+            logger.info(f"[Startup] {name} took {self.phases[name] * 1000:.1f}ms")
+
+
+async def warm_up_read_statements() -> None:
+    # The read engine has a compiled cache of its own.
+    async with await read_router.session() as session:
+        await views.allocations(order_id="", session=session)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Everything the first requests would otherwise pay for is done before the
+    # server accepts connections: mapping, codecs, connections and statements.
+    global bus
+    timings = StartupTimings()
+    with ExitStack() as stack:
+        with timings.phase("bus"):
+            bus = create_bus(stack)
+        with timings.phase("mappers"):
+            start_mappers()
+            configure_mappers()
+        with timings.phase("codecs"):
+            specialize_converter(MESSAGE_MAP.values())
+        with timings.phase("connections"):
+            await asyncio.gather(
+                warm_up(engine, settings.DATABASE_POOL_WARM_CONNECTIONS),
+                warm_up(
+                    read_router.replica, settings.READ_DATABASE_POOL_WARM_CONNECTIONS
+                ),
+            )
+        with timings.phase("statements"):
+            await asyncio.gather(
+                UnitOfWork.compile_statements(), warm_up_read_statements()
+            )
+        if isinstance(bus, ShardedBus):
+            with timings.phase("bus workers"):
+                bus.start()
+        app.state.startup_timings = timings.phases
+        logger.info(f"[Startup] ready in {sum(timings.phases.values()) * 1000:.1f}ms")
+
+        loop_lag_monitor.start()
+        if sampler is not None:
+            sampler.install(asyncio.get_running_loop())
+        try:
+            yield
+        finally:
+            await loop_lag_monitor.stop()
+            if isinstance(bus, ShardedBus):
+                await bus.stop()
+            if sampler is not None:
+                sampler.stop()
+
+
+# FastAPI takes no lifespan argument before 0.93, starlette's router does.
+app.router.lifespan_context = lifespan
 
 
 class AwaitableBackgroundTask(BackgroundTask):
@@ -40,7 +219,8 @@ class AddBatchRequest(BaseModel):
 @app.post("/add_batch")
 async def add_batch(req: AddBatchRequest):
     await bus.handle(
-        commands.CreateBatch(ref=req.ref, sku=req.sku, qty=req.qty, eta=req.eta)
+        commands.CreateBatch(ref=req.ref, sku=req.sku, qty=req.qty, eta=req.eta),
+        timeout=settings.REQUEST_TIMEOUT,
     )
     return "OK"
 
@@ -63,11 +243,16 @@ async def allocate(req: AllocateRequest):
         task = await bus.handle(
             commands.Allocate(order_id=req.order_id, sku=req.sku, qty=req.qty),
             return_hooked_task=True,
+            timeout=settings.REQUEST_TIMEOUT,
         )
     except exceptions.InvalidSku as e:
         return JSONResponse(
             content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST
         )
+    except exceptions.HandlerTimeout as e:
+        return JSONResponse(
+            content={"message": str(e)}, status_code=status.HTTP_504_GATEWAY_TIMEOUT
+        )
     return JSONResponse(
         content={"message": "OK"},
         status_code=status.HTTP_201_CREATED,
@@ -75,16 +260,94 @@ async def allocate(req: AllocateRequest):
     )
 
 
-@app.get("/allocations/{order_id}")
-async def list_allocation(order_id: str):
+async def read_session() -> AsyncIterator[AsyncSession]:
+    async with await read_router.session() as session:
+        yield session
+
+
+NDJSON = "application/x-ndjson"
+
+
+@app.get("/allocations/{order_id}", response_class=ORJSONResponse)
+async def list_allocation(
+    order_id: str,
+    request: Request,
+    after_sku: Optional[str] = None,
+    after_qty: Optional[int] = None,
+    limit: Optional[int] = Query(
+        default=None, ge=1, le=settings.ALLOCATIONS_PAGE_MAX_SIZE
+    ),
+    accept: Optional[str] = Header(default=None),
+    session: AsyncSession = Depends(read_session),
+):
+    if accept and NDJSON in accept:
+        return await stream_allocations(order_id, session)
+    after = None
+    if after_sku is not None and after_qty is not None:
+        after = (after_sku, after_qty)
+    elif after_sku is not None or after_qty is not None:
+        return ORJSONResponse(
+            content={"message": "after_sku and after_qty are given together"},
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
     result = await views.allocations(
-        order_id=order_id, session=UnitOfWork.SESSION_FACTORY()
+        order_id=order_id, session=session, after=after, limit=limit
     )
-    if not result:
-        return JSONResponse(
+    if not result and after is None:
+        return ORJSONResponse(
             content={"message": f"order {order_id} not found"},
             status_code=status.HTTP_404_NOT_FOUND,
         )
-    return JSONResponse(
-        content=jsonable_encoder(result), status_code=status.HTTP_200_OK
+    headers = {}
+    if limit is not None and len(result) == limit:
+        last = result[-1]
+        next_page = request.url.include_query_params(
+            after_sku=last["sku"], after_qty=last["qty"]
+        )
+        headers["Link"] = f'<{next_page}>; rel="next"'
+    return ORJSONResponse(
+        content=result, status_code=status.HTTP_200_OK, headers=headers
+    )
+
+
+async def stream_allocations(order_id: str, session: AsyncSession) -> Response:
+    chunks = views.stream_allocations(
+        order_id=order_id,
+        session=session,
+        chunk_size=settings.ALLOCATIONS_STREAM_CHUNK_SIZE,
     )
+    # The first chunk is awaited here so that a missing order is still a 404.
+    first = await anext(chunks, None)
+    if first is None:
+        return ORJSONResponse(
+            content={"message": f"order {order_id} not found"},
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+
+    async def lines() -> AsyncIterator[bytes]:
+        chunk: Optional[list[dict[str, Any]]] = first
+        while chunk is not None:
+            yield b"".join(orjson.dumps(row) + b"\n" for row in chunk)
+            chunk = await anext(chunks, None)
+
+    return StreamingResponse(lines(), media_type=NDJSON)
+
+
+@app.get("/stock", response_class=ORJSONResponse)
+async def list_stocks(
+    sku: list[str] = Query(default=[]),
+    session: AsyncSession = Depends(read_session),
+):
+    result = await views.stocks(skus=sku, session=session) if sku else {}
+    return ORJSONResponse(content=result, status_code=status.HTTP_200_OK)
+
+
+@app.get("/stock/{sku}", response_class=ORJSONResponse)
+async def get_stock(sku: str, session: AsyncSession = Depends(read_session)):
+    result = await views.stock(sku=sku, session=session)
+    if result is None:
+        return ORJSONResponse(
+            content={"message": f"sku {sku} not found"},
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+    return ORJSONResponse(content=result, status_code=status.HTTP_200_OK)
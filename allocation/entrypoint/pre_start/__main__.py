@@ -0,0 +1,49 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from allocation.adapter.unit_of_work import engine
+from loguru import logger
+
+from . import add_connector, create_table, migrate, wait_database
+
+
+async def run_step(
+    name: str, step: Callable[[], Awaitable[Any]], *after: "asyncio.Task[None]"
+) -> None:
+    await asyncio.gather(*after)
+    started = time.perf_counter()
+    await step()
+    logger.info(
+        f"[Pre-start] {name} took {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+
+
+async def main() -> None:
+    # The database and Kafka Connect come up independently. Tables missing are
+    # created, then existing ones migrated. The connector is registered last,
+    # once the outbox table it captures is migrated.
+    started = time.perf_counter()
+    try:
+        database = asyncio.create_task(run_step("database", wait_database.init))
+        tables = asyncio.create_task(run_step("tables", create_table.init, database))
+        migrations = asyncio.create_task(run_step("migrations", migrate.init, tables))
+        connect = asyncio.create_task(
+            run_step("kafka connect", lambda: asyncio.to_thread(add_connector.wait))
+        )
+        connector = asyncio.create_task(
+            run_step(
+                "connector",
+                lambda: asyncio.to_thread(add_connector.init),
+                migrations,
+                connect,
+            )
+        )
+        await asyncio.gather(database, tables, migrations, connect, connector)
+    finally:
+        await engine.dispose()
+    logger.info(f"[Pre-start] done in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,25 +3,30 @@ from json import loads
 import requests
 from allocation.config import settings
 from loguru import logger
-from tenacity import retry, stop, wait
 
-max_tries = 10
-wait_seconds = 6
+from .backoff import backoff
 
+url = f"http://{settings.KAFKA_CONNECT_HOST}:{settings.KAFKA_CONNECT_PORT}"
+# (connect, read) in seconds, so that a hung attempt is retried by the backoff.
+timeout = (1, 10)
 
-@retry(
-    stop=stop.stop_after_attempt(max_tries),
-    wait=wait.wait_fixed(wait_seconds),
-)
+
+@backoff
+def wait() -> None:
+    requests.get(url, timeout=timeout).raise_for_status()
+
+
+@backoff
 def init():
 
     response = requests.post(
-        url=f"http://{settings.KAFKA_CONNECT_HOST}:{settings.KAFKA_CONNECT_PORT}/connectors",
+        url=f"{url}/connectors",
         json=loads(settings.KAFKA_CONNECTER_CONFIGURATION),
+        timeout=timeout,
     )
     assert response.status_code == 201 or response.status_code == 409
 
-    print(loads(response.content))
+    logger.info(f"{loads(response.content)}")
 
     match response.status_code:
         case 201:
@@ -0,0 +1,9 @@
+from tenacity import retry, stop, wait
+
+# Retries after 5ms first, doubling up to a second between attempts, so that a
+# service coming up is noticed right away and a slow one is not hammered.
+backoff = retry(
+    stop=stop.stop_after_delay(60),
+    wait=wait.wait_exponential(multiplier=0.005, max=1),
+    reraise=True,
+)
@@ -1,21 +1,14 @@
 import asyncio
 
 from allocation.adapter.orm import mapper_registry
-from allocation.config import settings
+from allocation.adapter.unit_of_work import engine
 from loguru import logger
-from sqlalchemy.ext.asyncio import create_async_engine
-from tenacity import retry, stop, wait
 
-max_tries = 10
-wait_seconds = 6
+from .backoff import backoff
 
 
-@retry(
-    stop=stop.stop_after_attempt(max_tries),
-    wait=wait.wait_fixed(wait_seconds),
-)
+@backoff
 async def init() -> None:
-    engine = create_async_engine(settings.DATABASE_URL, echo=True)
     async with engine.connect() as conn:
         await conn.run_sync(mapper_registry.metadata.create_all)
         await conn.commit()
@@ -23,7 +16,10 @@ async def init() -> None:
 
 async def main() -> None:
     logger.info("Create database table...")
-    await init()
+    try:
+        await init()
+    finally:
+        await engine.dispose()
     logger.info("Database table created.")
 
 
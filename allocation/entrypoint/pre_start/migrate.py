@@ -0,0 +1,88 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from allocation.adapter.orm import allocations_view, mapper_registry
+from allocation.adapter.read_model import ALLOCATIONS, SkuRange
+from allocation.adapter.unit_of_work import engine
+from loguru import logger
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .backoff import backoff
+
+Migration = Callable[[AsyncConnection], Awaitable[None]]
+
+
+async def columns(conn: AsyncConnection, table: str) -> set[str]:
+    return await conn.run_sync(
+        lambda sync_conn: {
+            column["name"] for column in inspect(sync_conn).get_columns(table)
+        }
+    )
+
+
+async def key_allocations_view_by_order_line(conn: AsyncConnection) -> None:
+    # Rows keyed by order and sku merged the lines of an order that differ in
+    # quantity only. The view is recreated keyed by order line and recomputed
+    # from the allocations.
+    if "qty" in await columns(conn, "allocations_view"):
+        return
+    await conn.execute(text("DROP TABLE allocations_view"))
+    await conn.run_sync(allocations_view.create)
+    await conn.execute(
+        text(
+            f"INSERT INTO allocations_view ({', '.join(ALLOCATIONS.columns)})"
+            f" {ALLOCATIONS.select(SkuRange(None, None))}"
+        )
+    )
+
+
+async def order_outbox_events(conn: AsyncConnection) -> None:
+    # Envelopes put before are positioned as they were stored.
+    if "position" in await columns(conn, "events"):
+        return
+    if conn.dialect.name == "postgresql":
+        await conn.execute(
+            text(
+                "ALTER TABLE events"
+                " ADD COLUMN position BIGINT GENERATED BY DEFAULT AS IDENTITY"
+            )
+        )
+    else:
+        await conn.execute(text("ALTER TABLE events ADD COLUMN position BIGINT"))
+        await conn.execute(text("UPDATE events SET position = rowid"))
+
+
+async def create_missing_indexes(conn: AsyncConnection) -> None:
+    # Indexes added to tables that already exist, which create_all skips.
+    for table in mapper_registry.metadata.sorted_tables:
+        for index in table.indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+
+
+# Applied in order, each does nothing on a schema it was already applied to.
+MIGRATIONS: list[Migration] = [
+    key_allocations_view_by_order_line,
+    order_outbox_events,
+    create_missing_indexes,
+]
+
+
+@backoff
+async def init() -> None:
+    async with engine.begin() as conn:
+        for migration in MIGRATIONS:
+            await migration(conn)
+
+
+async def main() -> None:
+    logger.info("Migrate database schema...")
+    try:
+        await init()
+    finally:
+        await engine.dispose()
+    logger.info("Database schema migrated.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,28 +1,24 @@
 import asyncio
 
-from allocation.config import settings
+from allocation.adapter.unit_of_work import engine
 from loguru import logger
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import create_async_engine
-from tenacity import retry, stop, wait
 
-max_tries = 10
-wait_seconds = 6
+from .backoff import backoff
 
 
-@retry(
-    stop=stop.stop_after_attempt(max_tries),
-    wait=wait.wait_fixed(wait_seconds),
-)
+@backoff
 async def init() -> None:
-    engine = create_async_engine(settings.DATABASE_URL)
     async with engine.connect() as conn:
         await conn.execute(select(1))
 
 
 async def main() -> None:
     logger.info("Wait database...")
-    await init()
+    try:
+        await init()
+    finally:
+        await engine.dispose()
     logger.info("Database is running.")
 
 
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import time
+
+from allocation.adapter.read_model import (
+    AllocationsViewRebuilder,
+    StockViewRebuilder,
+    ViewRebuilder,
+)
+from allocation.adapter.unit_of_work import engine
+from loguru import logger
+
+REBUILDERS: dict[str, type[ViewRebuilder]] = {
+    "allocations_view": AllocationsViewRebuilder,
+    "stock_view": StockViewRebuilder,
+}
+
+
+async def run(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    try:
+        for view in args.view or REBUILDERS:
+            await run_one(view, args)
+    finally:
+        await engine.dispose()
+    logger.info(f"[View] done in {time.perf_counter() - started:.1f}s")
+
+
+async def run_one(view: str, args: argparse.Namespace) -> None:
+    rebuilder = REBUILDERS[view](
+        engine, chunks=args.chunks, concurrency=args.concurrency
+    )
+    if args.verify or args.dry_run:
+        drifted = await rebuilder.verify(repair=not args.dry_run)
+        for sku_range in drifted:
+            logger.warning(
+                f"[View drifted] {view} skus ({sku_range.low}, {sku_range.high}]"
+                f"{'' if args.dry_run else ' rewritten'}"
+            )
+        logger.info(
+            f"[View verified] {view} {len(drifted)}/{args.chunks} ranges drifted"
+        )
+    else:
+        await rebuilder.rebuild()
+        logger.info(f"[View rebuilt] {view}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the read model views from the write model."
+    )
+    parser.add_argument(
+        "--view",
+        action="append",
+        choices=list(REBUILDERS),
+        help="A view to rebuild, all of them when not given. May be repeated.",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Compare checksums by sku range and rewrite the ranges that differ.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report the sku ranges that differ.",
+    )
+    parser.add_argument("--chunks", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import asyncio
+import functools
+import signal
+
+from allocation.adapter.database import listening
+from allocation.adapter.orm import start_mappers
+from allocation.adapter.relay import KafkaPublisher, OutboxRelay
+from allocation.adapter.unit_of_work import UnitOfWork, engine
+from allocation.config import settings
+from loguru import logger
+
+
+async def relay() -> None:
+    if settings.KAFKA_BOOTSTRAP_SERVERS is None:
+        raise RuntimeError("KAFKA_BOOTSTRAP_SERVERS is not set.")
+    if not 0 <= settings.OUTBOX_RELAY_PARTITION < settings.OUTBOX_RELAY_PARTITIONS:
+        raise RuntimeError(
+            "OUTBOX_RELAY_PARTITION is not below OUTBOX_RELAY_PARTITIONS."
+        )
+    start_mappers()
+    publisher = KafkaPublisher(settings.KAFKA_BOOTSTRAP_SERVERS)
+    listen = None
+    if settings.OUTBOX_CHANNEL and engine.dialect.name == "postgresql":
+        listen = functools.partial(listening, engine, settings.OUTBOX_CHANNEL)
+    else:
+        logger.warning("[Relay] no notification channel, polling only")
+    outbox_relay = OutboxRelay(
+        UnitOfWork.SESSION_FACTORY,
+        publisher,
+        listen=listen,
+        batch_size=settings.OUTBOX_RELAY_BATCH_SIZE,
+        poll_interval=settings.OUTBOX_RELAY_POLL_INTERVAL,
+        partition=settings.OUTBOX_RELAY_PARTITION,
+        partitions=settings.OUTBOX_RELAY_PARTITIONS,
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    await publisher.start()
+    try:
+        await outbox_relay.run(stop)
+    finally:
+        await publisher.stop()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(relay())
@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from email.message import EmailMessage
+from typing import Any, Iterable, Optional
+from uuid import uuid4
+
+from allocation import port
+from allocation.adapter.memory import InMemoryUnitOfWork, VersionConflict
+from allocation.adapter.recorder import read_recording
+from allocation.bootstrap import bootstrap
+from allocation.domain.messages.base import Message
+from sqlalchemy.orm.exc import StaleDataError
+
+
+class NullEmailSender(port.email_sender.EmailSender):
+    async def send(self, _message: EmailMessage):
+        ...
+
+
+def is_conflict(exc: Exception) -> bool:
+    if isinstance(exc, (StaleDataError, VersionConflict)):
+        return True
+    return any(
+        reason in str(exc)
+        for reason in ("could not serialize access", "database is locked")
+    )
+
+
+@dataclass
+class ReplayReport:
+
+    latencies: list[float] = field(default_factory=list)
+    errors: Counter[str] = field(default_factory=Counter)
+    conflicts: int = 0
+    elapsed: float = 0.0
+
+    async def exception_hook(self, msg: Message, handler: Any, exc: Exception):
+        self.errors[type(exc).__name__] += 1
+        if is_conflict(exc):
+            self.conflicts += 1
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "messages": len(self.latencies),
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "latency": {f"p{p}": self.percentile(p) for p in (50, 90, 99, 100)},
+            "conflicts": self.conflicts,
+            "errors": dict(self.errors),
+        }
+
+
+def root_messages(path: str) -> list[tuple[float, Message]]:
+    # Follow-up messages are reproduced by the bus itself, so only the
+    # messages that entered the bus from outside are replayed.
+    seen: set[Any] = set()
+    roots: list[tuple[float, Message]] = []
+    for record in read_recording(path):
+        message = record.message
+        if message.causation_id is not None or message.uid in seen:
+            continue
+        seen.add(message.uid)
+        roots.append((record.start, message))
+    roots.sort(key=lambda root: root[0])
+    return roots
+
+
+async def replay(
+    messages: Iterable[tuple[float, Message]],
+    uow_class: type[port.unit_of_work.UnitOfWork],
+    speed: float = 1.0,
+    concurrency: Optional[int] = None,
+    start_orm_mapping: bool = True,
+) -> ReplayReport:
+    report = ReplayReport()
+    bus = bootstrap(
+        start_orm_mapping=start_orm_mapping,
+        uow_class=uow_class,
+        email_sender=NullEmailSender(),
+        pre_hook=None,
+        post_hook=None,
+        exception_hook=report.exception_hook,
+    )
+    # Replaying at original speed is open-loop, as fast as possible is bounded.
+    if concurrency is None and not speed:
+        concurrency = 1
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def handle(message: Message, delay: float):
+        await asyncio.sleep(delay)
+        if semaphore:
+            await semaphore.acquire()
+        message = replace(message, uid=uuid4())
+        started = time.perf_counter()
+        try:
+            await bus.handle(message)
+        except Exception:
+            pass
+        finally:
+            if semaphore:
+                semaphore.release()
+        report.latencies.append(time.perf_counter() - started)
+
+    messages = list(messages)
+    first = messages[0][0] if messages else 0.0
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            handle(message, (at - first) / speed if speed else 0)
+            for at, message in messages
+        )
+    )
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded bus traffic.")
+    parser.add_argument("recording")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Multiple of the original speed, 0 replays as fast as possible.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Messages in flight, unbounded at original speed and 1 otherwise.",
+    )
+    parser.add_argument("--backend", choices=["postgres", "memory"], default="postgres")
+    args = parser.parse_args()
+
+    uow_class: type[port.unit_of_work.UnitOfWork]
+    if args.backend == "memory":
+        uow_class = InMemoryUnitOfWork.with_store()
+    else:
+        from allocation.adapter.unit_of_work import UnitOfWork
+
+        uow_class = UnitOfWork
+    report = asyncio.run(
+        replay(
+            root_messages(args.recording),
+            uow_class=uow_class,
+            speed=args.speed,
+            concurrency=args.concurrency,
+            start_orm_mapping=args.backend != "memory",
+        )
+    )
+    print(json.dumps(report.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
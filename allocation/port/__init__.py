@@ -1,2 +1,2 @@
 # type: ignore
-from . import email_sender, outbox, repository, unit_of_work
\ No newline at end of file
+from . import command_source, email_sender, outbox, read_model, repository, unit_of_work
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from typing import Hashable, Mapping, Protocol, Sequence
+
+
+@dataclass(frozen=True)
+class Delivery:
+    partition: Hashable
+    offset: int
+    type: str
+    payload: str | bytes
+
+
+class CommandSource(Protocol):
+    async def start(self) -> None:
+        ...
+
+    async def fetch(self, _max_records: int, _timeout: float) -> Sequence[Delivery]:
+        ...
+
+    # Offsets of the next delivery to read, by partition.
+    async def commit(self, _offsets: Mapping[Hashable, int]) -> None:
+        ...
+
+    # Sets a delivery that kept failing aside, for it to be looked into.
+    async def park(self, _delivery: Delivery, _error: BaseException) -> None:
+        ...
+
+    async def stop(self) -> None:
+        ...
@@ -0,0 +1,26 @@
+from datetime import date
+from typing import Iterable, Optional, Protocol
+
+
+class AllocationsView(Protocol):
+    async def add(self, _order_id: str, _sku: str, _qty: int, _batchref: str) -> None:
+        ...
+
+    # Order lines, as order id, sku and quantity.
+    async def remove_many(self, _lines: Iterable[tuple[str, str, int]]) -> None:
+        ...
+
+
+class StockView(Protocol):
+    async def add_batch(
+        self, _sku: str, _batchref: str, _eta: Optional[date], _qty: int
+    ) -> None:
+        ...
+
+    async def change_batch_quantity(self, _sku: str, _batchref: str, _qty: int) -> None:
+        ...
+
+    # Sets the quantity allocated from the batch to that of its lines in the
+    # allocations view, as changed in the same unit of work.
+    async def recount_allocated(self, _sku: str, _batchref: str) -> None:
+        ...
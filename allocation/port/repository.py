@@ -1,4 +1,4 @@
-from typing import Optional, Protocol, TypeVar
+from typing import Iterable, Optional, Protocol, TypeVar
 
 from allocation.domain.models import Product
 
@@ -34,3 +34,9 @@ class ProductRepository(CollectionOrientedRepository[Product, str], Protocol):
 
     async def get_by_batchref(self, batchref: str) -> Optional[Product]:
         ...
+
+    async def get_many(self, skus: Iterable[str]) -> list[Product]:
+        ...
+
+    async def get_many_by_batchrefs(self, batchrefs: Iterable[str]) -> list[Product]:
+        ...
@@ -4,12 +4,14 @@ from typing import Optional, Protocol
 from allocation.domain.messages.events import Event
 from typing_extensions import Self
 
-from . import outbox, repository
+from . import outbox, read_model, repository
 
 
 class UnitOfWork(Protocol):
 
     products: repository.ProductRepository
+    allocations_view: read_model.AllocationsView
+    stock_view: read_model.StockView
     _outbox: outbox.Outbox[Event]
 
     async def __aenter__(self) -> Self:
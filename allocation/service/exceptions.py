@@ -4,3 +4,11 @@ class InvalidSku(Exception):
 
 class ProductNotFound(Exception):
     ...
+
+
+class HandlerTimeout(Exception):
+    ...
+
+
+class SchemaChanged(Exception):
+    ...
@@ -1,17 +1,25 @@
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+from typing import Any, Optional, Sequence
 
 from allocation import port
 from allocation.adapter.email_sender import build_email_message
-from allocation.adapter.unit_of_work import UnitOfWork
 from allocation.domain import models
 from allocation.domain.messages import commands, events
 from allocation.service.message_bus import issue
-from sqlalchemy import text
+from tenacity import retry, retry_if_exception_type, stop_after_attempt
 
 from . import exceptions
 
+# Projections waiting on a view that a rebuild swaps out fail once the new one
+# is in place. They are idempotent and simply run again.
+retry_on_schema_change = retry(
+    retry=retry_if_exception_type(exceptions.SchemaChanged),
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+
 
 async def add_batch(
     cmd: commands.CreateBatch, uow_factory: type[port.unit_of_work.UnitOfWork], **_: Any
@@ -30,6 +38,15 @@ async def add_batch(
                 _allocations=set(),
             )
         )
+        issue(
+            events.BatchCreated(
+                aggregate_id=cmd.sku,
+                sku=cmd.sku,
+                batchref=cmd.ref,
+                qty=cmd.qty,
+                eta=cmd.eta,
+            )
+        )
         await uow.commit()
 
 
@@ -43,30 +60,56 @@ async def allocate(
         product = await uow.products.get(sku=line.sku)
         if product is None:
             raise exceptions.InvalidSku(f"Invalid sku {line.sku}")
-        try:
-            batchref = product.allocate(line)
-            issue(
-                events.Allocated(
-                    aggregate_id=product.sku,
-                    order_id=line.order_id,
-                    sku=line.sku,
-                    qty=line.qty,
-                    batchref=batchref,
-                )
-            )
+        if _allocate_line(product, line):
             await uow.commit()
-        except models.product.OutOfStockException:
-            issue(events.OutOfStock(aggregate_id=product.sku, sku=line.sku))
-            return
 
 
 async def reallocate(
-    evt: events.Deallocated, uow_factory: type[port.unit_of_work.UnitOfWork], **_: Any
+    evts: Sequence[events.Deallocated],
+    uow_factory: type[port.unit_of_work.UnitOfWork],
+    **_: Any,
 ):
-    await allocate(
-        commands.Allocate(order_id=evt.order_id, sku=evt.sku, qty=evt.qty),
-        uow_factory=uow_factory,
+    lines = [
+        models.OrderLine(order_id=evt.order_id, sku=evt.sku, qty=evt.qty)
+        for evt in evts
+    ]
+    async with uow_factory() as uow:
+        product = await uow.products.get(sku=lines[0].sku)
+        if product is None:
+            raise exceptions.InvalidSku(f"Invalid sku {lines[0].sku}")
+        batchrefs = product.allocate_many(lines)
+        allocated = [
+            _issue_allocation(product, line, batchref)
+            for line, batchref in zip(lines, batchrefs)
+        ]
+        if any(allocated):
+            await uow.commit()
+
+
+def _allocate_line(product: models.Product, line: models.OrderLine) -> bool:
+    try:
+        batchref = product.allocate(line)
+    except models.product.OutOfStockException:
+        batchref = None
+    return _issue_allocation(product, line, batchref)
+
+
+def _issue_allocation(
+    product: models.Product, line: models.OrderLine, batchref: Optional[str]
+) -> bool:
+    if batchref is None:
+        issue(events.OutOfStock(aggregate_id=product.sku, sku=line.sku))
+        return False
+    issue(
+        events.Allocated(
+            aggregate_id=product.sku,
+            order_id=line.order_id,
+            sku=line.sku,
+            qty=line.qty,
+            batchref=batchref,
+        )
     )
+    return True
 
 
 async def change_batch_quantity(
@@ -79,6 +122,11 @@ async def change_batch_quantity(
         if not product:
             raise exceptions.ProductNotFound(f"Product not found (batchref={cmd.ref})")
         deallocated_lines = product.change_batch_quantity(ref=cmd.ref, qty=cmd.qty)
+        issue(
+            events.BatchQuantityChanged(
+                aggregate_id=product.sku, sku=product.sku, batchref=cmd.ref, qty=cmd.qty
+            )
+        )
         for line in deallocated_lines:
             issue(
                 events.Deallocated(
@@ -86,6 +134,7 @@ async def change_batch_quantity(
                     order_id=line.order_id,
                     sku=line.sku,
                     qty=line.qty,
+                    batchref=cmd.ref,
                 )
             )
         await uow.commit()
@@ -94,7 +143,9 @@ async def change_batch_quantity(
 async def send_out_of_stock_notification(
     evt: events.OutOfStock, email_sender: port.email_sender.EmailSender, **_: Any
 ):
-    message = build_email_message(
+    # Building the MIME message is sync work, it is kept off the event loop.
+    message = await asyncio.to_thread(
+        build_email_message,
         from_="from@example.com",
         to="to@example.com",
         subject=f"Out of stock for {evt.sku}",
@@ -103,27 +154,47 @@ async def send_out_of_stock_notification(
     await email_sender.send(message)
 
 
+@retry_on_schema_change
 async def add_allocation_to_read_model(
-    evt: events.Allocated, uow_factory: type[UnitOfWork], **_: Any
+    evt: events.Allocated, uow_factory: type[port.unit_of_work.UnitOfWork], **_: Any
 ):
     async with uow_factory() as uow:
-        await uow._session.execute(  # type: ignore
-            text(
-                "INSERT INTO allocations_view (order_id, sku, batchref) VALUES (:order_id, :sku, :batchref)"
-            ),
-            dict(order_id=evt.order_id, sku=evt.sku, batchref=evt.batchref),
-        )
+        await uow.allocations_view.add(evt.order_id, evt.sku, evt.qty, evt.batchref)
+        await uow.stock_view.recount_allocated(evt.sku, evt.batchref)
         await uow.commit()
 
 
+@retry_on_schema_change
 async def remove_allocation_from_read_model(
-    evt: events.Deallocated, uow_factory: type[UnitOfWork], **_: Any
+    evts: Sequence[events.Deallocated],
+    uow_factory: type[port.unit_of_work.UnitOfWork],
+    **_: Any,
 ):
     async with uow_factory() as uow:
-        await uow._session.execute(  # type: ignore
-            text(
-                "DELETE FROM allocations_view WHERE order_id = :order_id AND sku = :sku"
-            ),
-            dict(order_id=evt.order_id, sku=evt.sku),
+        await uow.allocations_view.remove_many(
+            (evt.order_id, evt.sku, evt.qty) for evt in evts
         )
+        for sku, batchref in dict.fromkeys((evt.sku, evt.batchref) for evt in evts):
+            if batchref is not None:
+                await uow.stock_view.recount_allocated(sku, batchref)
+        await uow.commit()
+
+
+@retry_on_schema_change
+async def add_batch_to_stock_view(
+    evt: events.BatchCreated, uow_factory: type[port.unit_of_work.UnitOfWork], **_: Any
+):
+    async with uow_factory() as uow:
+        await uow.stock_view.add_batch(evt.sku, evt.batchref, evt.eta, evt.qty)
+        await uow.commit()
+
+
+@retry_on_schema_change
+async def change_batch_quantity_in_stock_view(
+    evt: events.BatchQuantityChanged,
+    uow_factory: type[port.unit_of_work.UnitOfWork],
+    **_: Any,
+):
+    async with uow_factory() as uow:
+        await uow.stock_view.change_batch_quantity(evt.sku, evt.batchref, evt.qty)
         await uow.commit()
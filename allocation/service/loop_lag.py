@@ -0,0 +1,62 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import Optional
+
+from loguru import logger
+from typing_extensions import Self
+
+
+@dataclass
+class LoopLagMonitor:
+
+    interval: float = 0.05
+    warning_threshold: Optional[float] = None
+    lags: deque[float] = field(default_factory=lambda: deque(maxlen=4096))
+    _task: Optional[asyncio.Task[None]] = field(default=None, init=False)
+
+    async def __aenter__(self) -> Self:
+        self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.stop()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.lags.append(lag)
+            if self.warning_threshold is not None and lag > self.warning_threshold:
+                logger.warning(f"[Event loop lag] {lag * 1000:.1f}ms")
+
+    @property
+    def max_lag(self) -> float:
+        return max(self.lags, default=0.0)
+
+    def percentile(self, p: float) -> float:
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
@@ -1,7 +1,11 @@
 import asyncio
+import functools
 import inspect
-from contextvars import ContextVar, Token
-from dataclasses import field
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, Token, copy_context
+from dataclasses import field, replace
 from inspect import Parameter
 from types import TracebackType
 from typing import (
@@ -9,15 +13,22 @@ from typing import (
     Awaitable,
     Callable,
     ContextManager,
+    Hashable,
     Iterable,
+    Iterator,
     Literal,
+    Mapping,
     Optional,
     Protocol,
+    Sequence,
     TypeVar,
     overload,
 )
+from uuid import UUID
 
 from allocation.domain.messages.base import Command, Event, Message
+from allocation.service.exceptions import HandlerTimeout
+from allocation.service.tracing import Span, SpanExporter
 from typing_extensions import Self
 
 
@@ -36,17 +47,66 @@ class _Handler(Protocol[M_contra]):
 Handler = _Handler
 
 
+class _BatchHandler(Protocol[M_contra]):
+
+    __name__: str
+
+    async def __call__(self, _msgs: Sequence[M_contra], **_: Any) -> None:
+        ...
+
+
+BatchHandler = _BatchHandler
+
+
+class _SyncHandler(Protocol[M_contra]):
+
+    __name__: str
+
+    def __call__(self, _msg: M_contra, **_: Any) -> None:
+        ...
+
+
+SyncHandler = _SyncHandler
+
+
 # Message Catch Context
-_messages_context_var: ContextVar[set[Message]] = ContextVar("messages")
+class IssuedMessages:
+    # Messages in the order they were issued, each uid kept once. Messages are
+    # told apart by uid only, so that no payload is hashed on the way.
+
+    __slots__ = ("_messages", "_uids")
+
+    def __init__(self, messages: Iterable[Message] = ()) -> None:
+        self._messages: list[Message] = []
+        self._uids: set[UUID] = set()
+        self.extend(messages)
+
+    def append(self, message: Message) -> None:
+        if message.uid not in self._uids:
+            self._uids.add(message.uid)
+            self._messages.append(message)
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+
+_messages_context_var: ContextVar[IssuedMessages] = ContextVar("messages")
 
 
 class MessageCatcher(ContextManager["MessageCatcher"]):
 
-    _token: Token[set[Message]] = field(init=False)
-    issued_messages: set[Message] = field(init=False)
+    _token: Token[IssuedMessages] = field(init=False)
+    issued_messages: IssuedMessages = field(init=False)
 
     def __enter__(self) -> Self:
-        self._token = _messages_context_var.set(set())
+        self._token = _messages_context_var.set(IssuedMessages())
         return self
 
     def __exit__(
@@ -59,16 +119,93 @@ class MessageCatcher(ContextManager["MessageCatcher"]):
         _messages_context_var.reset(self._token)
 
 
+# Message being handled in the current context, the cause of issued messages.
+_cause_context_var: ContextVar[Optional[Message]] = ContextVar("cause", default=None)
+
+
 def issue(message: Message):
-    _messages_context_var.get().add(message)
+    if (cause := _cause_context_var.get()) and message.causation_id is None:
+        message = replace(
+            message, correlation_id=cause.trace_id, causation_id=cause.uid
+        )
+    _messages_context_var.get().append(message)
 
 
-def get_issued_messages():
+def get_issued_messages() -> IssuedMessages:
     return _messages_context_var.get()
 
 
+@contextmanager
+def _own_messages() -> Iterator[None]:
+    # Handlers of one message run side by side in copies of the same context.
+    # Each gets its own collection so that a unit of work only commits the
+    # events issued by its own handler, they are all passed on afterwards.
+    issued = get_issued_messages()
+    with MessageCatcher():
+        try:
+            yield
+        finally:
+            issued.extend(_messages_context_var.get())
+
+
+# Deadline Context
+_deadline_context_var: ContextVar[Optional[float]] = ContextVar(
+    "deadline", default=None
+)
+
+
+async def within_deadline(awaitable: Awaitable[Any], timeout: Optional[float]):
+    loop = asyncio.get_running_loop()
+    if (deadline := _deadline_context_var.get()) is not None:
+        remaining = deadline - loop.time()
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    if timeout is None:
+        return await awaitable
+    timeout = max(timeout, 0)
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise HandlerTimeout(f"Handler timed out after {timeout:.3f}s")
+
+
 # Handle methods
 M = TypeVar("M", bound=Message)
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def cpu_bound(handler: F) -> F:
+    setattr(handler, "__cpu_bound__", True)
+    return handler
+
+
+def _run_isolated(handler: Callable[..., Any], message: Any, deps: dict[str, Any]):
+    with MessageCatcher() as message_catcher:
+        handler(message, **deps)
+    return list(message_catcher.issued_messages)
+
+
+def offload(handler: Callable[..., Any], executor: Optional[Executor]) -> Any:
+    # Context variables can't cross a process boundary, so a process pool
+    # worker catches its own messages and they are issued again here.
+    params = inspect.signature(handler).parameters
+
+    @functools.wraps(handler)
+    async def offloaded(message: Any, **deps: Any):
+        loop = asyncio.get_running_loop()
+        if isinstance(executor, ProcessPoolExecutor):
+            deps = {name: dep for name, dep in deps.items() if name in params}
+            issued_messages = await loop.run_in_executor(
+                executor, _run_isolated, handler, message, deps
+            )
+            for issued_message in issued_messages:
+                issue(issued_message)
+        else:
+            context = copy_context()
+            await loop.run_in_executor(
+                executor, functools.partial(context.run, handler, message, **deps)
+            )
+
+    return offloaded
 
 
 async def handle(
@@ -80,18 +217,42 @@ async def handle(
     exception_hook: Optional[
         Callable[[Message, Handler[M], Exception], Awaitable[None]]
     ] = None,
+    timeout: Optional[float] = None,
+    span_exporter: Optional[SpanExporter] = None,
 ):
+    token = _cause_context_var.set(message)
+    start, error = time.time(), None
     try:
         if pre_hook:
             await pre_hook(message, handler)
-        await handler(message, **deps)
+        with _own_messages():
+            await within_deadline(handler(message, **deps), timeout)
         if post_hook:
             await post_hook(message, handler)
         return
     except Exception as e:
+        error = type(e).__name__
         if exception_hook:
             await exception_hook(message, handler, e)
         raise e
+    finally:
+        _cause_context_var.reset(token)
+        if span_exporter:
+            span_exporter.export(_span(message, handler, start, error))
+
+
+def _span(message: Message, handler: Any, start: float, error: Optional[str]):
+    return Span(
+        trace_id=message.trace_id,
+        message_id=message.uid,
+        causation_id=message.causation_id,
+        message_type=type(message).__name__,
+        handler=handler.__name__,
+        start=start,
+        end=time.time(),
+        error=error,
+        message=message,
+    )
 
 
 async def handle_parallel(
@@ -103,9 +264,88 @@ async def handle_parallel(
     exception_hook: Optional[
         Callable[[Message, Handler[M], Exception], Awaitable[None]]
     ] = None,
+    timeouts: Optional[Mapping[Any, float]] = None,
+    span_exporter: Optional[SpanExporter] = None,
 ):
+    timeouts = timeouts or {}
     coros = (
-        handle(message, handler, deps, pre_hook, post_hook, exception_hook)
+        handle(
+            message,
+            handler,
+            deps,
+            pre_hook,
+            post_hook,
+            exception_hook,
+            timeouts.get(handler),
+            span_exporter,
+        )
+        for handler in handlers
+    )
+    return await asyncio.gather(*coros, return_exceptions=True)
+
+
+async def handle_batch(
+    messages: Sequence[M],
+    handler: BatchHandler[M],
+    deps: dict[str, Any],
+    pre_hook: Optional[Callable[[Message, Any], Awaitable[None]]] = None,
+    post_hook: Optional[Callable[[Message, Any], Awaitable[None]]] = None,
+    exception_hook: Optional[
+        Callable[[Message, Any, Exception], Awaitable[None]]
+    ] = None,
+    timeout: Optional[float] = None,
+    span_exporter: Optional[SpanExporter] = None,
+):
+    # Messages issued by a coalesced batch are attributed to its first message.
+    token = _cause_context_var.set(messages[0])
+    start, error = time.time(), None
+    try:
+        if pre_hook:
+            for message in messages:
+                await pre_hook(message, handler)
+        with _own_messages():
+            await within_deadline(handler(messages, **deps), timeout)
+        if post_hook:
+            for message in messages:
+                await post_hook(message, handler)
+        return
+    except Exception as e:
+        error = type(e).__name__
+        if exception_hook:
+            for message in messages:
+                await exception_hook(message, handler, e)
+        raise e
+    finally:
+        _cause_context_var.reset(token)
+        if span_exporter:
+            for message in messages:
+                span_exporter.export(_span(message, handler, start, error))
+
+
+async def handle_batch_parallel(
+    messages: Sequence[M],
+    handlers: Iterable[BatchHandler[M]],
+    deps: dict[str, Any],
+    pre_hook: Optional[Callable[[Message, Any], Awaitable[None]]] = None,
+    post_hook: Optional[Callable[[Message, Any], Awaitable[None]]] = None,
+    exception_hook: Optional[
+        Callable[[Message, Any, Exception], Awaitable[None]]
+    ] = None,
+    timeouts: Optional[Mapping[Any, float]] = None,
+    span_exporter: Optional[SpanExporter] = None,
+):
+    timeouts = timeouts or {}
+    coros = (
+        handle_batch(
+            messages,
+            handler,
+            deps,
+            pre_hook,
+            post_hook,
+            exception_hook,
+            timeouts.get(handler),
+            span_exporter,
+        )
         for handler in handlers
     )
     return await asyncio.gather(*coros, return_exceptions=True)
@@ -147,50 +387,155 @@ class MessageBus:
         exception_hook: Optional[
             Callable[[Message, Handler[Message], Exception], Awaitable[None]]
         ] = None,
+        executor: Optional[Executor] = None,
+        cpu_executor: Optional[Executor] = None,
+        span_exporter: Optional[SpanExporter] = None,
     ) -> None:
         self._deps: dict[str, Any] = deps
         self._handler_map: dict[type[Message], Handler[Any]] = {}
         self._handlers_map: dict[type[Message], Iterable[Handler[Any]]] = {}
+        self._batch_handlers_map: dict[
+            type[Message],
+            tuple[Callable[[Any], Hashable], Iterable[BatchHandler[Any]]],
+        ] = {}
         self._pre_hook = pre_hook
         self._post_hook = post_hook
         self._exception_hook = exception_hook
+        self._executor = executor
+        self._cpu_executor = cpu_executor
+        self._timeouts: dict[type[Message], dict[Any, float]] = {}
+        self.span_exporter = span_exporter
 
     def register_handler(
         self,
         command_type: type[C],
-        handler: Handler[C],
+        handler: Handler[C] | SyncHandler[C],
+        timeout: Optional[float] = None,
     ):
         validate_deps(handler, self._deps)
-        self._handler_map[command_type] = handler
+        [registered] = self._register_timeouts(command_type, [handler], timeout, {})
+        self._handler_map[command_type] = registered
 
     def register_handlers(
         self,
         event_type: type[E],
-        handlers: Iterable[Handler[E]],
+        handlers: Iterable[Handler[E] | SyncHandler[E]],
+        timeout: Optional[float] = None,
+        handler_timeouts: Optional[Mapping[Any, float]] = None,
+    ):
+        for handler in handlers:
+            validate_deps(handler, self._deps)
+        self._handlers_map[event_type] = self._register_timeouts(
+            event_type, handlers, timeout, handler_timeouts or {}
+        )
+
+    def register_batch_handlers(
+        self,
+        event_type: type[E],
+        handlers: Iterable[BatchHandler[E] | Callable[..., None]],
+        key: Callable[[E], Hashable],
+        timeout: Optional[float] = None,
+        handler_timeouts: Optional[Mapping[Any, float]] = None,
     ):
         for handler in handlers:
             validate_deps(handler, self._deps)
-        self._handlers_map[event_type] = handlers
+        self._batch_handlers_map[event_type] = (
+            key,
+            self._register_timeouts(
+                event_type, handlers, timeout, handler_timeouts or {}
+            ),
+        )
+
+    def _register_timeouts(
+        self,
+        message_type: type[Message],
+        handlers: Iterable[Any],
+        timeout: Optional[float],
+        handler_timeouts: Mapping[Any, float],
+    ) -> list[Any]:
+        registered: list[Any] = []
+        timeouts: dict[Any, float] = {}
+        for handler in handlers:
+            coroutine_function = self._as_coroutine_function(handler)
+            if (handler_timeout := handler_timeouts.get(handler, timeout)) is not None:
+                timeouts[coroutine_function] = handler_timeout
+            registered.append(coroutine_function)
+        self._timeouts[message_type] = timeouts
+        return registered
+
+    def _as_coroutine_function(self, handler: Any) -> Any:
+        cpu_bound = getattr(handler, "__cpu_bound__", False)
+        if inspect.iscoroutinefunction(handler):
+            if cpu_bound:
+                raise TypeError(
+                    f'"{handler.__name__}" is a coroutine function,'
+                    " only sync handlers can be cpu_bound"
+                )
+            return handler
+        if cpu_bound and self._cpu_executor:
+            return offload(handler, self._cpu_executor)
+        return offload(handler, self._executor)
 
     @overload
-    async def handle(self, message: Message):
+    async def handle(self, message: Message, *, timeout: Optional[float] = None):
         ...
 
     @overload
     async def handle(
-        self, message: Message, return_hooked_task: Literal[True] = True
+        self,
+        message: Message,
+        return_hooked_task: Literal[True] = True,
+        *,
+        timeout: Optional[float] = None,
     ) -> asyncio.Future[list[Any]]:
         ...
 
-    async def handle(self, message: Message, return_hooked_task: bool = False):
-        hooked = await asyncio.create_task(self._handle_once(message))
-        coros = (self.handle(msg) for msg in hooked)
-        hooked_task = asyncio.gather(*coros, return_exceptions=True)
+    async def handle(
+        self,
+        message: Message,
+        return_hooked_task: bool = False,
+        *,
+        timeout: Optional[float] = None,
+    ):
+        # The deadline is copied into every task of the cascade on creation.
+        token: Optional[Token[Optional[float]]] = None
+        if timeout is not None:
+            deadline = asyncio.get_running_loop().time() + timeout
+            if (outer_deadline := _deadline_context_var.get()) is not None:
+                deadline = min(deadline, outer_deadline)
+            token = _deadline_context_var.set(deadline)
+        try:
+            hooked = await asyncio.create_task(self._handle_once(message))
+            hooked_task = self._handle_hooked(hooked)
+        finally:
+            if token is not None:
+                _deadline_context_var.reset(token)
         if return_hooked_task:
             return hooked_task
         await hooked_task
 
+    def _handle_hooked(self, hooked: Iterable[Message]) -> asyncio.Future[list[Any]]:
+        # Events sharing a batch key within one cascade are coalesced
+        # into a single call of the registered batch handlers.
+        coros: list[Awaitable[Any]] = []
+        batches: dict[tuple[type[Message], Hashable], list[Message]] = {}
+        for msg in hooked:
+            if batch := self._batch_handlers_map.get(type(msg), None):
+                key, _ = batch
+                batches.setdefault((type(msg), key(msg)), []).append(msg)
+            else:
+                coros.append(self.handle(msg))
+        coros.extend(self._handle_batch(msgs) for msgs in batches.values())
+        return asyncio.gather(*coros, return_exceptions=True)
+
+    async def _handle_batch(self, messages: Sequence[Message]):
+        hooked = await asyncio.create_task(self._handle_batch_once(messages))
+        await self._handle_hooked(hooked)
+
     async def _handle_once(self, message: Message):
+        if type(message) in self._batch_handlers_map:
+            return await self._handle_batch_once([message])
+        timeouts = self._timeouts.get(type(message), {})
         with MessageCatcher() as message_catcher:
             if handler := self._handler_map.get(type(message), None):
                 await handle(
@@ -200,6 +545,8 @@ class MessageBus:
                     self._pre_hook,
                     self._post_hook,
                     self._exception_hook,
+                    timeouts.get(handler),
+                    self.span_exporter,
                 )
             elif handlers := self._handlers_map.get(type(message), None):
                 await handle_parallel(
@@ -209,7 +556,24 @@ class MessageBus:
                     self._pre_hook,
                     self._post_hook,
                     self._exception_hook,
+                    timeouts,
+                    self.span_exporter,
                 ),
             else:
                 raise RuntimeError(f"{str(type(message))} is not registed.")
         return message_catcher.issued_messages
+
+    async def _handle_batch_once(self, messages: Sequence[Message]):
+        _, handlers = self._batch_handlers_map[type(messages[0])]
+        with MessageCatcher() as message_catcher:
+            await handle_batch_parallel(
+                messages,
+                handlers,
+                self._deps,
+                self._pre_hook,
+                self._post_hook,
+                self._exception_hook,
+                self._timeouts.get(type(messages[0]), {}),
+                self.span_exporter,
+            )
+        return message_catcher.issued_messages
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import CoroutineType, FrameType
+from typing import Any, Coroutine, Iterator, Optional
+
+
+@dataclass(eq=False)
+class Profile:
+
+    name: str
+    samples: Counter[tuple[str, ...]] = field(default_factory=Counter)
+    started: float = field(default_factory=time.time)
+
+    def folded(self) -> str:
+        # Brendan Gregg's collapsed stack format, root frame first.
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.samples.items()
+        )
+
+
+# Profile of the request whose work runs in the current context, if sampled.
+_profile_context_var: ContextVar[Optional[Profile]] = ContextVar(
+    "profile", default=None
+)
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class Sampler:
+    # Samples the event loop thread from a background thread while any
+    # profile is active. Tasks created while a profile is set in the context
+    # are tracked by their root coroutine frame, so a sample is attributed to
+    # the profile owning the task that was running when it was taken.
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._roots: dict[int, Profile] = {}
+        self._active = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        loop.set_task_factory(self._task_factory)  # type: ignore
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.set_task_factory(None)
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _task_factory(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        coro: Coroutine[Any, Any, Any],
+        **kwargs: Any,
+    ) -> asyncio.Task[Any]:
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        if (profile := _profile_context_var.get()) is not None and isinstance(
+            coro, CoroutineType
+        ):
+            key = id(coro.cr_frame)
+            with self._lock:
+                self._roots[key] = profile
+            task.add_done_callback(lambda _: self._untrack(key))
+        return task
+
+    def _untrack(self, key: int) -> None:
+        with self._lock:
+            self._roots.pop(key, None)
+
+    @contextmanager
+    def profiling(self, name: str) -> Iterator[Profile]:
+        # Only tasks created inside the block are profiled, the current one
+        # is not, so the work to profile should be started as a new task.
+        profile = Profile(name)
+        token = _profile_context_var.set(profile)
+        with self._lock:
+            self._active += 1
+            self._wake.set()
+        try:
+            yield profile
+        finally:
+            _profile_context_var.reset(token)
+            with self._lock:
+                self._active -= 1
+                if not self._active:
+                    self._wake.clear()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            if self._stopped.is_set():
+                return
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore
+            if frame is not None:
+                self._sample(frame)
+
+    def _sample(self, frame: FrameType) -> None:
+        stack: list[str] = []
+        current: Optional[FrameType] = frame
+        with self._lock:
+            while current is not None:
+                stack.append(_label(current))
+                if (profile := self._roots.get(id(current))) is not None:
+                    profile.samples[tuple(reversed(stack))] += 1
+                    return
+                current = current.f_back
+
+
+def write_profile(profile: Profile, directory: str | os.PathLike[str]) -> Path:
+    slug = "".join(c if c.isalnum() else "_" for c in profile.name).strip("_")
+    path = Path(directory) / f"{profile.started:.6f}-{slug}.folded"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(profile.folded())
+    return path
@@ -0,0 +1,279 @@
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import pickle
+import queue
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from multiprocessing.process import BaseProcess
+from typing import (
+    Any,
+    AsyncContextManager,
+    Awaitable,
+    Callable,
+    Hashable,
+    Optional,
+)
+
+from allocation.domain.messages.base import Message
+from allocation.service.message_bus import MessageBus
+from loguru import logger
+
+BusFactory = Callable[[], AsyncContextManager[MessageBus]]
+SkuLookup = Callable[[str], Awaitable[Optional[str]]]
+
+_STOP = None
+_HANDLED, _DONE = "handled", "done"
+
+
+def aggregate_key(message: Message) -> Hashable:
+    return getattr(message, "sku", None)
+
+
+def shard_of(key: Hashable, shards: int) -> int:
+    # Stable across processes, unlike hash() of a str.
+    return zlib.crc32(repr(key).encode()) % shards
+
+
+def _portable(result: Any) -> Any:
+    # Results cross back pickled, an exception that can't be is described.
+    if isinstance(result, list):
+        return [_portable(item) for item in result]
+    if isinstance(result, BaseException):
+        try:
+            pickle.dumps(result)
+        except Exception:
+            return RuntimeError(f"{type(result).__name__}: {result}")
+    return result
+
+
+class _KeyedSequencer:
+    # Runs work of the same key one after the other, in the order it came in.
+
+    def __init__(self) -> None:
+        self._tails: dict[Hashable, asyncio.Future[None]] = {}
+
+    async def run(self, key: Hashable, work: Callable[[], Any]) -> None:
+        previous = self._tails.get(key)
+        tail = self._tails[key] = asyncio.get_running_loop().create_future()
+        try:
+            if previous is not None:
+                await previous
+            await work()
+        finally:
+            tail.set_result(None)
+            if self._tails.get(key) is tail:
+                del self._tails[key]
+
+
+async def _serve(
+    bus_factory: BusFactory,
+    inbox: "multiprocessing.Queue[Any]",
+    outbox: "multiprocessing.Queue[Any]",
+) -> None:
+    loop = asyncio.get_running_loop()
+    sequencer = _KeyedSequencer()
+    tasks: set[asyncio.Task[None]] = set()
+
+    async def handle(
+        bus: MessageBus, request_id: int, message: Message, timeout: Optional[float]
+    ) -> None:
+        try:
+            hooked_task = await bus.handle(
+                message, return_hooked_task=True, timeout=timeout
+            )
+        except Exception as e:
+            outbox.put((_HANDLED, request_id, _portable(e)))
+            return
+        outbox.put((_HANDLED, request_id, None))
+        outbox.put((_DONE, request_id, _portable(await hooked_task)))
+
+    async with bus_factory() as bus:
+        while (request := await loop.run_in_executor(None, inbox.get)) is not _STOP:
+            request_id, key, message, timeout = request
+            work = functools.partial(handle, bus, request_id, message, timeout)
+            task = asyncio.create_task(sequencer.run(key, work))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+
+def _worker(
+    bus_factory: BusFactory,
+    inbox: "multiprocessing.Queue[Any]",
+    outbox: "multiprocessing.Queue[Any]",
+) -> None:
+    asyncio.run(_serve(bus_factory, inbox, outbox))
+
+
+@dataclass
+class _Pending:
+    shard: int
+    handled: asyncio.Future[None]
+    done: asyncio.Future[list[Any]]
+
+
+@dataclass
+class ShardedBus:
+    # Handles messages in one of several worker processes, each running a bus
+    # of its own with its own loop, engine and pool. Messages of one aggregate
+    # always go to the same worker and are handled there one at a time, so
+    # work on a product is spread across cores without racing for its version.
+
+    bus_factory: BusFactory
+    shards: int
+    key: Callable[[Message], Hashable] = aggregate_key
+    # Finds the sku of a batch for messages naming only the batch.
+    sku_of_batchref: Optional[SkuLookup] = None
+    poll_interval: float = 1.0
+    _skus_by_batchref: dict[str, Hashable] = field(default_factory=dict, init=False)
+    _processes: list[BaseProcess] = field(default_factory=list, init=False)
+    _inboxes: list["multiprocessing.Queue[Any]"] = field(
+        default_factory=list, init=False
+    )
+    _outbox: Optional["multiprocessing.Queue[Any]"] = field(default=None, init=False)
+    _pending: dict[int, _Pending] = field(default_factory=dict, init=False)
+    _request_ids: Any = field(default_factory=itertools.count, init=False)
+    _loop: Optional[asyncio.AbstractEventLoop] = field(default=None, init=False)
+    _receiver: Optional[threading.Thread] = field(default=None, init=False)
+
+    def start(self) -> None:
+        # Spawned, a forked worker would share the parent's pooled connections.
+        context = multiprocessing.get_context("spawn")
+        self._loop = asyncio.get_running_loop()
+        self._outbox = context.Queue()
+        for _ in range(self.shards):
+            inbox = context.Queue()
+            process = context.Process(
+                target=_worker,
+                args=(self.bus_factory, inbox, self._outbox),
+                daemon=True,
+            )
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+
+    async def stop(self) -> None:
+        for inbox in self._inboxes:
+            inbox.put(_STOP)
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join)
+        if self._outbox is not None:
+            self._outbox.put(_STOP)
+        if self._receiver is not None:
+            await loop.run_in_executor(None, self._receiver.join)
+        self._fail_pending(range(self.shards), "Bus worker stopped")
+        self._inboxes.clear()
+        self._processes.clear()
+
+    async def handle(
+        self,
+        message: Message,
+        return_hooked_task: bool = False,
+        *,
+        timeout: Optional[float] = None,
+    ):
+        if self._loop is None:
+            raise RuntimeError("Sharded bus is not started.")
+        key = await self._key_of(message)
+        shard = shard_of(key, self.shards)
+        if not self._processes[shard].is_alive():
+            raise RuntimeError("Bus worker exited")
+        request_id = next(self._request_ids)
+        pending = self._pending[request_id] = _Pending(
+            shard, self._loop.create_future(), self._loop.create_future()
+        )
+        self._inboxes[shard].put((request_id, key, message, timeout))
+        try:
+            await asyncio.shield(pending.handled)
+        except BaseException:
+            pending.done.cancel()
+            raise
+        if return_hooked_task:
+            return pending.done
+        await pending.done
+
+    async def _key_of(self, message: Message) -> Hashable:
+        # A batch always belongs to the same sku, so the sku of a batch is
+        # remembered once it is known from a message or the lookup.
+        key = self.key(message)
+        ref = getattr(message, "ref", None)
+        if key is not None:
+            if ref is not None:
+                self._skus_by_batchref[ref] = key
+            return key
+        if ref is None:
+            return None
+        if ref not in self._skus_by_batchref and self.sku_of_batchref is not None:
+            if (sku := await self.sku_of_batchref(ref)) is not None:
+                self._skus_by_batchref[ref] = sku
+        # An unknown batch fails in any worker.
+        return self._skus_by_batchref.get(ref, ref)
+
+    def _receive(self) -> None:
+        # Liveness is checked every poll_interval, replies of the other shards
+        # coming in or not.
+        assert self._outbox is not None and self._loop is not None
+        checked = time.monotonic()
+        while True:
+            try:
+                reply = self._outbox.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+            else:
+                if reply is _STOP:
+                    return
+                self._loop.call_soon_threadsafe(self._resolve, *reply)
+            if time.monotonic() - checked >= self.poll_interval:
+                checked = time.monotonic()
+                dead = [
+                    shard
+                    for shard, process in enumerate(self._processes)
+                    if not process.is_alive()
+                ]
+                if dead:
+                    self._loop.call_soon_threadsafe(
+                        self._fail_pending, dead, "Bus worker exited"
+                    )
+
+    def _resolve(self, kind: str, request_id: int, result: Any) -> None:
+        if (pending := self._pending.get(request_id)) is None:
+            return
+        if kind == _HANDLED:
+            if result is None:
+                _set_result(pending.handled, None)
+            else:
+                _set_exception(pending.handled, result)
+                del self._pending[request_id]
+        else:
+            _set_result(pending.done, result)
+            del self._pending[request_id]
+
+    def _fail_pending(self, shards: Any, reason: str) -> None:
+        shards = set(shards)
+        for request_id, pending in list(self._pending.items()):
+            if pending.shard in shards:
+                logger.error(
+                    f"[{reason}] request {request_id} on shard {pending.shard}"
+                )
+                _set_exception(pending.handled, RuntimeError(reason))
+                _set_exception(pending.done, RuntimeError(reason))
+                del self._pending[request_id]
+
+
+def _set_result(future: asyncio.Future[Any], result: Any) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future[Any], exception: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exception)
+        # Nobody may await it any more, e.g. a hooked task the caller dropped.
+        future.exception()
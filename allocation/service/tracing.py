@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import IO, Iterable, Optional, Protocol
+from uuid import UUID
+
+from allocation.domain.messages.base import Message
+
+
+@dataclass(slots=True, kw_only=True)
+class Span:
+    trace_id: UUID
+    message_id: UUID
+    causation_id: Optional[UUID]
+    message_type: str
+    handler: str
+    start: float
+    end: float
+    error: Optional[str] = None
+    message: Optional[Message] = field(default=None, repr=False, compare=False)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class SpanExporter(Protocol):
+    def export(self, _span: Span) -> None:
+        ...
+
+
+@dataclass
+class MultiSpanExporter(SpanExporter):
+
+    exporters: list[SpanExporter]
+
+    def export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            exporter.export(span)
+
+
+@dataclass
+class InMemorySpanCollector(SpanExporter):
+
+    spans: list[Span] = field(default_factory=list)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def trace(self, trace_id: UUID) -> list[Span]:
+        return [span for span in self.spans if span.trace_id == trace_id]
+
+    def critical_path(self, trace_id: UUID) -> list[Span]:
+        return critical_path(self.trace(trace_id))
+
+
+def critical_path(spans: Iterable[Span]) -> list[Span]:
+    # Walk back from the span that finished last through the spans that
+    # handled the message causing it.
+    spans = list(spans)
+    if not spans:
+        return []
+    by_message: dict[UUID, Span] = {}
+    for span in spans:
+        latest = by_message.get(span.message_id)
+        if latest is None or span.end > latest.end:
+            by_message[span.message_id] = span
+    path = [max(spans, key=lambda span: span.end)]
+    while (cause := path[-1].causation_id) is not None and cause in by_message:
+        path.append(by_message[cause])
+    return path[::-1]
+
+
+class ChromeTraceFileExporter(SpanExporter):
+    # Chrome trace event "JSON Array Format"; the closing bracket is optional,
+    # so events are simply appended and the file stays loadable after a crash.
+
+    def __init__(self, path: str | os.PathLike[str]):
+        self._lock = threading.Lock()
+        self._file: IO[str] = open(path, "a", buffering=1, encoding="utf-8")
+        if self._file.tell() == 0:
+            self._file.write("[\n")
+
+    def export(self, span: Span) -> None:
+        event = {
+            "name": span.handler,
+            "cat": span.message_type,
+            "ph": "X",
+            "ts": span.start * 1_000_000,
+            "dur": span.duration * 1_000_000,
+            "pid": os.getpid(),
+            "tid": span.trace_id.hex,
+            "args": {
+                "message_id": span.message_id.hex,
+                "causation_id": span.causation_id.hex if span.causation_id else None,
+                "error": span.error,
+            },
+        }
+        with self._lock:
+            self._file.write(json.dumps(event) + ",\n")
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
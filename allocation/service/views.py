@@ -1,13 +1,99 @@
-from sqlalchemy import text
+from typing import Any, AsyncIterator, Iterable, Optional
+
+from sqlalchemy import bindparam, text
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
 
 
-async def allocations(order_id: str, session: AsyncSession):
+async def allocations(
+    order_id: str,
+    session: AsyncSession,
+    *,
+    after: Optional[tuple[str, int]] = None,
+    limit: Optional[int] = None,
+):
+    # Pages are keyed by the sku and quantity of the last line of the previous
+    # page rather than an offset. Together they tell the lines of an order
+    # apart, and the order line index lets a page seek to its first row and
+    # read the next ones in order, so that deep pages cost as much as the
+    # first one.
+    after_sku, after_qty = after if after is not None else (None, None)
+    async with session.begin():
+        results = await session.execute(
+            _allocations_query(after is not None, limit),
+            {
+                "order_id": order_id,
+                "after_sku": after_sku,
+                "after_qty": after_qty,
+                "limit": limit,
+            },
+        )
+    return [_allocation(*row) for row in results.all()]
+
+
+async def sku_of_batchref(batchref: str, session: AsyncSession) -> Optional[str]:
+    async with session.begin():
+        return await session.scalar(
+            text("SELECT sku FROM batches WHERE reference = :batchref"),
+            {"batchref": batchref},
+        )
+
+
+async def stream_allocations(
+    order_id: str, session: AsyncSession, *, chunk_size: int = 1000
+) -> AsyncIterator[list[dict[str, Any]]]:
+    # Rows are fetched from a server-side cursor chunk by chunk, so memory
+    # stays flat however many lines the order has.
+    async with session.begin():
+        results = await session.stream(
+            _allocations_query(False, None), {"order_id": order_id}
+        )
+        async for rows in results.partitions(chunk_size):
+            yield [_allocation(*row) for row in rows]
+
+
+def _allocations_query(after: bool, limit: Optional[int]) -> TextClause:
+    return text(
+        "SELECT sku, qty, batchref FROM allocations_view WHERE order_id = :order_id"
+        + (" AND (sku, qty) > (:after_sku, :after_qty)" if after else "")
+        + " ORDER BY sku, qty"
+        + (" LIMIT :limit" if limit is not None else "")
+    )
+
+
+def _allocation(sku: str, qty: int, batchref: str) -> dict[str, Any]:
+    return {"sku": sku, "qty": qty, "batchref": batchref}
+
+
+async def stock(sku: str, session: AsyncSession) -> Optional[dict[str, Any]]:
+    return (await stocks([sku], session)).get(sku)
+
+
+async def stocks(
+    skus: Iterable[str], session: AsyncSession
+) -> dict[str, dict[str, Any]]:
+    # Batches in warehouse come first, then shipments by eta, the order in
+    # which lines are allocated to them.
     async with session.begin():
         results = await session.execute(
             text(
-                "SELECT sku, batchref FROM allocations_view WHERE order_id = :order_id"
-            ),
-            {"order_id": order_id},
+                "SELECT sku, batchref, eta, purchased_quantity, allocated_quantity"
+                " FROM stock_view WHERE sku IN :skus"
+                " ORDER BY sku, eta IS NOT NULL, eta, batchref"
+            ).bindparams(bindparam("skus", expanding=True)),
+            {"skus": list(skus)},
+        )
+    found: dict[str, dict[str, Any]] = {}
+    for sku, batchref, eta, purchased, allocated in results.all():
+        entry = found.setdefault(sku, {"sku": sku, "available": 0, "batches": []})
+        entry["available"] += purchased - allocated
+        entry["batches"].append(
+            {
+                "batchref": batchref,
+                "eta": eta,
+                "purchased": purchased,
+                "allocated": allocated,
+                "available": purchased - allocated,
+            }
         )
-    return [row._mapping for row in results.all()]
+    return found
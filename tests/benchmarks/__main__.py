@@ -0,0 +1,63 @@
+import argparse
+import sys
+from pathlib import Path
+
+from .harness import Report, compare, run
+from .suite import benchmarks
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the domain and bus benchmarks.")
+    parser.add_argument("-k", dest="pattern", help="Only run matching benchmarks.")
+    parser.add_argument("--output", help="Write the results as JSON.")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown against the baseline, 0.2 is 20%%.",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing.",
+    )
+    args = parser.parse_args()
+
+    report = run(benchmarks(), args.pattern)
+    for result in report.results:
+        memory = (
+            f" {result.bytes_per_op:>10.1f} B/op"
+            if result.bytes_per_op is not None
+            else ""
+        )
+        print(f"{result.name:<50} {result.per_op * 1e6:>12.3f} us/op{memory}")
+    if args.output:
+        report.dump(args.output)
+    if args.save_baseline:
+        report.dump(args.baseline)
+        return 0
+    if not Path(args.baseline).exists():
+        print(f"No baseline at {args.baseline}, nothing to compare.")
+        return 0
+
+    baseline = Report.load(args.baseline)
+    if baseline.machine != report.machine:
+        print(f"Baseline was recorded on {baseline.machine}, results may differ.")
+    regressions = compare(report, baseline, args.threshold)
+    for regression in regressions:
+        if regression.metric == "memory":
+            change = f"{regression.baseline:.1f} -> {regression.current:.1f} B/op"
+        else:
+            change = (
+                f"{regression.baseline * 1e6:.3f} -> "
+                f"{regression.current * 1e6:.3f} us/op"
+            )
+        print(f"REGRESSION {regression.name}: {change} ({regression.ratio:.2f}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
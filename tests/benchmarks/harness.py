@@ -0,0 +1,176 @@
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+# A benchmark builds fresh state in setup, which is not timed, and returns the
+# callable that is timed. ``ops`` is how many operations one call performs.
+# With track_memory, what the call returns is measured as well, in bytes
+# allocated per operation that are still alive when the call is done.
+Call = Callable[[], Any | Awaitable[Any]]
+Setup = Callable[[], Call | Awaitable[Call]]
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Setup
+    ops: int = 1
+    rounds: int = 20
+    track_memory: bool = False
+
+
+@dataclass
+class Result:
+    name: str
+    ops: int
+    rounds: int
+    min: float
+    median: float
+    stdev: float
+    bytes_per_op: Optional[float] = None
+
+    @property
+    def per_op(self) -> float:
+        return self.median / self.ops
+
+
+@dataclass
+class Regression:
+    name: str
+    baseline: float
+    current: float
+    metric: str = "time"
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+
+
+@dataclass
+class Report:
+    results: list[Result] = field(default_factory=list)
+    machine: dict[str, str] = field(
+        default_factory=lambda: {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+        }
+    )
+
+    def dump(self, path: str | Path) -> None:
+        Path(path).write_text(
+            json.dumps(
+                {
+                    "machine": self.machine,
+                    "results": [
+                        asdict(result) | {"per_op": result.per_op}
+                        for result in self.results
+                    ],
+                },
+                indent=2,
+            )
+        )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Report":
+        raw = json.loads(Path(path).read_text())
+        return cls(
+            results=[
+                Result(**{k: v for k, v in result.items() if k != "per_op"})
+                for result in raw["results"]
+            ],
+            machine=raw["machine"],
+        )
+
+
+def measure_memory(benchmark: Benchmark, loop: asyncio.AbstractEventLoop) -> float:
+    call = benchmark.setup()
+    if asyncio.iscoroutine(call):
+        call = loop.run_until_complete(call)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        outcome = call()
+        if asyncio.iscoroutine(outcome):
+            outcome = loop.run_until_complete(outcome)
+        allocated, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del outcome
+    return allocated / benchmark.ops
+
+
+def measure(benchmark: Benchmark, loop: asyncio.AbstractEventLoop) -> Result:
+    timings: list[float] = []
+    for _ in range(benchmark.rounds):
+        call = benchmark.setup()
+        if asyncio.iscoroutine(call):
+            call = loop.run_until_complete(call)
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            outcome = call()
+            if asyncio.iscoroutine(outcome):
+                loop.run_until_complete(outcome)
+            timings.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+    return Result(
+        name=benchmark.name,
+        ops=benchmark.ops,
+        rounds=benchmark.rounds,
+        min=min(timings),
+        median=statistics.median(timings),
+        stdev=statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        bytes_per_op=(
+            measure_memory(benchmark, loop) if benchmark.track_memory else None
+        ),
+    )
+
+
+def run(benchmarks: Iterable[Benchmark], pattern: Optional[str] = None) -> Report:
+    report = Report()
+    loop = asyncio.new_event_loop()
+    try:
+        for benchmark in benchmarks:
+            if pattern and pattern not in benchmark.name:
+                continue
+            report.results.append(measure(benchmark, loop))
+    finally:
+        loop.close()
+    return report
+
+
+def compare(current: Report, baseline: Report, threshold: float) -> list[Regression]:
+    # Medians per operation are compared, and memory per operation where both
+    # sides tracked it. Benchmarks missing on either side are ignored so that
+    # the suite can grow without rewriting the baseline.
+    baseline_results = {result.name: result for result in baseline.results}
+    regressions: list[Regression] = []
+    for result in current.results:
+        if (previous := baseline_results.get(result.name)) is None:
+            continue
+        if result.per_op > previous.per_op * (1 + threshold):
+            regressions.append(Regression(result.name, previous.per_op, result.per_op))
+        if (
+            result.bytes_per_op is not None
+            and previous.bytes_per_op is not None
+            and result.bytes_per_op > previous.bytes_per_op * (1 + threshold)
+        ):
+            regressions.append(
+                Regression(
+                    result.name,
+                    previous.bytes_per_op,
+                    result.bytes_per_op,
+                    metric="memory",
+                )
+            )
+    return regressions
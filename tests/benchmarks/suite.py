@@ -0,0 +1,249 @@
+from datetime import date, timedelta
+from typing import Any
+
+from allocation import bootstrap
+from allocation.adapter.email_sender import build_email_message
+from allocation.adapter.memory import InMemoryUnitOfWork
+from allocation.adapter.outbox import converter
+from allocation.domain.messages import commands, events
+from allocation.domain.models import Batch, OrderLine, Product
+from allocation.entrypoint.replay import NullEmailSender
+from allocation.service.message_bus import MessageBus, MessageCatcher, issue
+
+from .harness import Benchmark
+
+BATCH_COUNTS = (1, 10, 100)
+LINE_COUNTS = (10, 100, 1000)
+
+
+def build_product(batches: int, qty: int) -> Product:
+    today = date.today()
+    return Product(
+        sku="BENCH",
+        batches=[
+            Batch(
+                reference=f"batch-{i}",
+                sku="BENCH",
+                purchased_quantity=qty,
+                eta=today + timedelta(days=i) if i else None,
+            )
+            for i in range(batches)
+        ],
+    )
+
+
+def product_allocate(batches: int, lines: int) -> Benchmark:
+    def setup():
+        product = build_product(batches, qty=lines)
+        order_lines = [
+            OrderLine(order_id=f"order-{i}", sku="BENCH", qty=1) for i in range(lines)
+        ]
+
+        def call():
+            for line in order_lines:
+                product.allocate(line)
+
+        return call
+
+    return Benchmark(f"product_allocate[batches={batches},lines={lines}]", setup, lines)
+
+
+def product_allocate_many(batches: int, lines: int) -> Benchmark:
+    def setup():
+        product = build_product(batches, qty=lines)
+        order_lines = [
+            OrderLine(order_id=f"order-{i}", sku="BENCH", qty=1) for i in range(lines)
+        ]
+
+        def call():
+            product.allocate_many(order_lines)
+
+        return call
+
+    return Benchmark(
+        f"product_allocate_many[batches={batches},lines={lines}]", setup, lines
+    )
+
+
+def change_batch_quantity(lines: int) -> Benchmark:
+    def setup():
+        product = build_product(1, qty=lines)
+        for i in range(lines):
+            product.allocate(OrderLine(order_id=f"order-{i}", sku="BENCH", qty=1))
+
+        def call():
+            product.change_batch_quantity("batch-0", lines // 2)
+
+        return call
+
+    return Benchmark(f"change_batch_quantity[lines={lines}]", setup)
+
+
+def message_construction(count: int = 1000) -> Benchmark:
+    def setup():
+        def call():
+            for i in range(count):
+                commands.Allocate(order_id="order", sku="BENCH", qty=i)
+
+        return call
+
+    return Benchmark("message_construction", setup, count)
+
+
+def event_construction(count: int = 10000) -> Benchmark:
+    def setup():
+        def call():
+            return [
+                events.Allocated(
+                    aggregate_id="BENCH",
+                    order_id=f"order-{i}",
+                    sku="BENCH",
+                    qty=1,
+                    batchref="batch",
+                )
+                for i in range(count)
+            ]
+
+        return call
+
+    return Benchmark("event_construction", setup, count, track_memory=True)
+
+
+def order_line_construction(count: int = 10000) -> Benchmark:
+    def setup():
+        def call():
+            return [
+                OrderLine(order_id=f"order-{i}", sku="BENCH", qty=1)
+                for i in range(count)
+            ]
+
+        return call
+
+    return Benchmark("order_line_construction", setup, count, track_memory=True)
+
+
+def issue_events(count: int = 1000) -> Benchmark:
+    def setup():
+        issued = [
+            events.Allocated(
+                aggregate_id="BENCH",
+                order_id=f"order-{i}",
+                sku="BENCH",
+                qty=1,
+                batchref="batch",
+            )
+            for i in range(count)
+        ]
+
+        def call():
+            with MessageCatcher():
+                for event in issued:
+                    issue(event)
+
+        return call
+
+    return Benchmark("issue_events", setup, count)
+
+
+async def noop(_msg: Any, **_: Any) -> None:
+    ...
+
+
+def bus_dispatch(count: int = 1000) -> Benchmark:
+    def setup():
+        bus = MessageBus(deps={})
+        bus.register_handler(commands.Allocate, noop)
+        messages = [
+            commands.Allocate(order_id=f"order-{i}", sku="BENCH", qty=1)
+            for i in range(count)
+        ]
+
+        async def call():
+            for message in messages:
+                await bus.handle(message)
+
+        return call
+
+    return Benchmark("bus_dispatch", setup, count)
+
+
+def bus_allocate_in_memory(count: int = 200) -> Benchmark:
+    # The whole command path, handlers and unit of work included, minus I/O.
+    async def setup():
+        bus = bootstrap.bootstrap(
+            start_orm_mapping=False,
+            uow_class=InMemoryUnitOfWork.with_store(),
+            email_sender=NullEmailSender(),
+            pre_hook=None,
+            post_hook=None,
+        )
+        await bus.handle(
+            commands.CreateBatch(ref="batch", sku="BENCH", qty=count, eta=None)
+        )
+        messages = [
+            commands.Allocate(order_id=f"order-{i}", sku="BENCH", qty=1)
+            for i in range(count)
+        ]
+
+        async def call():
+            for message in messages:
+                await bus.handle(message)
+
+        return call
+
+    return Benchmark("bus_allocate_in_memory", setup, count)
+
+
+def outbox_roundtrip(count: int = 1000) -> Benchmark:
+    def setup():
+        event = events.Allocated(
+            aggregate_id="BENCH", order_id="order", sku="BENCH", qty=1, batchref="b"
+        )
+
+        def call():
+            for _ in range(count):
+                converter.loads(converter.dumps(event), events.Allocated)
+
+        return call
+
+    return Benchmark("outbox_roundtrip", setup, count)
+
+
+def email_message(count: int = 200) -> Benchmark:
+    def setup():
+        def call():
+            for _ in range(count):
+                build_email_message(
+                    from_="allocation@example.com",
+                    to="stock@example.com",
+                    subject="Out of stock for BENCH",
+                    text_version="Out of stock for BENCH",
+                )
+
+        return call
+
+    return Benchmark("build_email_message", setup, count)
+
+
+def benchmarks() -> list[Benchmark]:
+    return [
+        *(
+            product_allocate(batches, lines)
+            for batches in BATCH_COUNTS
+            for lines in LINE_COUNTS
+        ),
+        *(
+            product_allocate_many(batches, lines)
+            for batches in BATCH_COUNTS
+            for lines in LINE_COUNTS
+        ),
+        *(change_batch_quantity(lines) for lines in LINE_COUNTS),
+        message_construction(),
+        event_construction(),
+        order_line_construction(),
+        issue_events(),
+        bus_dispatch(),
+        bus_allocate_in_memory(),
+        outbox_roundtrip(),
+        email_message(),
+    ]
@@ -6,9 +6,10 @@ from typing import Callable
 import pytest
 import requests
 from allocation.adapter import unit_of_work
+from allocation.adapter.database import create_engine
 from allocation.adapter.orm import mapper_registry, start_mappers
 from allocation.config import settings
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import clear_mappers, sessionmaker
 from tenacity import retry, stop
 
@@ -22,10 +23,7 @@ def event_loop():
 # Database Engine
 @pytest.fixture(scope="session")
 async def database_engine():
-    engine = create_async_engine(
-        settings.DATABASE_URL, future=True, isolation_level="REPEATABLE READ"
-    )
-    return engine
+    return create_engine(settings.DATABASE_URL)
 
 
 @pytest.fixture
@@ -0,0 +1,93 @@
+import pytest
+from allocation import bootstrap
+from allocation.adapter import email_sender, unit_of_work
+from allocation.domain.messages import commands
+from allocation.entrypoint.pre_start import migrate
+from allocation.service.message_bus import MessageBus
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import clear_mappers
+
+
+@pytest.fixture
+def message_bus(uow_class: type[unit_of_work.UnitOfWork]):
+    bus = bootstrap.bootstrap(
+        start_orm_mapping=True,
+        uow_class=uow_class,
+        email_sender=email_sender.MailhogEmailSender(),
+    )
+    yield bus
+    clear_mappers()
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_allocations_view_is_keyed_by_order_line(
+    message_bus: MessageBus,
+    database_session: AsyncSession,
+    database_engine: AsyncEngine,
+):
+    await message_bus.handle(
+        commands.CreateBatch(ref="b1", sku="sku1", qty=50, eta=None)
+    )
+    await message_bus.handle(commands.Allocate(order_id="o1", sku="sku1", qty=4))
+    await message_bus.handle(commands.Allocate(order_id="o1", sku="sku1", qty=5))
+    async with database_engine.begin() as conn:
+        # The view as it was keyed by order and sku.
+        await conn.execute(text("DROP TABLE allocations_view"))
+        await conn.execute(
+            text(
+                "CREATE TABLE allocations_view (id INTEGER PRIMARY KEY,"
+                " order_id VARCHAR(255), sku VARCHAR(255), batchref VARCHAR(255),"
+                " UNIQUE (order_id, sku))"
+            )
+        )
+        await conn.execute(
+            text("INSERT INTO allocations_view VALUES (1, 'o1', 'sku1', 'b1')")
+        )
+
+    for _ in range(2):
+        async with database_engine.begin() as conn:
+            for migration in migrate.MIGRATIONS:
+                await migration(conn)
+
+    rows = await database_session.execute(
+        text("SELECT order_id, sku, qty, batchref FROM allocations_view")
+    )
+    assert sorted(rows.all()) == [("o1", "sku1", 4, "b1"), ("o1", "sku1", 5, "b1")]
+    await database_session.commit()
+    await message_bus.handle(commands.Allocate(order_id="o1", sku="sku1", qty=6))
+    rows = await database_session.execute(text("SELECT count(*) FROM allocations_view"))
+    assert rows.scalar() == 3
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_outbox_events_put_before_are_positioned_as_stored(
+    database_session: AsyncSession,
+    database_engine: AsyncEngine,
+):
+    async with database_engine.begin() as conn:
+        # The outbox as it was before envelopes were positioned.
+        await conn.execute(text("DROP TABLE events"))
+        await conn.execute(
+            text(
+                "CREATE TABLE events (id CHAR(32) PRIMARY KEY, type VARCHAR(255),"
+                " payload JSON, aggregate_id VARCHAR(255), aggregate_type VARCHAR(255))"
+            )
+        )
+        for id_ in ("b", "a"):
+            await conn.execute(
+                text(
+                    f"INSERT INTO events VALUES ('{id_ * 32}', 'OutOfStock', '{{}}',"
+                    " 'sku1', 'Product')"
+                )
+            )
+
+    for _ in range(2):
+        async with database_engine.begin() as conn:
+            for migration in migrate.MIGRATIONS:
+                await migration(conn)
+
+    rows = await database_session.execute(
+        text("SELECT id FROM events ORDER BY position")
+    )
+    assert [id_ for id_, in rows.all()] == ["b" * 32, "a" * 32]
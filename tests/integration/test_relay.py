@@ -0,0 +1,131 @@
+import asyncio
+from typing import Sequence
+
+import pytest
+from allocation.adapter import unit_of_work
+from allocation.adapter.database import listening
+from allocation.adapter.outbox import Envelope
+from allocation.adapter.relay import OutboxRelay
+from allocation.domain.messages import events
+from allocation.service.message_bus import MessageCatcher, issue
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from ..conftest import AsyncSessionFactory
+from ..random_refs import random_sku
+
+pytestmark = pytest.mark.usefixtures("orm_mapping", "initialize_database")
+
+
+async def commit_events(
+    uow_class: type[unit_of_work.UnitOfWork], count: int
+) -> list[events.OutOfStock]:
+    sku = random_sku()
+    issued = [events.OutOfStock(sku=sku, aggregate_id=sku) for _ in range(count)]
+    with MessageCatcher():
+        for event in issued:
+            issue(event)
+        async with uow_class() as uow:
+            await uow.commit()
+    return issued
+
+
+async def test_relays_and_deletes_envelopes_in_batches(
+    database_session: AsyncSession,
+    database_session_factory: AsyncSessionFactory,
+    uow_class: type[unit_of_work.UnitOfWork],
+):
+    await commit_events(uow_class, 5)
+    published: list[Sequence[Envelope]] = []
+
+    async def publish(envelopes: Sequence[Envelope]):
+        published.append(envelopes)
+
+    relay = OutboxRelay(database_session_factory, publish, batch_size=2)
+
+    assert await relay.drain() == 5
+    assert [len(envelopes) for envelopes in published] == [2, 2, 1]
+    assert {envelope.type for batch in published for envelope in batch} == {
+        "OutOfStock"
+    }
+    rows = list(await database_session.execute(text('SELECT * FROM "events"')))
+    assert rows == []
+
+
+async def test_relays_envelopes_in_the_order_they_were_put(
+    database_session_factory: AsyncSessionFactory,
+    uow_class: type[unit_of_work.UnitOfWork],
+):
+    issued = [event for _ in range(3) for event in await commit_events(uow_class, 3)]
+    published: list[Envelope] = []
+
+    async def publish(envelopes: Sequence[Envelope]):
+        published.extend(envelopes)
+
+    await OutboxRelay(database_session_factory, publish, batch_size=2).drain()
+
+    assert [envelope.id for envelope in published] == [event.uid for event in issued]
+
+
+async def test_relays_of_partitions_share_no_aggregate(
+    database_session: AsyncSession,
+    database_session_factory: AsyncSessionFactory,
+    uow_class: type[unit_of_work.UnitOfWork],
+):
+    for _ in range(8):
+        await commit_events(uow_class, 2)
+    published: list[list[Envelope]] = [[], []]
+
+    def publish_to(partition: int):
+        async def publish(envelopes: Sequence[Envelope]):
+            published[partition].extend(envelopes)
+
+        return publish
+
+    for partition in range(2):
+        relay = OutboxRelay(
+            database_session_factory,
+            publish_to(partition),
+            partition=partition,
+            partitions=2,
+        )
+        await relay.drain()
+
+    assert len(published[0]) + len(published[1]) == 16
+    aggregates = [{envelope.aggregate_id for envelope in p} for p in published]
+    assert aggregates[0] and aggregates[1]
+    assert not aggregates[0] & aggregates[1]
+    rows = list(await database_session.execute(text('SELECT * FROM "events"')))
+    assert rows == []
+
+
+async def test_failed_publishing_leaves_envelopes_in_the_outbox(
+    database_session: AsyncSession,
+    database_session_factory: AsyncSessionFactory,
+    uow_class: type[unit_of_work.UnitOfWork],
+):
+    await commit_events(uow_class, 1)
+
+    async def publish(_envelopes: Sequence[Envelope]):
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        await OutboxRelay(database_session_factory, publish).drain()
+
+    rows = list(await database_session.execute(text('SELECT * FROM "events"')))
+    assert len(rows) == 1
+
+
+async def test_commits_putting_events_notify_the_channel(
+    database_engine: AsyncEngine,
+    uow_class: type[unit_of_work.UnitOfWork],
+    monkeypatch: pytest.MonkeyPatch,
+):
+    if database_engine.dialect.name != "postgresql":
+        pytest.skip("LISTEN/NOTIFY is Postgres only")
+    monkeypatch.setattr(uow_class, "NOTIFY_CHANNEL", "outbox_test")
+    notified = asyncio.Event()
+
+    async with listening(database_engine, "outbox_test", notified.set):
+        await commit_events(uow_class, 3)
+        await asyncio.wait_for(notified.wait(), 5)
@@ -1,4 +1,8 @@
+from typing import Any
+
 import pytest
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from allocation.adapter import repository
 from allocation.domain import models
@@ -17,3 +21,74 @@ async def test_get_by_batchref(database_session: AsyncSession):
     await repo.add(p2)
     assert await repo.get_by_batchref("b2") == p1
     assert await repo.get_by_batchref("b3") == p2
+
+
+async def test_queries_are_compiled_once(database_session: AsyncSession):
+    repo = repository.ProductRepository(database_session)
+    for sku in ("sku1", "sku2"):
+        batch = models.Batch(reference=sku, sku=sku, purchased_quantity=1, eta=None)
+        await repo.add(models.Product(sku=sku, batches=[batch]))
+    await database_session.flush()
+
+    cache_hits: list[bool] = []
+
+    def record(_conn: Any, _cursor: Any, statement: str, *args: Any):
+        context = args[-2]
+        if statement.startswith("SELECT products"):
+            cache_hits.append(context.cache_hit is CACHE_HIT)
+
+    sync_engine = database_session.bind.sync_engine
+    event.listen(sync_engine, "after_cursor_execute", record)
+    try:
+        await repo.get("sku1")
+        await repo.get("sku2")
+        await repo.get_by_batchref("sku1")
+        await repo.get_by_batchref("sku2")
+    finally:
+        event.remove(sync_engine, "after_cursor_execute", record)
+
+    assert len(cache_hits) == 4
+    assert cache_hits[1] and cache_hits[3]
+
+
+async def test_get_many_loads_products_in_a_constant_number_of_queries(
+    database_session: AsyncSession,
+):
+    repo = repository.ProductRepository(database_session)
+    skus = [f"sku{i}" for i in range(10)]
+    for sku in skus:
+        batches = [
+            models.Batch(
+                reference=f"{sku}-{i}", sku=sku, purchased_quantity=10, eta=None
+            )
+            for i in range(3)
+        ]
+        for batch in batches:
+            batch.allocate(models.OrderLine(order_id=f"{sku}-order", sku=sku, qty=1))
+        await repo.add(models.Product(sku=sku, batches=batches))
+    await database_session.commit()
+    database_session.expunge_all()
+
+    statements: list[str] = []
+
+    def record(_conn: Any, _cursor: Any, statement: str, *args: Any):
+        if statement.startswith("SELECT"):
+            statements.append(statement)
+
+    sync_engine = database_session.bind.sync_engine
+    event.listen(sync_engine, "after_cursor_execute", record)
+    try:
+        products = await repo.get_many([*skus, "missing"])
+        by_batchrefs = await repo.get_many_by_batchrefs(["sku1-0", "sku1-2", "sku2-1"])
+    finally:
+        event.remove(sync_engine, "after_cursor_execute", record)
+
+    assert sorted(product.sku for product in products) == skus
+    assert all(
+        batch.allocated_quantity == 1
+        for product in products
+        for batch in product.batches
+    )
+    assert sorted(product.sku for product in by_batchrefs) == ["sku1", "sku2"]
+    assert any(product is by_batchrefs[0] for product in products)
+    assert len(statements) == 6
@@ -94,6 +94,24 @@ async def test_rolls_back_on_error(
     assert rows == []
 
 
+async def test_compiling_statements_leaves_no_rows_behind(
+    database_session: AsyncSession, uow_class: type[unit_of_work.UnitOfWork]
+):
+    await uow_class.compile_statements()
+
+    for table in (
+        "products",
+        "batches",
+        "order_lines",
+        "allocations",
+        "events",
+        "allocations_view",
+        "stock_view",
+    ):
+        rows = list(await database_session.execute(text(f'SELECT * FROM "{table}"')))
+        assert rows == []
+
+
 async def try_to_allocate(
     order_id: str,
     sku: str,
@@ -116,6 +134,8 @@ async def try_to_allocate(
 async def test_concurrent_updates_to_version_are_not_allowed(
     database_session: AsyncSession, uow_class: type[unit_of_work.UnitOfWork]
 ):
+    if database_session.bind.dialect.name == "sqlite":
+        pytest.skip("SQLite takes the write lock up front, writers wait instead")
     sku, batch = random_sku(), random_batchref()
     await insert_batch(database_session, batch, sku, 100, eta=None, product_version=1)
     await database_session.commit()
@@ -145,3 +165,26 @@ async def test_concurrent_updates_to_version_are_not_allowed(
         dict(sku=sku),
     )
     assert len(orders.all()) == 1
+
+
+async def test_concurrent_updates_are_serialized_on_sqlite(
+    database_session: AsyncSession, uow_class: type[unit_of_work.UnitOfWork]
+):
+    if database_session.bind.dialect.name != "sqlite":
+        pytest.skip("Only SQLite serializes writers")
+    sku, batch = random_sku(), random_batchref()
+    await insert_batch(database_session, batch, sku, 100, eta=None, product_version=1)
+    await database_session.commit()
+
+    exceptions: list[Exception] = []
+    await asyncio.gather(
+        try_to_allocate(random_order_id(1), sku, exceptions, uow_class),
+        try_to_allocate(random_order_id(2), sku, exceptions, uow_class),
+    )
+
+    [[version]] = await database_session.execute(
+        text("SELECT version_number FROM products WHERE sku=:sku"),
+        dict(sku=sku),
+    )
+    assert version == 3
+    assert exceptions == []
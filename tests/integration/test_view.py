@@ -1,14 +1,21 @@
+import asyncio
 from datetime import date
-from typing import TypeVar
+from typing import Any, Optional, TypeVar
 
 import pytest
 from allocation import bootstrap
 from allocation.adapter import email_sender, unit_of_work
+from allocation.adapter.read_model import (
+    AllocationsViewRebuilder,
+    SkuRange,
+    StockViewRebuilder,
+)
 from allocation.domain.messages import commands
 from allocation.domain.messages.base import Message
 from allocation.service import views
-from allocation.service.message_bus import Handler, MessageBus
-from sqlalchemy.ext.asyncio import AsyncSession
+from allocation.service.message_bus import Handler, MessageBus, MessageCatcher
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import clear_mappers
 
 today = date.today()
@@ -60,8 +67,8 @@ async def test_allocations_view(
     )
 
     assert await views.allocations("order1", database_session) == [
-        {"sku": "sku1", "batchref": "sku1batch"},
-        {"sku": "sku2", "batchref": "sku2batch"},
+        {"sku": "sku1", "qty": 20, "batchref": "sku1batch"},
+        {"sku": "sku2", "qty": 20, "batchref": "sku2batch"},
     ]
 
 
@@ -75,9 +82,283 @@ async def test_deallocation(message_bus: MessageBus, database_session: AsyncSess
     await message_bus.handle(commands.Allocate(order_id="o1", sku="sku1", qty=40))
 
     [allocation] = await views.allocations("o1", database_session)
-    assert allocation == {"sku": "sku1", "batchref": "b1"}
+    assert allocation == {"sku": "sku1", "qty": 40, "batchref": "b1"}
 
     await message_bus.handle(commands.ChangeBatchQuantity(ref="b1", qty=10))
 
     [allocation] = await views.allocations("o1", database_session)
-    assert allocation == {"sku": "sku1", "batchref": "b2"}
+    assert allocation == {"sku": "sku1", "qty": 40, "batchref": "b2"}
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_stock_view(message_bus: MessageBus, database_session: AsyncSession):
+    await message_bus.handle(
+        commands.CreateBatch(ref="b1", sku="sku1", qty=50, eta=None)
+    )
+    await message_bus.handle(
+        commands.CreateBatch(ref="b2", sku="sku1", qty=50, eta=today)
+    )
+    await message_bus.handle(
+        commands.CreateBatch(ref="b3", sku="sku2", qty=10, eta=None)
+    )
+    await message_bus.handle(commands.Allocate(order_id="o1", sku="sku1", qty=40))
+    await message_bus.handle(commands.ChangeBatchQuantity(ref="b1", qty=10))
+
+    stock = await views.stock("sku1", database_session)
+    assert stock is not None
+    assert stock["available"] == 20
+    assert [
+        (batch["batchref"], batch["purchased"], batch["allocated"])
+        for batch in stock["batches"]
+    ] == [("b1", 10, 0), ("b2", 50, 40)]
+
+    assert await views.sku_of_batchref("b3", database_session) == "sku2"
+    assert await views.sku_of_batchref("b4", database_session) is None
+
+    stocks = await views.stocks(["sku1", "sku2", "sku3"], database_session)
+    assert {sku: stock["available"] for sku, stock in stocks.items()} == {
+        "sku1": 20,
+        "sku2": 10,
+    }
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_stock_view_counts_a_line_allocated_again_once(
+    message_bus: MessageBus, database_session: AsyncSession
+):
+    await message_bus.handle(
+        commands.CreateBatch(ref="b1", sku="sku1", qty=10, eta=None)
+    )
+    for _ in range(2):
+        await message_bus.handle(commands.Allocate(order_id="o1", sku="sku1", qty=4))
+    await message_bus.handle(commands.Allocate(order_id="o2", sku="sku1", qty=4))
+
+    allocated = await database_session.execute(
+        text(
+            "SELECT sum(order_lines.qty) FROM allocations"
+            " JOIN order_lines ON allocations.orderline_id = order_lines.id"
+        )
+    )
+    assert allocated.scalar() == 8
+    await database_session.commit()
+    stock = await views.stock("sku1", database_session)
+    assert stock is not None
+    assert stock["available"] == 2
+    assert [batch["allocated"] for batch in stock["batches"]] == [8]
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_allocations_are_paged_and_streamed_in_sku_order(
+    message_bus: MessageBus, database_session: AsyncSession
+):
+    for sku in ("sku3", "sku1", "sku4", "sku2"):
+        await message_bus.handle(
+            commands.CreateBatch(ref=f"{sku}batch", sku=sku, qty=50, eta=None)
+        )
+        await message_bus.handle(commands.Allocate(order_id="o1", sku=sku, qty=10))
+    # A second line of the same sku, which a page boundary falls between.
+    await message_bus.handle(commands.Allocate(order_id="o1", sku="sku2", qty=5))
+
+    pages: list[list[dict[str, Any]]] = []
+    after: Optional[tuple[str, int]] = None
+    while page := await views.allocations("o1", database_session, after=after, limit=2):
+        pages.append(page)
+        after = (page[-1]["sku"], page[-1]["qty"])
+    assert [[(row["sku"], row["qty"]) for row in page] for page in pages] == [
+        [("sku1", 10), ("sku2", 5)],
+        [("sku2", 10), ("sku3", 10)],
+        [("sku4", 10)],
+    ]
+    assert pages[-1] == [{"sku": "sku4", "qty": 10, "batchref": "sku4batch"}]
+
+    chunks = [
+        chunk
+        async for chunk in views.stream_allocations(
+            "o1", database_session, chunk_size=3
+        )
+    ]
+    assert [len(chunk) for chunk in chunks] == [3, 2]
+    assert [row for chunk in chunks for row in chunk] == [
+        row for page in pages for row in page
+    ]
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_allocation_pages_are_read_through_the_order_line_index(
+    database_session: AsyncSession,
+):
+    query = views._allocations_query(True, 10)
+    params = {"order_id": "o1", "after_sku": "sku1", "after_qty": 10, "limit": 10}
+    async with database_session.begin():
+        if database_session.bind.dialect.name == "sqlite":
+            results = await database_session.execute(
+                text(f"EXPLAIN QUERY PLAN {query.text}"), params
+            )
+            plan = " ".join(row.detail for row in results)
+            assert "USING INDEX ix_allocations_view_order_line" in plan
+            assert "TEMP B-TREE" not in plan
+        else:
+            await database_session.execute(text("SET LOCAL enable_seqscan = off"))
+            results = await database_session.execute(
+                text(f"EXPLAIN {query.text}"), params
+            )
+            plan = " ".join(row[0] for row in results)
+            assert "ix_allocations_view_order_line" in plan
+            assert "Sort" not in plan
+
+
+async def allocate_across_skus(message_bus: MessageBus):
+    for sku in ("sku1", "sku2", "sku3", "sku4"):
+        await message_bus.handle(
+            commands.CreateBatch(ref=f"{sku}batch", sku=sku, qty=50, eta=None)
+        )
+        for order in ("order1", "order2"):
+            await message_bus.handle(commands.Allocate(order_id=order, sku=sku, qty=10))
+
+
+async def view_rows(database_session: AsyncSession):
+    rows = await database_session.execute(
+        text("SELECT order_id, sku, qty, batchref FROM allocations_view")
+    )
+    return sorted(rows.all())
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_rebuild_recomputes_the_view(
+    message_bus: MessageBus,
+    database_session: AsyncSession,
+    database_engine: AsyncEngine,
+    uow_class: type[unit_of_work.UnitOfWork],
+):
+    await allocate_across_skus(message_bus)
+    expected = await view_rows(database_session)
+    await database_session.execute(text("DELETE FROM allocations_view"))
+    await database_session.execute(
+        text(
+            "INSERT INTO allocations_view (order_id, sku, qty, batchref)"
+            " VALUES ('x', 'sku1', 1, 'y')"
+        )
+    )
+    await database_session.commit()
+
+    await AllocationsViewRebuilder(database_engine, chunks=3).rebuild()
+    await AllocationsViewRebuilder(database_engine, chunks=3).rebuild()
+
+    assert len(expected) == 8
+    assert await view_rows(database_session) == expected
+
+    # An allocation copied by the rebuild may still be projected afterwards.
+    await database_session.commit()
+    with MessageCatcher():
+        async with uow_class() as uow:
+            await uow.allocations_view.add(*expected[0])
+            await uow.commit()
+    assert await view_rows(database_session) == expected
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_projections_running_across_a_rebuild_reach_the_new_views(
+    message_bus: MessageBus,
+    database_session: AsyncSession,
+    database_engine: AsyncEngine,
+):
+    await allocate_across_skus(message_bus)
+    rebuilders = [
+        AllocationsViewRebuilder(database_engine, chunks=4),
+        StockViewRebuilder(database_engine, chunks=4),
+    ]
+
+    async def allocate_meanwhile():
+        for i in range(8):
+            await message_bus.handle(
+                commands.Allocate(order_id=f"late{i}", sku=f"sku{i % 4 + 1}", qty=1)
+            )
+            await asyncio.sleep(0)
+
+    await asyncio.gather(
+        *(rebuilder.rebuild() for rebuilder in rebuilders), allocate_meanwhile()
+    )
+
+    for rebuilder in rebuilders:
+        assert await rebuilder.verify(repair=False) == []
+    assert len(await view_rows(database_session)) == 16
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_lines_of_an_order_differing_in_quantity_are_kept_apart(
+    message_bus: MessageBus,
+    database_session: AsyncSession,
+    database_engine: AsyncEngine,
+):
+    await message_bus.handle(
+        commands.CreateBatch(ref="b1", sku="sku1", qty=50, eta=None)
+    )
+    await message_bus.handle(commands.Allocate(order_id="o1", sku="sku1", qty=4))
+    await message_bus.handle(commands.Allocate(order_id="o1", sku="sku1", qty=5))
+    expected = [("o1", "sku1", 4, "b1"), ("o1", "sku1", 5, "b1")]
+    assert await view_rows(database_session) == expected
+    await database_session.commit()
+    rebuilder = AllocationsViewRebuilder(database_engine)
+
+    assert await rebuilder.verify(repair=False) == []
+    await rebuilder.rebuild()
+
+    assert await view_rows(database_session) == expected
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_verify_rewrites_only_the_drifted_ranges(
+    message_bus: MessageBus,
+    database_session: AsyncSession,
+    database_engine: AsyncEngine,
+):
+    await allocate_across_skus(message_bus)
+    expected = await view_rows(database_session)
+    await database_session.execute(
+        text("DELETE FROM allocations_view WHERE sku = 'sku3' AND order_id = 'order2'")
+    )
+    await database_session.commit()
+    rebuilder = AllocationsViewRebuilder(database_engine, chunks=4)
+
+    assert await rebuilder.verify(repair=False) == [SkuRange("sku2", "sku3")]
+    assert await rebuilder.verify() == [SkuRange("sku2", "sku3")]
+    assert await rebuilder.verify() == []
+    assert await view_rows(database_session) == expected
+
+
+async def stock_rows(database_session: AsyncSession):
+    rows = await database_session.execute(
+        text(
+            "SELECT sku, batchref, eta, purchased_quantity, allocated_quantity"
+            " FROM stock_view"
+        )
+    )
+    return sorted(rows.all())
+
+
+@pytest.mark.usefixtures("initialize_database")
+async def test_stock_view_is_backfilled_from_batches_and_allocations(
+    message_bus: MessageBus,
+    database_session: AsyncSession,
+    database_engine: AsyncEngine,
+):
+    await allocate_across_skus(message_bus)
+    await message_bus.handle(
+        commands.CreateBatch(ref="sku1later", sku="sku1", qty=5, eta=today)
+    )
+    expected = await stock_rows(database_session)
+    # As on a database whose batches predate the view.
+    await database_session.execute(text("DELETE FROM stock_view"))
+    await database_session.commit()
+    rebuilder = StockViewRebuilder(database_engine, chunks=3)
+
+    assert len(await rebuilder.verify(repair=False)) == 3
+    await rebuilder.rebuild()
+    await rebuilder.rebuild()
+    assert await rebuilder.verify(repair=False) == []
+
+    assert len(expected) == 5
+    assert await stock_rows(database_session) == expected
+    await database_session.commit()
+    stock = await views.stock("sku1", database_session)
+    assert stock is not None and stock["available"] == 35
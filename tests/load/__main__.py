@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import json
+from typing import Any
+
+from sqlalchemy import event
+
+from .harness import (
+    ASGIClient,
+    Client,
+    HTTPClient,
+    LoadReport,
+    MessageOutcomes,
+    Workload,
+    run,
+    seed,
+)
+
+
+async def create_tables() -> None:
+    from allocation.adapter.orm import mapper_registry
+    from allocation.adapter.unit_of_work import engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(mapper_registry.metadata.create_all)
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    workload = Workload(
+        skus=args.skus,
+        batches_per_sku=args.batches_per_sku,
+        batch_qty=args.batch_qty,
+        skew=args.skew,
+        read_ratio=args.read_ratio,
+        seed=args.seed,
+    )
+    report = LoadReport()
+    if args.url:
+        # Only the client side is visible against a running server.
+        client = HTTPClient(args.url, args.concurrency)
+        try:
+            if not args.no_seed:
+                await seed(client, workload)
+            await run(client, workload, args.requests, args.concurrency, report)
+        finally:
+            await client.close()
+        return report.summary()
+
+    from allocation.adapter.unit_of_work import engine
+    from allocation.entrypoint import fastapi_
+    from allocation.service.tracing import MultiSpanExporter
+
+    if args.create_tables:
+        await create_tables()
+    round_trips = 0
+
+    def count_round_trip(*_: Any):
+        nonlocal round_trips
+        round_trips += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_round_trip)
+    outcomes = MessageOutcomes()
+
+    client: Client
+    if args.mode == "socket":
+        import uvicorn
+
+        server = uvicorn.Server(
+            uvicorn.Config(fastapi_.app, host="127.0.0.1", port=0, log_level="warning")
+        )
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        [socket] = server.servers[0].sockets
+        host, port = socket.getsockname()[:2]
+        client = HTTPClient(f"http://{host}:{port}", args.concurrency)
+    else:
+        lifespan = fastapi_.app.router.lifespan_context(fastapi_.app)
+        await lifespan.__aenter__()
+        client = ASGIClient(fastapi_.app)
+    # The bus is bootstrapped once the app has started.
+    fastapi_.bus.span_exporter = MultiSpanExporter(
+        [exporter for exporter in (fastapi_.bus.span_exporter, outcomes) if exporter]
+    )
+    try:
+        if not args.no_seed:
+            await seed(client, workload)
+        outcomes.errors.clear()
+        outcomes.messages.clear()
+        round_trips = 0
+        await run(client, workload, args.requests, args.concurrency, report)
+        # Let cascades started by the last responses finish before counting.
+        await asyncio.sleep(args.drain)
+        report.round_trips = round_trips
+        report.outcomes = outcomes
+    finally:
+        if isinstance(client, HTTPClient):
+            await client.close()
+        if args.mode == "socket":
+            server.should_exit = True
+            await serving
+        else:
+            await lifespan.__aexit__(None, None, None)
+        event.remove(engine.sync_engine, "before_cursor_execute", count_round_trip)
+    return report.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test the HTTP API. The app under test uses the "
+        "database of DATABASE_URL, Postgres or sqlite+aiosqlite."
+    )
+    parser.add_argument("--mode", choices=["asgi", "socket"], default="asgi")
+    parser.add_argument("--url", help="Target a running server instead.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--skus", type=int, default=100)
+    parser.add_argument("--batches-per-sku", type=int, default=3)
+    parser.add_argument("--batch-qty", type=int, default=1000)
+    parser.add_argument(
+        "--skew", type=float, default=1.0, help="Zipf exponent, 0 is uniform."
+    )
+    parser.add_argument("--read-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drain", type=float, default=0.5)
+    parser.add_argument("--create-tables", action="store_true")
+    parser.add_argument("--no-seed", action="store_true")
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
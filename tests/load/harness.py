@@ -0,0 +1,253 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional, Protocol
+
+from allocation.service.tracing import Span, SpanExporter
+
+# Conflicts show up as StaleDataError on version checks, or as the database
+# refusing the transaction: serialization failures on Postgres, locks on SQLite.
+STALE_VERSION_REASONS = ("StaleDataError", "could not serialize", "database is locked")
+
+
+class Client(Protocol):
+    async def request(
+        self, _method: str, _path: str, _body: Optional[dict[str, Any]] = None
+    ) -> tuple[int, bytes]:
+        ...
+
+
+class ASGIClient(Client):
+    # Calls the application directly, without a socket. The response is
+    # complete once its last body chunk is sent, background tasks included in
+    # the app call are not part of the latency.
+
+    def __init__(self, app: Callable[..., Awaitable[None]]):
+        self._app = app
+
+    async def request(
+        self, method: str, path: str, body: Optional[dict[str, Any]] = None
+    ) -> tuple[int, bytes]:
+        payload = json.dumps(body).encode() if body is not None else b""
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"host", b"load"),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": ("load", 80),
+        }
+        received = False
+        status = 500
+        chunks: list[bytes] = []
+        done = asyncio.get_running_loop().create_future()
+
+        async def receive() -> dict[str, Any]:
+            nonlocal received
+            if received:
+                await asyncio.Future()
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+
+        async def send(message: dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body") and not done.done():
+                    done.set_result(None)
+
+        async def call() -> None:
+            try:
+                await self._app(scope, receive, send)
+            except Exception as e:
+                if not done.done():
+                    done.set_exception(e)
+                else:
+                    raise
+
+        task = asyncio.create_task(call())
+        await done
+        if status >= 500:
+            # The error middleware re-raises right after answering, the
+            # exception says more than "Internal Server Error".
+            await task
+        elif not task.done():
+            # Failures after the response are seen by the bus, not the client.
+            task.add_done_callback(lambda task: task.exception())
+        return status, b"".join(chunks)
+
+
+class HTTPClient(Client):
+    def __init__(self, base_url: str, connections: int):
+        import aiohttp
+
+        self._base_url = base_url.rstrip("/")
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=connections)
+        )
+
+    async def request(
+        self, method: str, path: str, body: Optional[dict[str, Any]] = None
+    ) -> tuple[int, bytes]:
+        async with self._session.request(
+            method, self._base_url + path, json=body
+        ) as response:
+            return response.status, await response.read()
+
+    async def close(self) -> None:
+        await self._session.close()
+
+
+@dataclass
+class Workload:
+    skus: int = 100
+    batches_per_sku: int = 3
+    batch_qty: int = 1000
+    line_qty: int = 1
+    # Zipf exponent over SKU popularity, 0 is uniform and 1 or more is hot SKUs.
+    skew: float = 1.0
+    read_ratio: float = 0.5
+    seed: int = 0
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._sku_names = [f"LOAD-{i:05d}" for i in range(self.skus)]
+        self._weights = [1 / (rank + 1) ** self.skew for rank in range(self.skus)]
+        self._orders: list[str] = []
+        self._issued = 0
+
+    def batches(self) -> list[dict[str, Any]]:
+        return [
+            dict(ref=f"{sku}-{i}", sku=sku, qty=self.batch_qty, eta=None)
+            for sku in self._sku_names
+            for i in range(self.batches_per_sku)
+        ]
+
+    def next_request(self) -> tuple[str, str, str, Optional[dict[str, Any]]]:
+        if self._orders and self._random.random() < self.read_ratio:
+            order_id = self._random.choice(self._orders)
+            return "read", "GET", f"/allocations/{order_id}", None
+        [sku] = self._random.choices(self._sku_names, self._weights)
+        self._issued += 1
+        order_id = f"load-order-{self._issued}"
+        self._orders.append(order_id)
+        body = dict(order_id=order_id, sku=sku, qty=self.line_qty)
+        return "allocate", "POST", "/allocate", body
+
+
+@dataclass
+class MessageOutcomes(SpanExporter):
+
+    errors: Counter[str] = field(default_factory=Counter)
+    messages: Counter[str] = field(default_factory=Counter)
+
+    def export(self, span: Span) -> None:
+        self.messages[span.message_type] += 1
+        if span.error:
+            self.errors[span.error] += 1
+
+
+@dataclass
+class LoadReport:
+
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    statuses: Counter[str] = field(default_factory=Counter)
+    errors: Counter[str] = field(default_factory=Counter)
+    elapsed: float = 0.0
+    round_trips: Optional[int] = None
+    outcomes: Optional[MessageOutcomes] = None
+
+    @property
+    def requests(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    def record(self, kind: str, status: int, latency: float) -> None:
+        self.latencies.setdefault(kind, []).append(latency)
+        self.statuses[f"{kind} {status}"] += 1
+
+    def error_classes(self) -> dict[str, int]:
+        classes: Counter[str] = Counter()
+        for error, count in self.errors.items():
+            if any(reason in error for reason in STALE_VERSION_REASONS):
+                classes["stale_version"] += count
+            else:
+                classes[error.split(":")[0]] += count
+        return dict(classes)
+
+    def summary(self) -> dict[str, Any]:
+        summary: dict[str, Any] = {
+            "requests": self.requests,
+            "elapsed": self.elapsed,
+            "rps": self.requests / self.elapsed if self.elapsed else 0.0,
+            "latency": {
+                kind: {f"p{p}": percentile(latencies, p) for p in (50, 90, 99, 100)}
+                for kind, latencies in self.latencies.items()
+            },
+            "statuses": dict(self.statuses),
+            "errors": self.error_classes(),
+        }
+        if self.outcomes is not None:
+            summary["handler_errors"] = dict(self.outcomes.errors)
+            summary["out_of_stock"] = self.outcomes.messages["OutOfStock"]
+        if self.round_trips is not None and self.requests:
+            summary["db_round_trips_per_request"] = self.round_trips / self.requests
+        return summary
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def seed(client: Client, workload: Workload) -> None:
+    for batch in workload.batches():
+        status, body = await client.request("POST", "/add_batch", batch)
+        if status >= 400:
+            raise RuntimeError(f"Seeding failed with {status}: {body!r}")
+
+
+async def run(
+    client: Client,
+    workload: Workload,
+    requests: int,
+    concurrency: int,
+    report: LoadReport,
+) -> LoadReport:
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            kind, method, path, body = workload.next_request()
+            started = time.perf_counter()
+            try:
+                status, response = await client.request(method, path, body)
+                if status >= 500:
+                    report.errors[f"HTTP {status}: {response[:200]!r}"] += 1
+            except Exception as e:
+                report.errors[f"{type(e).__name__}: {e}"] += 1
+                status = 500
+            report.record(kind, status, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    report.elapsed = time.perf_counter() - started
+    return report
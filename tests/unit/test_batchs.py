@@ -1,4 +1,7 @@
+from dataclasses import FrozenInstanceError
 from datetime import date
+
+import pytest
 from allocation.domain.models import Batch, OrderLine
 
 
@@ -61,3 +64,13 @@ def test_allocation_is_idempotent():
     batch.allocate(line)
     batch.allocate(line)
     assert batch.available_quantity == 18
+
+
+def test_order_line_fields_are_frozen():
+    line = OrderLine(order_id="order-123", sku="SMALL-TABLE", qty=2)
+
+    with pytest.raises(FrozenInstanceError):
+        line.qty = 3  # type: ignore
+    line._sa_instance_state = object()  # type: ignore
+
+    assert line == OrderLine(order_id="order-123", sku="SMALL-TABLE", qty=2)
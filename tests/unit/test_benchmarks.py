@@ -0,0 +1,64 @@
+from pathlib import Path
+
+from ..benchmarks.harness import Benchmark, Report, Result, compare, run
+
+
+def report(**per_op: float) -> Report:
+    return Report(
+        results=[
+            Result(name=name, ops=1, rounds=1, min=value, median=value, stdev=0.0)
+            for name, value in per_op.items()
+        ]
+    )
+
+
+def test_reports_only_slowdowns_beyond_threshold():
+    baseline = report(fast=1.0, slow=1.0, removed=1.0)
+    current = report(fast=1.1, slow=1.5, added=9.0)
+
+    [regression] = compare(current, baseline, threshold=0.2)
+
+    assert regression.name == "slow"
+    assert regression.ratio == 1.5
+
+
+def test_reports_memory_growth_beyond_threshold():
+    baseline = report(tracked=1.0, untracked=1.0)
+    current = report(tracked=1.0, untracked=1.0)
+    baseline.results[0].bytes_per_op = 100.0
+    current.results[0].bytes_per_op = 150.0
+
+    [regression] = compare(current, baseline, threshold=0.2)
+
+    assert (regression.name, regression.metric) == ("tracked", "memory")
+
+
+def test_measures_memory_kept_by_the_call():
+    result = run(
+        [
+            Benchmark(
+                "lists",
+                lambda: lambda: [[] for _ in range(1000)],
+                ops=1000,
+                rounds=1,
+                track_memory=True,
+            )
+        ]
+    )
+
+    [measured] = result.results
+    assert measured.bytes_per_op is not None
+    assert measured.bytes_per_op >= 56
+
+
+def test_results_survive_a_round_trip(tmp_path: Path):
+    calls: list[int] = []
+
+    async def work():
+        calls.append(1)
+
+    result = run([Benchmark("async", lambda: work, ops=2, rounds=3)])
+    result.dump(tmp_path / "results.json")
+
+    assert len(calls) == 3
+    assert Report.load(tmp_path / "results.json") == result
@@ -0,0 +1,199 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Hashable
+
+import pytest
+from allocation import bootstrap
+from allocation.adapter.command_source import (
+    FileCommandSource,
+    InMemoryCommandSource,
+    KafkaCommandSource,
+    encode,
+)
+from allocation.adapter.memory import InMemoryStore, InMemoryUnitOfWork
+from allocation.domain.messages import commands
+from allocation.entrypoint.consumer import CommandConsumer
+from allocation.port.command_source import Delivery
+from allocation.service.exceptions import HandlerTimeout
+from allocation.service.message_bus import MessageBus
+
+from .test_handlers import FakeEmailSender
+
+
+@pytest.fixture
+def store():
+    return InMemoryStore()
+
+
+@pytest.fixture
+def bus(store: InMemoryStore):
+    return bootstrap.bootstrap(
+        start_orm_mapping=False,
+        uow_class=InMemoryUnitOfWork.with_store(store),
+        email_sender=FakeEmailSender(),
+    )
+
+
+async def test_commands_of_a_partition_are_handled_in_order(
+    bus: MessageBus, store: InMemoryStore
+):
+    source = InMemoryCommandSource()
+    for sku in ("LAMP", "DESK"):
+        source.put(commands.CreateBatch(ref=f"{sku}-1", sku=sku, qty=10), sku)
+        for i in range(5):
+            source.put(commands.Allocate(order_id=f"o{i}", sku=sku, qty=3), sku)
+    consumer = CommandConsumer(source, bus, batch_size=100, concurrency=2)
+    await source.start()
+
+    assert await consumer.run_once() == 12
+
+    assert source.committed == {"LAMP": 6, "DESK": 6}
+    for sku in ("LAMP", "DESK"):
+        [batch] = store.products[sku].batches
+        assert batch.available_quantity == 1
+    assert store.allocations_view == {
+        f"o{i}": {("LAMP", 3): "LAMP-1", ("DESK", 3): "DESK-1"} for i in range(3)
+    }
+
+
+async def test_rejected_and_undecodable_commands_are_skipped(bus: MessageBus):
+    source = InMemoryCommandSource()
+    source.put(commands.Allocate(order_id="o1", sku="NONEXISTENT", qty=1))
+    source.partitions[0].append(
+        Delivery(partition=0, offset=1, type="Unknown", payload="{}")
+    )
+    consumer = CommandConsumer(source, bus)
+    await source.start()
+
+    assert await consumer.run_once() == 2
+
+    assert source.committed == {0: 2}
+
+
+async def test_failures_are_retried(bus: MessageBus, store: InMemoryStore):
+    failures = [ConnectionError()]
+    allocate = bus._handler_map[commands.Allocate]
+
+    async def fail_once(*args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return await allocate(*args, **kwargs)
+
+    source = InMemoryCommandSource()
+    source.put(commands.CreateBatch(ref="b1", sku="LAMP", qty=10))
+    source.put(commands.Allocate(order_id="o1", sku="LAMP", qty=1))
+    consumer = CommandConsumer(source, bus, retry_delay=0)
+    bus._handler_map[commands.Allocate] = fail_once
+    await source.start()
+
+    assert await consumer.run_once() == 2
+
+    assert source.committed == {0: 2}
+    assert source.parked == []
+    assert store.allocations_view == {"o1": {("LAMP", 1): "b1"}}
+
+
+async def test_commands_failing_every_attempt_are_parked(bus: MessageBus):
+    attempts = 0
+
+    async def fail(*_, **__):
+        nonlocal attempts
+        attempts += 1
+        raise HandlerTimeout()
+
+    source = InMemoryCommandSource()
+    source.put(commands.Allocate(order_id="o1", sku="LAMP", qty=1))
+    source.put(commands.CreateBatch(ref="b1", sku="LAMP", qty=10))
+    consumer = CommandConsumer(source, bus, attempts=3, retry_delay=0)
+    bus._handler_map[commands.Allocate] = fail
+    await source.start()
+
+    assert await consumer.run_once() == 2
+
+    assert attempts == 3
+    assert [delivery.offset for delivery in source.parked] == [0]
+    assert source.committed == {0: 2}
+
+
+async def test_file_source_parks_commands_next_to_the_file(tmp_path: Path):
+    path = tmp_path / "commands.jsonl"
+    command = commands.Allocate(order_id="o1", sku="LAMP", qty=1)
+    path.write_text(encode(command) + "\n")
+    source = FileCommandSource(path)
+    await source.start()
+    [delivery] = await source.fetch(10, 0)
+
+    await source.park(delivery, HandlerTimeout())
+    await source.stop()
+
+    [parked] = (tmp_path / "commands.jsonl.parked").read_text().splitlines()
+    assert json.loads(parked) == {
+        **json.loads(encode(command)),
+        "error": "HandlerTimeout()",
+    }
+
+
+async def test_kafka_source_commits_only_partitions_still_assigned():
+    errors = pytest.importorskip("aiokafka.errors")
+    committed: list[dict[Hashable, int]] = []
+
+    class Consumer:
+        def assignment(self):
+            return {"p1"}
+
+        async def commit(self, offsets: dict[Hashable, int]):
+            committed.append(offsets)
+            raise errors.CommitFailedError()
+
+    source = KafkaCommandSource("kafka:9092", "commands", "allocation")
+    source._consumer = Consumer()
+
+    await source.commit({"p1": 3, "p2": 5})
+
+    assert committed == [{"p1": 3}]
+
+
+async def test_offsets_are_committed_per_batch(bus: MessageBus):
+    source = InMemoryCommandSource()
+    for i in range(5):
+        source.put(commands.CreateBatch(ref=f"b{i}", sku="LAMP", qty=10))
+    consumer = CommandConsumer(source, bus, batch_size=2, poll_timeout=0.01)
+    await source.start()
+
+    assert [await consumer.run_once() for _ in range(4)] == [2, 2, 1, 0]
+    assert source.committed == {0: 5}
+
+
+async def test_file_source_resumes_after_the_committed_offset(tmp_path: Path):
+    path = tmp_path / "commands.jsonl"
+    lines = [
+        encode(commands.CreateBatch(ref=f"b{i}", sku="LAMP", qty=10)) for i in range(3)
+    ]
+    path.write_text("\n".join(lines) + "\n" + lines[0][:10])
+    source = FileCommandSource(path)
+    await source.start()
+
+    deliveries = await source.fetch(10, 0)
+    await source.commit({path: deliveries[1].offset + 1})
+    await source.stop()
+
+    assert [delivery.offset for delivery in deliveries] == [0, 1, 2]
+    with open(path, "a") as file:
+        file.write(lines[0][10:] + "\n")
+    source = FileCommandSource(path)
+    await source.start()
+    assert [delivery.offset for delivery in await source.fetch(10, 0)] == [2, 3]
+    await source.stop()
+
+
+async def test_in_memory_source_waits_for_commands():
+    source = InMemoryCommandSource()
+    await source.start()
+    fetching = asyncio.create_task(source.fetch(10, 1))
+    await asyncio.sleep(0)
+
+    source.put(commands.CreateBatch(ref="b1", sku="LAMP", qty=10))
+
+    [delivery] = await fetching
+    assert delivery.type == "CreateBatch"
@@ -0,0 +1,67 @@
+import math
+from pathlib import Path
+
+from allocation.adapter.database import ReplicaRouter, create_engine, warm_up
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+def lag_probe(*lags: float | Exception):
+    remaining = list(lags)
+
+    async def measure_lag(_engine: AsyncEngine) -> float:
+        lag = remaining.pop(0)
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+
+    return measure_lag
+
+
+async def test_routes_reads_to_the_replica_while_it_keeps_up():
+    replica = create_engine("sqlite+aiosqlite://", read_only=True)
+    primary = create_engine("sqlite+aiosqlite://", read_only=True)
+    router = ReplicaRouter(
+        replica,
+        primary,
+        max_lag=1.0,
+        check_interval=0,
+        measure_lag=lag_probe(0.5, 3.0, RuntimeError("replica down"), 0.0),
+    )
+
+    assert await router.engine() is replica
+    assert await router.engine() is primary
+    assert await router.engine() is primary
+    assert router.lag == math.inf
+    assert await router.engine() is replica
+
+
+async def test_measures_lag_once_per_interval():
+    replica = create_engine("sqlite+aiosqlite://", read_only=True)
+    primary = create_engine("sqlite+aiosqlite://", read_only=True)
+    router = ReplicaRouter(replica, primary, max_lag=1.0, measure_lag=lag_probe(3.0))
+
+    assert [await router.engine() for _ in range(3)] == [primary] * 3
+
+
+async def test_read_sessions_use_the_routed_engine():
+    replica = create_engine("sqlite+aiosqlite://", read_only=True)
+    router = ReplicaRouter(replica)
+
+    async with await router.session() as session:
+        assert session.bind is replica
+
+
+async def test_warms_up_no_more_connections_than_the_pool_keeps(tmp_path: Path):
+    engine = create_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'warm.db'}",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=2,
+        max_overflow=1,
+        pool_timeout=0.1,
+    )
+
+    await warm_up(engine, 5)
+
+    assert engine.sync_engine.pool.checkedin() == 2  # type: ignore
+    await engine.dispose()
@@ -1,14 +1,16 @@
+import asyncio
 from contextvars import ContextVar
 from datetime import date
 from email.message import EmailMessage
 from types import TracebackType
-from typing import Optional
+from typing import Any, Optional
 
 import pytest
 from allocation import bootstrap, port
-from allocation.domain.messages import commands
+from allocation.domain.messages import commands, events
 from allocation.domain.models import Product
-from allocation.service import exceptions
+from allocation.service import exceptions, handlers
+from allocation.service.message_bus import MessageBus, get_issued_messages, issue
 
 
 class FakeRepository(port.repository.ProductRepository):
@@ -217,3 +219,105 @@ class TestChangeBatchQuantity:
         await bus.handle(commands.ChangeBatchQuantity(ref="batch1", qty=25))
         assert batch1.available_quantity == 5
         assert batch2.available_quantity == 30
+
+    async def test_reallocates_deallocated_lines_in_one_unit_of_work(self):
+        bus = bootstrap_test_app()
+        history = [
+            commands.CreateBatch(ref="batch1", sku="SHINY-SHELF", qty=50, eta=None),
+            commands.CreateBatch(
+                ref="batch2", sku="SHINY-SHELF", qty=50, eta=date.today()
+            ),
+            *(
+                commands.Allocate(order_id=f"order{i}", sku="SHINY-SHELF", qty=10)
+                for i in range(5)
+            ),
+        ]
+        for msg in history:
+            await bus.handle(msg)
+
+        uows = uows_context_var.get()
+        handled_uows = len(uows)
+        await bus.handle(commands.ChangeBatchQuantity(ref="batch1", qty=10))
+
+        async with FakeUnitOfWork() as uow:
+            product = await uow.products.get(sku="SHINY-SHELF")
+            assert product
+            [batch1, batch2] = product.batches
+            assert batch1.available_quantity == 0
+            assert batch2.available_quantity == 10
+        committed = [uow for uow in uows[handled_uows:] if uow.committed]
+        assert len(committed) == 2
+
+
+class TestParallelHandlers:
+    async def test_each_handler_only_sees_the_messages_it_issued(self):
+        seen: dict[str, list[str]] = {}
+
+        async def first(evt: events.OutOfStock, **_: Any):
+            issue(events.OutOfStock(aggregate_id="first", sku="first"))
+            await asyncio.sleep(0.01)
+            seen["first"] = [msg.sku for msg in get_issued_messages()]
+
+        async def second(evt: events.OutOfStock, **_: Any):
+            await asyncio.sleep(0)
+            issue(events.OutOfStock(aggregate_id="second", sku="second"))
+            await asyncio.sleep(0.01)
+            seen["second"] = [msg.sku for msg in get_issued_messages()]
+
+        bus = MessageBus(deps={})
+        bus.register_handlers(events.OutOfStock, [first, second])
+        hooked = await bus.handle(
+            events.OutOfStock(aggregate_id="test", sku="test"), return_hooked_task=True
+        )
+        hooked.cancel()
+
+        assert seen == {"first": ["first"], "second": ["second"]}
+
+
+class FakeView:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.added: list[tuple[Any, ...]] = []
+
+    async def add(self, *line: Any):
+        if self.failures:
+            self.failures -= 1
+            raise exceptions.SchemaChanged()
+        self.added.append(line)
+
+    async def recount_allocated(self, sku: str, batchref: str):
+        ...
+
+
+class TestProjections:
+    async def test_run_again_when_the_view_was_swapped_under_them(self):
+        view = FakeView(failures=1)
+
+        class ViewUnitOfWork(FakeUnitOfWork):
+            def __init__(self):
+                super().__init__()
+                self.allocations_view = self.stock_view = view  # type: ignore
+
+        await handlers.add_allocation_to_read_model(
+            events.Allocated(
+                aggregate_id="LAMP", order_id="o1", sku="LAMP", qty=1, batchref="b1"
+            ),
+            uow_factory=ViewUnitOfWork,
+        )
+
+        assert view.added == [("o1", "LAMP", 1, "b1")]
+        assert [uow.committed for uow in uows_context_var.get()] == [False, True]
+
+    async def test_give_up_when_the_schema_keeps_changing(self):
+        class ViewUnitOfWork(FakeUnitOfWork):
+            def __init__(self):
+                super().__init__()
+                self.allocations_view = self.stock_view = FakeView(3)  # type: ignore
+
+        with pytest.raises(exceptions.SchemaChanged):
+            await handlers.add_allocation_to_read_model(
+                events.Allocated(
+                    aggregate_id="LAMP", order_id="o1", sku="LAMP", qty=1, batchref="b1"
+                ),
+                uow_factory=ViewUnitOfWork,
+            )
@@ -0,0 +1,35 @@
+from collections import Counter
+
+from ..load.harness import LoadReport, Workload
+
+
+def test_skewed_workload_prefers_hot_skus():
+    workload = Workload(skus=10, skew=2.0, read_ratio=0.0)
+    skus = Counter(workload.next_request()[3]["sku"] for _ in range(1000))  # type: ignore
+
+    assert skus.most_common(1)[0][0] == "LOAD-00000"
+    assert skus["LOAD-00000"] > 500
+
+
+def test_reads_only_target_issued_orders():
+    workload = Workload(skus=1, read_ratio=1.0)
+    first = workload.next_request()
+    reads = [workload.next_request() for _ in range(10)]
+
+    assert first[0] == "allocate"
+    assert {path for _, _, path, _ in reads} == {"/allocations/load-order-1"}
+
+
+def test_groups_conflicts_as_stale_version():
+    report = LoadReport(
+        errors=Counter(
+            {
+                "StaleDataError: UPDATE statement on table 'products'": 2,
+                "OperationalError: (sqlite3.OperationalError) database is locked": 1,
+                "DBAPIError: could not serialize access due to concurrent update": 1,
+                "InvalidSku: Invalid sku X": 3,
+            }
+        )
+    )
+
+    assert report.error_classes() == {"stale_version": 4, "InvalidSku": 3}
@@ -0,0 +1,202 @@
+from datetime import date
+
+import pytest
+from allocation import bootstrap
+from allocation.adapter.memory import (
+    InMemoryStore,
+    InMemoryUnitOfWork,
+    StockEntry,
+    VersionConflict,
+)
+from allocation.domain.messages import commands
+from allocation.domain.models import Batch, OrderLine, Product
+from allocation.service.message_bus import MessageCatcher
+
+from .test_handlers import FakeEmailSender
+
+
+@pytest.fixture
+def store():
+    return InMemoryStore()
+
+
+@pytest.fixture
+def uow_class(store: InMemoryStore):
+    return InMemoryUnitOfWork.with_store(store)
+
+
+@pytest.fixture(autouse=True)
+def catch_messages():
+    with MessageCatcher():
+        yield
+
+
+async def add_product(uow_class: type[InMemoryUnitOfWork], sku: str, *refs: str):
+    async with uow_class() as uow:
+        await uow.products.add(
+            Product(
+                sku=sku,
+                batches=[
+                    Batch(reference=ref, sku=sku, purchased_quantity=10, eta=None)
+                    for ref in refs
+                ],
+            )
+        )
+        await uow.commit()
+
+
+async def test_indexes_products_by_sku_and_batchref(
+    uow_class: type[InMemoryUnitOfWork],
+):
+    await add_product(uow_class, "LAMP", "batch1", "batch2")
+    async with uow_class() as uow:
+        product = await uow.products.get("LAMP")
+        assert product
+        assert await uow.products.get_by_batchref("batch2") is product
+        assert await uow.products.get_by_batchref("missing") is None
+
+
+async def test_gets_many_products_once_each(uow_class: type[InMemoryUnitOfWork]):
+    await add_product(uow_class, "LAMP", "batch1", "batch2")
+    await add_product(uow_class, "TABLE", "batch3")
+    async with uow_class() as uow:
+        lamp, table = await uow.products.get_many(["LAMP", "TABLE", "LAMP", "SOFA"])
+        assert [lamp.sku, table.sku] == ["LAMP", "TABLE"]
+        assert await uow.products.get_many_by_batchrefs(
+            ["batch1", "batch2", "batch3", "missing"]
+        ) == [lamp, table]
+
+
+async def test_uncommitted_changes_are_not_visible(
+    uow_class: type[InMemoryUnitOfWork], store: InMemoryStore
+):
+    await add_product(uow_class, "LAMP", "batch1")
+    async with uow_class() as uow:
+        product = await uow.products.get("LAMP")
+        assert product
+        product.allocate(OrderLine(order_id="order1", sku="LAMP", qty=3))
+    async with uow_class() as uow:
+        product = await uow.products.get("LAMP")
+        assert product
+        assert product.batches[0].available_quantity == 10
+    assert store.revisions["LAMP"] == 1
+
+
+async def test_concurrent_commit_raises_version_conflict(
+    uow_class: type[InMemoryUnitOfWork],
+):
+    await add_product(uow_class, "LAMP", "batch1")
+    async with uow_class() as uow1, uow_class() as uow2:
+        for uow in (uow1, uow2):
+            product = await uow.products.get("LAMP")
+            assert product
+            product.allocate(OrderLine(order_id="order1", sku="LAMP", qty=3))
+        await uow1.commit()
+        with pytest.raises(VersionConflict):
+            await uow2.commit()
+
+
+async def test_rolled_back_changes_are_not_committed(
+    uow_class: type[InMemoryUnitOfWork], store: InMemoryStore
+):
+    await add_product(uow_class, "LAMP", "batch1")
+    async with uow_class() as uow:
+        product = await uow.products.get("LAMP")
+        assert product
+        product.allocate(OrderLine(order_id="order1", sku="LAMP", qty=3))
+        await uow.rollback()
+        product = await uow.products.get("LAMP")
+        assert product
+        assert product.batches[0].available_quantity == 10
+        await uow.commit()
+    assert store.products["LAMP"].batches[0].available_quantity == 10
+    assert store.revisions["LAMP"] == 1
+
+
+async def test_products_only_read_are_neither_written_nor_checked(
+    uow_class: type[InMemoryUnitOfWork], store: InMemoryStore
+):
+    await add_product(uow_class, "LAMP", "batch1")
+    await add_product(uow_class, "TABLE", "batch2")
+    async with uow_class() as uow1, uow_class() as uow2:
+        assert await uow1.products.get("LAMP")
+        product = await uow1.products.get("TABLE")
+        assert product
+        product.allocate(OrderLine(order_id="order1", sku="TABLE", qty=3))
+        lamp = await uow2.products.get("LAMP")
+        assert lamp
+        lamp.allocate(OrderLine(order_id="order2", sku="LAMP", qty=3))
+        await uow2.commit()
+        await uow1.commit()
+    assert store.revisions == {"LAMP": 2, "TABLE": 2}
+
+
+async def test_handles_commands_through_the_bus(
+    uow_class: type[InMemoryUnitOfWork], store: InMemoryStore
+):
+    bus = bootstrap.bootstrap(
+        start_orm_mapping=False,
+        uow_class=uow_class,
+        email_sender=FakeEmailSender(),
+    )
+    await bus.handle(commands.CreateBatch(ref="b1", sku="LAMP", qty=10, eta=None))
+    await bus.handle(
+        commands.CreateBatch(ref="b2", sku="LAMP", qty=10, eta=date.today())
+    )
+    await bus.handle(commands.Allocate(order_id="o1", sku="LAMP", qty=10))
+    await bus.handle(commands.ChangeBatchQuantity(ref="b1", qty=5))
+
+    assert store.allocations_view == {"o1": {("LAMP", 10): "b2"}}
+    assert store.stock_view == {
+        "b1": StockEntry("LAMP", None, 5, 0),
+        "b2": StockEntry("LAMP", date.today(), 10, 10),
+    }
+    async with uow_class() as uow:
+        product = await uow.products.get("LAMP")
+        assert product
+        assert [batch.available_quantity for batch in product.batches] == [5, 0]
+
+
+async def test_allocating_a_line_again_counts_it_once(
+    uow_class: type[InMemoryUnitOfWork], store: InMemoryStore
+):
+    bus = bootstrap.bootstrap(
+        start_orm_mapping=False,
+        uow_class=uow_class,
+        email_sender=FakeEmailSender(),
+    )
+    await bus.handle(commands.CreateBatch(ref="b1", sku="LAMP", qty=10, eta=None))
+    for _ in range(2):
+        await bus.handle(commands.Allocate(order_id="o1", sku="LAMP", qty=4))
+    await bus.handle(commands.Allocate(order_id="o2", sku="LAMP", qty=4))
+
+    assert store.products["LAMP"].batches[0].allocated_quantity == 8
+    assert store.stock_view == {"b1": StockEntry("LAMP", None, 10, 8)}
+
+
+async def test_stores_are_kept_per_unit_of_work_class(
+    uow_class: type[InMemoryUnitOfWork], store: InMemoryStore
+):
+    other_store = InMemoryStore()
+    other_class = InMemoryUnitOfWork.with_store(other_store)
+    await add_product(uow_class, "LAMP", "batch1")
+    await add_product(other_class, "TABLE", "batch2")
+
+    assert list(store.products) == ["LAMP"]
+    assert list(other_store.products) == ["TABLE"]
+
+
+async def test_only_the_latest_events_are_kept_until_drained(
+    uow_class: type[InMemoryUnitOfWork], store: InMemoryStore
+):
+    store.max_events = 2
+    bus = bootstrap.bootstrap(
+        start_orm_mapping=False,
+        uow_class=uow_class,
+        email_sender=FakeEmailSender(),
+    )
+    for ref in ("b1", "b2", "b3"):
+        await bus.handle(commands.CreateBatch(ref=ref, sku="LAMP", qty=10, eta=None))
+
+    assert [event.batchref for event in store.drain_events()] == ["b2", "b3"]
+    assert store.events == {}
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import pytest
+from allocation.domain.messages.base import Command, Event, Message
+from allocation.service.exceptions import HandlerTimeout
+from allocation.service.loop_lag import LoopLagMonitor
+from allocation.service.message_bus import MessageBus, cpu_bound, issue
+from allocation.service.tracing import ChromeTraceFileExporter, InMemorySpanCollector
+
+
+class Compute(Command):
+    n: int
+
+
+class Computed(Event):
+    AGGREGATE_TYPE = "Test"
+    result: int
+
+
+def compute(cmd: Compute, **_: Any):
+    issue(Computed(aggregate_id="test", result=sum(range(cmd.n))))
+
+
+@cpu_bound
+def compute_in_process(cmd: Compute, **_: Any):
+    issue(Computed(aggregate_id="test", result=sum(range(cmd.n))))
+
+
+def block(cmd: Compute, **_: Any):
+    time.sleep(cmd.n / 1000)
+
+
+def build_bus(handler: Any, **kwargs: Any):
+    results: list[int] = []
+
+    async def collect(evt: Computed, **_: Any):
+        results.append(evt.result)
+
+    bus = MessageBus(deps={}, **kwargs)
+    bus.register_handler(Compute, handler)
+    bus.register_handlers(Computed, [collect])
+    return bus, results
+
+
+class TestSyncHandler:
+    async def test_messages_issued_in_thread_are_handled(self):
+        bus, results = build_bus(compute)
+        await bus.handle(Compute(n=10))
+        assert results == [45]
+
+    def test_cpu_bound_coroutine_functions_are_rejected(self):
+        @cpu_bound
+        async def compute_async(cmd: Compute, **_: Any):
+            ...
+
+        with pytest.raises(TypeError):
+            build_bus(compute_async)
+
+    async def test_cpu_bound_messages_issued_in_process_are_handled(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            bus, results = build_bus(compute_in_process, cpu_executor=executor)
+            await bus.handle(Compute(n=10))
+        assert results == [45]
+
+    async def test_does_not_block_event_loop(self):
+        bus, _ = build_bus(block)
+        async with LoopLagMonitor(interval=0.01) as monitor:
+            await bus.handle(Compute(n=300))
+        assert monitor.max_lag < 0.1
+
+
+async def sleep(cmd: Compute, **_: Any):
+    await asyncio.sleep(cmd.n / 1000)
+    issue(Computed(aggregate_id="test", result=cmd.n))
+
+
+class TestTimeout:
+    async def test_handler_timeout_is_reported_to_exception_hook(self):
+        reported: list[Exception] = []
+
+        async def exception_hook(msg: Message, handler: Any, exc: Exception):
+            reported.append(exc)
+
+        bus = MessageBus(deps={}, exception_hook=exception_hook)
+        bus.register_handler(Compute, sleep, timeout=0.01)
+        with pytest.raises(HandlerTimeout):
+            await bus.handle(Compute(n=1000))
+        [exc] = reported
+        assert isinstance(exc, HandlerTimeout)
+
+    async def test_per_handler_timeout_overrides_message_timeout(self):
+        bus, results = build_bus(sleep)
+        slow = Computed(aggregate_id="test", result=1000)
+        fast_results: list[int] = []
+
+        async def fast(evt: Computed, **_: Any):
+            fast_results.append(evt.result)
+
+        async def slow_handler(evt: Computed, **_: Any):
+            await asyncio.sleep(evt.result / 1000)
+            results.append(evt.result)
+
+        bus.register_handlers(
+            Computed,
+            [fast, slow_handler],
+            timeout=5,
+            handler_timeouts={slow_handler: 0.01},
+        )
+        await bus.handle(slow)
+        assert fast_results == [1000]
+        assert results == []
+
+    async def test_request_deadline_propagates_into_cascade(self):
+        bus = MessageBus(deps={})
+        handled: list[int] = []
+
+        async def slow_handler(evt: Computed, **_: Any):
+            await asyncio.sleep(1)
+            handled.append(evt.result)
+
+        bus.register_handler(Compute, sleep)
+        bus.register_handlers(Computed, [slow_handler])
+        started = time.monotonic()
+        await bus.handle(Compute(n=10), timeout=0.05)
+        assert time.monotonic() - started < 0.5
+        assert handled == []
+
+
+class TestTracing:
+    async def test_issued_messages_carry_correlation_and_causation(self):
+        collector = InMemorySpanCollector()
+        bus = MessageBus(deps={}, span_exporter=collector)
+        issued: list[Computed] = []
+
+        async def collect(evt: Computed, **_: Any):
+            issued.append(evt)
+
+        bus.register_handler(Compute, compute)
+        bus.register_handlers(Computed, [collect])
+        cmd = Compute(n=10)
+        await bus.handle(cmd)
+
+        [evt] = issued
+        assert evt.correlation_id == cmd.uid
+        assert evt.causation_id == cmd.uid
+        path = collector.critical_path(cmd.uid)
+        assert [span.handler for span in path] == ["compute", "collect"]
+        assert all(span.end >= span.start for span in path)
+
+    async def test_spans_are_written_in_chrome_trace_format(self, tmp_path: Path):
+        path = tmp_path / "trace.json"
+        exporter = ChromeTraceFileExporter(path)
+        bus, _ = build_bus(compute, span_exporter=exporter)
+        await bus.handle(Compute(n=10))
+        exporter.close()
+
+        events = json.loads(path.read_text().rstrip(",\n") + "]")
+        assert [event["name"] for event in events] == ["compute", "collect"]
+        assert all(event["ph"] == "X" for event in events)
+
+
+class TestIssuedMessages:
+    async def test_issued_messages_are_handled_in_order_once(self):
+        results: list[int] = []
+
+        async def issue_many(cmd: Compute, **_: Any):
+            issued = [Computed(aggregate_id="test", result=n) for n in range(cmd.n)]
+            for evt in [*issued, *issued]:
+                issue(evt)
+
+        async def collect(evt: Computed, **_: Any):
+            results.append(evt.result)
+
+        bus = MessageBus(deps={})
+        bus.register_handler(Compute, issue_many)
+        bus.register_handlers(Computed, [collect])
+        await bus.handle(Compute(n=20))
+
+        assert results == list(range(20))
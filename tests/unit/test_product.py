@@ -1,4 +1,6 @@
+import random
 from datetime import date, timedelta
+from typing import Optional
 
 import pytest
 
@@ -94,3 +96,52 @@ def test_increments_version_number():
     product.version_number = 7
     product.allocate(line)
     assert product.version_number == 8
+
+
+def random_product(rnd: random.Random) -> Product:
+    etas = [None, today, tomorrow, later]
+    return Product(
+        sku="BULK-SHELF",
+        batches=[
+            Batch(
+                reference=f"batch-{i}",
+                sku="BULK-SHELF",
+                purchased_quantity=rnd.randint(0, 60),
+                eta=rnd.choice(etas),
+            )
+            for i in range(rnd.randint(0, 5))
+        ],
+    )
+
+
+def allocate_one_by_one(product: Product, lines: list[OrderLine]):
+    batchrefs: list[Optional[str]] = []
+    for line in lines:
+        try:
+            batchrefs.append(product.allocate(line))
+        except OutOfStockException:
+            batchrefs.append(None)
+    return batchrefs
+
+
+def allocations(product: Product):
+    return {batch.reference: batch._allocations for batch in product.batches}
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_allocating_many_lines_matches_allocating_one_by_one(seed: int):
+    rnd = random.Random(seed)
+    product = random_product(rnd)
+    expected = random_product(random.Random(seed))
+    lines = [
+        OrderLine(order_id=f"order-{i}", sku="BULK-SHELF", qty=rnd.randint(0, 15))
+        for i in range(rnd.randint(0, 60))
+    ]
+    if rnd.random() < 0.2:
+        lines.append(OrderLine(order_id="other", sku="OTHER-SKU", qty=1))
+    if rnd.random() < 0.2 and lines:
+        lines.append(lines[0])
+
+    assert product.allocate_many(lines) == allocate_one_by_one(expected, lines)
+    assert allocations(product) == allocations(expected)
+    assert product.version_number == expected.version_number
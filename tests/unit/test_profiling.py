@@ -0,0 +1,45 @@
+import asyncio
+import time
+from pathlib import Path
+
+from allocation.service.profiling import Sampler, write_profile
+
+
+def spin(seconds: float):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+async def child_work():
+    spin(0.05)
+
+
+async def profiled_work():
+    spin(0.05)
+    await asyncio.create_task(child_work())
+
+
+async def unprofiled_work():
+    spin(0.05)
+
+
+async def test_attributes_samples_to_the_profiled_tasks_only(tmp_path: Path):
+    sampler = Sampler(interval=0.001)
+    sampler.install(asyncio.get_running_loop())
+    try:
+        unprofiled = asyncio.create_task(unprofiled_work())
+        with sampler.profiling("GET /work") as profile:
+            await asyncio.gather(asyncio.create_task(profiled_work()), unprofiled)
+    finally:
+        sampler.stop()
+
+    assert asyncio.get_running_loop().get_task_factory() is None
+
+    functions = {frame.split(" ")[0] for stack in profile.samples for frame in stack}
+    assert {"profiled_work", "child_work", "spin"} <= functions
+    assert "unprofiled_work" not in functions
+
+    path = write_profile(profile, tmp_path)
+    assert path.name.endswith("-GET__work.folded")
+    assert path.read_text() == profile.folded()
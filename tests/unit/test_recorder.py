@@ -0,0 +1,54 @@
+from datetime import date
+from pathlib import Path
+
+from allocation import bootstrap
+from allocation.adapter.recorder import MessageRecorder
+from allocation.domain.messages import commands
+from allocation.entrypoint.replay import replay, root_messages
+
+from .test_handlers import (
+    FakeEmailSender,
+    FakeUnitOfWork,
+    products_context_var,
+    set_products_context_var,  # noqa: F401
+    set_uows_context_var,  # noqa: F401
+)
+
+
+async def test_replays_recorded_commands(tmp_path: Path):
+    path = tmp_path / "recording.jsonl"
+    recorder = MessageRecorder(path)
+    bus = bootstrap.bootstrap(
+        start_orm_mapping=False,
+        uow_class=FakeUnitOfWork,
+        email_sender=FakeEmailSender(),
+        span_exporter=recorder,
+    )
+    history = [
+        commands.CreateBatch(ref="batch1", sku="RECORDED-LAMP", qty=20, eta=None),
+        commands.CreateBatch(
+            ref="batch2", sku="RECORDED-LAMP", qty=20, eta=date.today()
+        ),
+        commands.Allocate(order_id="order1", sku="RECORDED-LAMP", qty=10),
+        commands.Allocate(order_id="order2", sku="RECORDED-LAMP", qty=10),
+        commands.ChangeBatchQuantity(ref="batch1", qty=10),
+    ]
+    for msg in history:
+        await bus.handle(msg)
+    recorder.close()
+
+    roots = root_messages(str(path))
+    assert [message for _, message in roots] == history
+
+    products_context_var.get().clear()
+    report = await replay(
+        roots, uow_class=FakeUnitOfWork, speed=0, start_orm_mapping=False
+    )
+    assert len(report.latencies) == len(history)
+    assert report.conflicts == 0
+    async with FakeUnitOfWork() as uow:
+        product = await uow.products.get("RECORDED-LAMP")
+        assert product
+        [batch1, batch2] = product.batches
+        assert batch1.available_quantity == 0
+        assert batch2.available_quantity == 10
@@ -0,0 +1,88 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+import pytest
+from allocation.adapter.relay import OutboxRelay
+
+
+class FakeChannel:
+    def __init__(self):
+        self.callbacks: list[Callable[[], None]] = []
+
+    @asynccontextmanager
+    async def listen(self, callback: Callable[[], None]) -> AsyncIterator[None]:
+        self.callbacks.append(callback)
+        yield
+        self.callbacks.remove(callback)
+
+    def notify(self):
+        for callback in self.callbacks:
+            callback()
+
+
+async def never_publish(_envelopes):
+    raise AssertionError("nothing to publish")
+
+
+def counting_relay(monkeypatch: pytest.MonkeyPatch, relay: OutboxRelay) -> list[int]:
+    drains: list[int] = []
+
+    async def drain() -> int:
+        drains.append(len(drains))
+        await asyncio.sleep(0.01)
+        return 0
+
+    monkeypatch.setattr(relay, "drain", drain)
+    return drains
+
+
+async def test_notifications_wake_the_relay(monkeypatch: pytest.MonkeyPatch):
+    channel, stop = FakeChannel(), asyncio.Event()
+    relay = OutboxRelay(
+        lambda: None, never_publish, listen=channel.listen, poll_interval=60  # type: ignore
+    )
+    drains = counting_relay(monkeypatch, relay)
+    running = asyncio.create_task(relay.run(stop))
+    await asyncio.sleep(0.02)
+
+    channel.notify()
+    await asyncio.sleep(0.02)
+    stop.set()
+    await asyncio.wait_for(running, 1)
+
+    assert len(drains) == 2
+    assert channel.callbacks == []
+
+
+async def test_notifications_during_a_drain_are_coalesced(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    channel, stop = FakeChannel(), asyncio.Event()
+    relay = OutboxRelay(
+        lambda: None, never_publish, listen=channel.listen, poll_interval=60  # type: ignore
+    )
+    drains = counting_relay(monkeypatch, relay)
+    running = asyncio.create_task(relay.run(stop))
+    await asyncio.sleep(0)
+
+    for _ in range(100):
+        channel.notify()
+    await asyncio.sleep(0.05)
+    stop.set()
+    await asyncio.wait_for(running, 1)
+
+    assert len(drains) == 2
+
+
+async def test_polls_without_notifications(monkeypatch: pytest.MonkeyPatch):
+    stop = asyncio.Event()
+    relay = OutboxRelay(lambda: None, never_publish, poll_interval=0.01)  # type: ignore
+    drains = counting_relay(monkeypatch, relay)
+    running = asyncio.create_task(relay.run(stop))
+
+    await asyncio.sleep(0.1)
+    stop.set()
+    await asyncio.wait_for(running, 1)
+
+    assert len(drains) >= 3
@@ -0,0 +1,185 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import pytest
+from allocation import bootstrap
+from allocation.adapter.memory import InMemoryUnitOfWork
+from allocation.domain.messages import commands
+from allocation.domain.messages.base import Message
+from allocation.service import exceptions
+from allocation.service.message_bus import MessageBus
+from allocation.service.sharding import (
+    ShardedBus,
+    _KeyedSequencer,
+    _Pending,
+    aggregate_key,
+    shard_of,
+)
+
+from ..random_refs import random_batchref, random_order_id, random_sku
+from .test_handlers import FakeEmailSender
+
+
+@asynccontextmanager
+async def in_memory_bus() -> AsyncIterator[MessageBus]:
+    # Each worker process keeps a store of its own.
+    yield bootstrap.bootstrap(
+        start_orm_mapping=False,
+        uow_class=InMemoryUnitOfWork.with_store(),
+        email_sender=FakeEmailSender(),
+    )
+
+
+@pytest.fixture
+async def sharded_bus():
+    bus = ShardedBus(in_memory_bus, shards=2, poll_interval=0.1)
+    bus.start()
+    yield bus
+    await bus.stop()
+
+
+def record_routes(bus: ShardedBus) -> list[tuple[int, Message]]:
+    routes: list[tuple[int, Message]] = []
+    for shard, inbox in enumerate(bus._inboxes):
+
+        def put(request: Any, shard: int = shard, put: Any = inbox.put):
+            if request is not None:
+                routes.append((shard, request[2]))
+            put(request)
+
+        inbox.put = put  # type: ignore
+    return routes
+
+
+def test_messages_are_keyed_by_sku():
+    allocate = commands.Allocate(order_id="o1", sku="LAMP", qty=1)
+    change = commands.ChangeBatchQuantity(ref="b1", qty=1)
+
+    assert aggregate_key(allocate) == "LAMP"
+    assert aggregate_key(change) is None
+    assert {shard_of("LAMP", 4) for _ in range(10)} == {shard_of("LAMP", 4)}
+
+
+async def test_batches_are_keyed_by_the_sku_they_belong_to():
+    async def sku_of_batchref(ref: str) -> Optional[str]:
+        lookups.append(ref)
+        return {"b2": "TABLE"}.get(ref)
+
+    lookups: list[str] = []
+    bus = ShardedBus(in_memory_bus, shards=2, sku_of_batchref=sku_of_batchref)
+
+    assert (
+        await bus._key_of(commands.CreateBatch(ref="b1", sku="LAMP", qty=1)) == "LAMP"
+    )
+    assert await bus._key_of(commands.ChangeBatchQuantity(ref="b1", qty=1)) == "LAMP"
+    for _ in range(2):
+        assert (
+            await bus._key_of(commands.ChangeBatchQuantity(ref="b2", qty=1)) == "TABLE"
+        )
+    assert await bus._key_of(commands.ChangeBatchQuantity(ref="b3", qty=1)) == "b3"
+    assert lookups == ["b2", "b3"]
+
+
+async def test_work_of_one_key_runs_in_order():
+    sequencer, done = _KeyedSequencer(), []
+
+    async def work(name: str, delay: float):
+        await asyncio.sleep(delay)
+        done.append(name)
+
+    await asyncio.gather(
+        sequencer.run("a", lambda: work("a1", 0.02)),
+        sequencer.run("a", lambda: work("a2", 0)),
+        sequencer.run("b", lambda: work("b1", 0.01)),
+    )
+
+    assert done == ["b1", "a1", "a2"]
+    assert sequencer._tails == {}
+
+
+async def test_messages_of_a_sku_are_handled_by_the_same_worker(
+    sharded_bus: ShardedBus,
+):
+    routes = record_routes(sharded_bus)
+    batchrefs = {random_batchref(str(i)): random_sku(str(i)) for i in range(6)}
+    for ref, sku in batchrefs.items():
+        await sharded_bus.handle(commands.CreateBatch(ref=ref, sku=sku, qty=100))
+
+    # Each worker has a store of its own, a product is only found in the one
+    # its batch was created in.
+    await asyncio.gather(
+        *(
+            sharded_bus.handle(
+                commands.Allocate(order_id=random_order_id(), sku=sku, qty=10)
+            )
+            for sku in batchrefs.values()
+            for _ in range(3)
+        ),
+        *(
+            sharded_bus.handle(commands.ChangeBatchQuantity(ref=ref, qty=50))
+            for ref in batchrefs
+        ),
+    )
+
+    shards_by_sku: dict[str, set[int]] = {}
+    for shard, message in routes:
+        sku = getattr(message, "sku", None) or batchrefs[getattr(message, "ref")]
+        shards_by_sku.setdefault(sku, set()).add(shard)
+    assert shards_by_sku == {sku: {shard_of(sku, 2)} for sku in batchrefs.values()}
+    assert len(routes) == 6 * 5
+
+
+async def test_handler_errors_reach_the_caller(sharded_bus: ShardedBus):
+    with pytest.raises(exceptions.InvalidSku, match="NONEXISTENT"):
+        await sharded_bus.handle(
+            commands.Allocate(order_id="o1", sku="NONEXISTENT", qty=1)
+        )
+
+
+async def test_hooked_task_is_returned_once_the_message_is_handled(
+    sharded_bus: ShardedBus,
+):
+    sku = random_sku()
+    await sharded_bus.handle(commands.CreateBatch(ref="b1", sku=sku, qty=100))
+
+    task = await sharded_bus.handle(
+        commands.Allocate(order_id="o1", sku=sku, qty=10), return_hooked_task=True
+    )
+
+    assert await task == [None]
+
+
+async def test_messages_for_a_dead_worker_fail(sharded_bus: ShardedBus):
+    sku = random_sku()
+    process = sharded_bus._processes[shard_of(sku, 2)]
+    process.kill()
+    await asyncio.get_running_loop().run_in_executor(None, process.join)
+
+    with pytest.raises(RuntimeError, match="Bus worker exited"):
+        await sharded_bus.handle(commands.CreateBatch(ref="b1", sku=sku, qty=1))
+
+
+async def test_pending_messages_of_a_dead_worker_fail_under_traffic(
+    sharded_bus: ShardedBus,
+):
+    # Replies of the live worker keep coming in faster than the poll interval.
+    sku = random_sku()
+    alive, dead = shard_of(sku, 2), 1 - shard_of(sku, 2)
+    await sharded_bus.handle(commands.CreateBatch(ref="b1", sku=sku, qty=10**6))
+    loop = asyncio.get_running_loop()
+    pending = sharded_bus._pending[-1] = _Pending(
+        dead, loop.create_future(), loop.create_future()
+    )
+    sharded_bus._processes[dead].kill()
+
+    async def traffic():
+        while not pending.handled.done():
+            await sharded_bus.handle(
+                commands.Allocate(order_id=random_order_id(), sku=sku, qty=1)
+            )
+
+    await asyncio.wait_for(traffic(), 5)
+    assert sharded_bus._processes[alive].is_alive()
+    with pytest.raises(RuntimeError, match="Bus worker exited"):
+        await pending.handled